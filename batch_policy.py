@@ -0,0 +1,54 @@
+# batch_policy.py
+from typing import Optional
+import config
+
+SIZE = "size"
+BYTES = "bytes"
+MAX_MESSAGES = "max_messages"
+DEADLINE = "deadline"
+FLUSH = "flush"
+
+_FROM_CONFIG = object()
+
+
+class BatchPolicy:
+    # Decides when the batcher emits. Size and byte triggers also wait for
+    # min_sources distinct endpoints; the hard message cap and the age deadline
+    # emit regardless, so a quiet or single-feed period still has bounded latency.
+    def __init__(self, batch_size: int = None, max_age_seconds: Optional[float] = _FROM_CONFIG,
+                 max_bytes: Optional[int] = None, min_sources: int = None,
+                 max_messages: int = None, deadline_min_messages: int = None):
+        self.batch_size = batch_size or config.MESSAGE_BATCH_SIZE
+        # None or 0 turns the deadline off, here and in MESSAGE_BATCH_MAX_AGE_SECONDS alike
+        if max_age_seconds is _FROM_CONFIG:
+            max_age_seconds = config.MESSAGE_BATCH_MAX_AGE_SECONDS
+        self.max_age_seconds = max_age_seconds or None
+        self.max_bytes = max_bytes if max_bytes is not None else config.MESSAGE_BATCH_MAX_BYTES
+        self.min_sources = min_sources or config.MESSAGE_BATCH_MIN_SOURCES
+        self.max_messages = max(self.batch_size, max_messages or config.MESSAGE_BATCH_MAX_MESSAGES)
+        self.deadline_min_messages = deadline_min_messages or config.MESSAGE_BATCH_DEADLINE_MIN_MESSAGES
+
+    def on_message(self, count: int, nbytes: int, sources: int) -> Optional[str]:
+        if count >= self.max_messages:
+            return MAX_MESSAGES
+        if sources < self.min_sources:
+            return None
+        if count >= self.batch_size:
+            return SIZE
+        if self.max_bytes and nbytes >= self.max_bytes:
+            return BYTES
+        return None
+
+    def on_timer(self, count: int, age_seconds: float) -> Optional[str]:
+        if self.max_age_seconds and count >= self.deadline_min_messages and age_seconds >= self.max_age_seconds:
+            return DEADLINE
+        return None
+
+    def get_stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "batch_max_age_seconds": self.max_age_seconds,
+            "batch_max_bytes": self.max_bytes,
+            "batch_min_sources": self.min_sources,
+            "batch_max_messages": self.max_messages,
+        }
@@ -0,0 +1,77 @@
+# benchmarks/bench_hash_backends.py
+# Batch hashes per second for each HASH_BACKEND, on MESSAGE_BATCH_SIZE batches of
+# synthetic frames. Every backend passes its known-answer test before it is timed.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from entropy_processor import encode_peppers
+from hash_backends import BACKENDS, Shake256Backend, create_backend, self_test, timestamp_bytes
+
+
+def make_batches(count: int, size: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        [rng.randbytes(size) for _ in range(config.MESSAGE_BATCH_SIZE)]
+        for _ in range(count)
+    ]
+
+
+def measure(backend, batches) -> dict:
+    timestamp = timestamp_bytes()
+    hash_batch = backend.hash
+    start = time.perf_counter()
+    for batch in batches:
+        hash_batch(batch, timestamp)
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": backend.name,
+        "output_bytes": backend.output_bytes,
+        "hashes_per_second": len(batches) / elapsed,
+        "output_mb_per_second": len(batches) * backend.output_bytes / elapsed / (1024 * 1024),
+        "us_per_hash": elapsed / len(batches) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash backend benchmark")
+    parser.add_argument("--batches", type=int, default=20_000)
+    parser.add_argument("--size", type=int, default=512, help="Message size in bytes")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--shake-bytes", type=int, default=config.HASH_SHAKE256_OUTPUT_BYTES,
+                        help="SHAKE256 output length, a multiple of 64")
+    parser.add_argument("--output", help="Also write the JSON report to this path")
+    args = parser.parse_args()
+
+    self_test()
+    peppers = encode_peppers(config.PEPPER_ROUNDS)
+    batches = make_batches(args.batches, args.size, args.seed)
+    results = []
+    for name in BACKENDS:
+        if name == "shake256":
+            backend = Shake256Backend(peppers, output_bytes=args.shake_bytes)
+        else:
+            backend = create_backend(peppers, name)
+        results.append(measure(backend, batches))
+
+    report = {
+        "benchmark": "hash_backends",
+        "batch_size": config.MESSAGE_BATCH_SIZE,
+        "message_bytes": args.size,
+        "batches": args.batches,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
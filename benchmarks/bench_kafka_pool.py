@@ -0,0 +1,87 @@
+# benchmarks/bench_kafka_pool.py
+# Records/s and ack latency through ProducerPool for each pool size and
+# KAFKA_PARTITION_KEY, against the in-process fake producer. The fake charges a fixed
+# round trip per produce request, so this measures how routing and batching use
+# the producers' I/O threads, not broker throughput.
+import argparse
+import functools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from fake_kafka import FakeKafkaProducer
+from kafka_pool import ROUND_ROBIN, SOURCE_MIX, TIME_BUCKET, ProducerPool
+
+
+def measure(size: int, key_policy: str, records, masks, args) -> dict:
+    factory = functools.partial(FakeKafkaProducer, partitions=args.partitions, ack_seconds=args.ack_ms / 1000)
+    pool = ProducerPool(size=size, key_policy=key_policy, producer_factory=factory)
+    pool.maintain()
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < args.duration:
+        for record, mask in zip(records, masks):
+            pool.send(record, mask)
+        sent += len(records)
+        pool.maintain()
+    pool.flush()
+    elapsed = time.perf_counter() - start
+    stats = pool.get_stats()
+    pool.close()
+    acked = [producer for producer in stats["producers"] if producer["sent"]]
+    return {
+        "pool_size": size,
+        "partition_key": key_policy,
+        "records_per_second": sent / elapsed,
+        "acked": stats["sent"],
+        "partitions_used": len(stats["partitions"]),
+        "ack_mean_ms": sum(p["ack_mean_ms"] * p["sent"] for p in acked) / stats["sent"] if stats["sent"] else None,
+        "linger_ms": [producer["linger_ms"] for producer in stats["producers"]],
+        "batch_size": [producer["batch_size"] for producer in stats["producers"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kafka producer pool benchmark")
+    parser.add_argument("--sizes", default="1,2,4,8", help="Comma-separated pool sizes")
+    parser.add_argument("--keys", default=",".join((ROUND_ROBIN, SOURCE_MIX, TIME_BUCKET)))
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+    parser.add_argument("--record-bytes", type=int, default=128, help="128 is a hex record")
+    parser.add_argument("--sources", type=int, default=8, help="Endpoints mixed into source masks")
+    parser.add_argument("--partitions", type=int, default=12)
+    parser.add_argument("--ack-ms", type=float, default=2.0, help="Simulated produce round trip")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Also write the JSON report to this path")
+    args = parser.parse_args()
+
+    # Tune often enough to settle within a run
+    config.KAFKA_ADAPTIVE_INTERVAL_SECONDS = min(config.KAFKA_ADAPTIVE_INTERVAL_SECONDS, args.duration / 5)
+    rng = random.Random(args.seed)
+    records = [rng.randbytes(args.record_bytes) for _ in range(10_000)]
+    masks = [rng.getrandbits(args.sources) or 1 for _ in records]
+    results = [
+        measure(int(size), key_policy, records, masks, args)
+        for key_policy in args.keys.split(",")
+        for size in args.sizes.split(",")
+    ]
+
+    report = {
+        "benchmark": "kafka_pool",
+        "record_bytes": args.record_bytes,
+        "partitions": args.partitions,
+        "ack_ms": args.ack_ms,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
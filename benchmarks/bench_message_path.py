@@ -0,0 +1,108 @@
+# benchmarks/bench_message_path.py
+# Compares the old str-based message path (decode, re-encode, join, concat) with
+# the bytes-native one, per message: wall time and peak transient allocation.
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from entropy_processor import encode_peppers, process_batch
+from hash_backends import create_backend
+
+
+def legacy_process_batch(batch, pepper_rounds):
+    combined_data = b''.join(batch)
+    seed_value = int(hashlib.sha256(combined_data).hexdigest()[:16], 16)
+    rng = random.Random(seed_value)
+    pepper_order = list(range(len(pepper_rounds)))
+    rng.shuffle(pepper_order)
+    current_hash = hashlib.sha512(combined_data).digest()
+    for round_idx in pepper_order:
+        pepper = pepper_rounds[round_idx].encode('utf-8')
+        current_hash = hashlib.sha512(current_hash + pepper).digest()
+    now = datetime.utcnow()
+    timestamp_string = (
+        f"{now.year}{now.month:02d}{now.day:02d}"
+        f"{now.hour:02d}{now.minute:02d}{now.second:02d}"
+        f"{now.microsecond:06d}"
+    ).encode('utf-8')
+    return hashlib.sha512(current_hash + timestamp_string).hexdigest()
+
+
+def legacy_path(frames):
+    # websockets decoded every text frame to str before it reached us
+    batch = []
+    for frame in frames:
+        message = frame.decode('utf-8')
+        hashlib.sha256(message.encode('utf-8', errors='ignore')).hexdigest()
+        if len(message) > 1024 * 1024:
+            message = message[:1024 * 1024]
+        batch.append(message.encode('utf-8', errors='ignore'))
+        if len(batch) >= config.MESSAGE_BATCH_SIZE:
+            legacy_process_batch(batch, config.PEPPER_ROUNDS)
+            batch = []
+
+
+def bytes_path(frames, backend):
+    batch = []
+    for frame in frames:
+        hashlib.sha256(frame).digest()
+        batch.append(frame)
+        if len(batch) >= config.MESSAGE_BATCH_SIZE:
+            process_batch(batch, backend)
+            batch = []
+
+
+def make_frames(count: int, size: int):
+    rng = random.Random(1234)
+    frames = []
+    for i in range(count):
+        body = {"channel": "ticker", "seq": i, "price": rng.random(), "pad": "x" * max(0, size - 60)}
+        frames.append(json.dumps(body).encode('utf-8'))
+    return frames
+
+
+def measure(name, fn, frames):
+    start = time.perf_counter()
+    fn(frames)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(frames[:config.MESSAGE_BATCH_SIZE * 10])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "path": name,
+        "messages": len(frames),
+        "ns_per_message": elapsed / len(frames) * 1e9,
+        "peak_alloc_bytes": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message path micro-benchmark")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--size", type=int, default=512, help="Approximate frame size in bytes")
+    args = parser.parse_args()
+
+    frames = make_frames(args.messages, args.size)
+    backend = create_backend(encode_peppers(config.PEPPER_ROUNDS))
+
+    results = [
+        measure("legacy_str", legacy_path, frames),
+        measure("bytes_native", lambda f: bytes_path(f, backend), frames),
+    ]
+    print(json.dumps({"benchmark": "message_path", "frame_size": args.size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/bench_startup.py
+# Time to first entropy hash from process start, and event loop overhead once
+# running, for the default and the PERFORMANCE_RUNTIME profile. Each run is a fresh
+# child process against benchmarks/replay_server.py, so imports count.
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from run_e2e import frames_received, percentile, wait_for_port
+
+
+async def measure_loop(seconds: float, interval: float = 0.001) -> dict:
+    # How late a 1 ms timer fires while the pipeline is busy
+    lags = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - started - interval) * 1e6)
+    return {"timer_lag_us_mean": statistics.fmean(lags), "timer_lag_us_p99": percentile(lags, 99)}
+
+
+async def child_run(args, imported: dict) -> dict:
+    import psutil
+    import main as entropy_main
+    from runtime import loop_name
+
+    process = psutil.Process()
+    started = time.perf_counter()
+    system = entropy_main.EntropySystem()
+    construct_ms = (time.perf_counter() - started) * 1000
+    start_task = asyncio.create_task(system.start())
+
+    deadline = time.monotonic() + args.timeout
+    while system.first_hash_seconds is None and time.monotonic() < deadline:
+        await asyncio.sleep(0.001)
+    first_hash = system.first_hash_seconds
+    while not system.sink_ready and time.monotonic() < deadline:
+        await asyncio.sleep(0.001)
+    sink_ready_seconds = time.time() - process.create_time()
+
+    await asyncio.sleep(args.warmup)
+    frames_start = frames_received(system)
+    cpu_start = time.process_time()
+    loop = await measure_loop(args.duration)
+    cpu = time.process_time() - cpu_start
+    frames = frames_received(system) - frames_start
+
+    await system.stop()
+    start_task.cancel()
+    return {
+        **imported,
+        "event_loop": loop_name(),
+        "construct_ms": construct_ms,
+        "first_hash_seconds": first_hash,
+        "sink_ready_seconds": sink_ready_seconds,
+        "frames_per_second": frames / args.duration,
+        "cpu_us_per_frame": cpu / frames * 1e6 if frames else None,
+        **loop,
+    }
+
+
+def child(args):
+    started = time.perf_counter()
+    import config
+    config.WEBSOCKET_ENDPOINTS = [
+        f"ws://127.0.0.1:{args.port}/{feed.split(':')[0]}?rate={feed.split(':')[1]}"
+        for feed in args.feeds.split(",")
+    ]
+    config.BLITZORTUNG_ENDPOINTS = []
+    config.OUTPUT_SINK = args.sink
+    from fake_kafka import FakeKafkaProducer
+    config.KAFKA_PRODUCER_FACTORY = functools.partial(FakeKafkaProducer, partitions=12, ack_seconds=0.002)
+    config.KAFKA_SPOOL_DIRECTORY = os.path.join(args.workdir, "kafka_spool")
+    config.OUTPUT_FORMAT = "raw"
+    config.DEDUPLICATION_SNAPSHOT_PATH = None
+    config.DEDUPLICATION_BUFFER_MAX_SIZE_GB = 0.05
+    config.STATS_LOG_INTERVAL_SECONDS = 10 ** 6
+    config.METRICS_PORT = 0
+    config.LOG_LEVEL = "WARNING"
+    config.LOG_FILE = os.path.join(args.workdir, "bench_startup.log")
+    import main as entropy_main
+    import_ms = (time.perf_counter() - started) * 1000
+    entropy_main.setup_logging()
+
+    from runtime import run
+    print(json.dumps(run(child_run(args, {"import_ms": import_ms}))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup and loop overhead benchmark")
+    parser.add_argument("--profiles", default="default,performance")
+    parser.add_argument("--sink", default="kafka", choices=("kafka", "null"), help="kafka uses the fake producer")
+    parser.add_argument("--feeds", default="kraken:2000,certstream:300,blitzortung:50")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds of loop measurement per run")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--workdir", default="/tmp/entropygen-bench")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Also write the JSON report to this path")
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "replay_server.py"), "--port", str(args.port)])
+    results = []
+    try:
+        wait_for_port(args.port)
+        for profile in args.profiles.split(","):
+            env = dict(os.environ, PERFORMANCE_RUNTIME="1" if profile == "performance" else "0")
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child"] + [
+                        f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items()
+                        if name not in ("child", "output", "profiles", "runs") and value is not None
+                    ],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            summary = {"profile": profile, "event_loop": runs[0]["event_loop"], "runs": len(runs)}
+            for key in runs[0]:
+                values = [run[key] for run in runs if isinstance(run[key], (int, float))]
+                if values and key != "event_loop":
+                    summary[key] = statistics.median(values)
+            results.append(summary)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {"benchmark": "startup", "sink": args.sink, "feeds": args.feeds, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# benchmarks/fake_kafka.py
+# In-process stand-in for kafka-python's KafkaProducer, for benchmarks and tests:
+# pass it as a ProducerPool producer_factory or set config.KAFKA_PRODUCER_FACTORY.
+# It takes the same config, batches records per partition honouring linger_ms and
+# batch_size, and acks whole batches from its own I/O thread after a simulated
+# round trip, so the delivery path, pool routing and linger tuning can be exercised
+# without a broker.
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional
+from kafka.errors import KafkaError, KafkaTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRecordMetadata(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+
+
+class FakeFuture:
+    __slots__ = ("_callbacks", "_errbacks")
+
+    def __init__(self):
+        self._callbacks = []
+        self._errbacks = []
+
+    def add_callback(self, fn: Callable, *args):
+        self._callbacks.append((fn, args))
+        return self
+
+    def add_errback(self, fn: Callable, *args):
+        self._errbacks.append((fn, args))
+        return self
+
+    def success(self, metadata: FakeRecordMetadata):
+        for fn, args in self._callbacks:
+            fn(*args, metadata)
+
+    def failure(self, exc: Exception):
+        for fn, args in self._errbacks:
+            fn(*args, exc)
+
+
+class FakeKafkaProducer:
+    def __init__(self, partitions: int = 12, ack_seconds: float = 0.002, failure_rate: float = 0.0,
+                 retain: bool = False, **configs):
+        self.partition_count = partitions
+        self.ack_seconds = ack_seconds
+        self.failure_rate = failure_rate
+        self.value_serializer: Optional[Callable] = configs.get("value_serializer")
+        self.buffer_memory = configs.get("buffer_memory", 32 * 1024 * 1024)
+        self.max_block_ms = configs.get("max_block_ms", 60000)
+        self.linger_ms = configs.get("linger_ms", 0)
+        self.batch_size = configs.get("batch_size", 16384)
+        # partition -> [created, bytes, [(value, future)]]
+        self._batches: Dict[int, list] = {}
+        self._buffered = 0
+        self._offsets: Dict[int, itertools.count] = defaultdict(itertools.count)
+        self._round_robin = itertools.count()
+        self._flushing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.records: Dict[int, List[bytes]] = defaultdict(list) if retain else None
+        self.topic = None
+        self.batch_count = 0
+        self.record_count = 0
+        self._thread = threading.Thread(target=self._run, name="fake-kafka-io", daemon=True)
+        self._thread.start()
+
+    def partitions_for(self, topic: str) -> set:
+        return set(range(self.partition_count))
+
+    def send(self, topic: str, value=None, key=None, headers=None, partition=None, timestamp_ms=None) -> FakeFuture:
+        if self._closed:
+            raise KafkaError("Producer closed")
+        if self.value_serializer and value is not None:
+            value = self.value_serializer(value)
+        self.topic = topic
+        if partition is None:
+            partition = next(self._round_robin) % self.partition_count
+        future = FakeFuture()
+        deadline = time.monotonic() + self.max_block_ms / 1000
+        with self._cond:
+            while self._buffered + len(value) > self.buffer_memory:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise KafkaTimeoutError("Failed to allocate memory within the configured max blocking time")
+                self._cond.wait(remaining)
+            batch = self._batches.get(partition)
+            created = batch is None
+            if created:
+                batch = self._batches[partition] = [time.monotonic(), 0, []]
+            batch[1] += len(value)
+            batch[2].append((value, future))
+            self._buffered += len(value)
+            # The I/O thread re-arms its linger timer on a new batch and ships a full one
+            if created or batch[1] >= self.batch_size:
+                self._cond.notify_all()
+        return future
+
+    def _ready(self, now: float) -> List[int]:
+        linger = self.linger_ms / 1000
+        return [
+            partition for partition, (created, size, _) in self._batches.items()
+            if self._flushing or self._closed or size >= self.batch_size or now - created >= linger
+        ]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    ready = self._ready(now)
+                    if ready or (self._closed and not self._batches):
+                        break
+                    oldest = min((batch[0] for batch in self._batches.values()), default=None)
+                    linger = self.linger_ms / 1000
+                    self._cond.wait(None if oldest is None else max(0.0005, oldest + linger - now))
+                if not ready:
+                    return
+                batches = [(partition, self._batches.pop(partition)) for partition in ready]
+
+            # One round trip covers every ready batch, like a single produce request per broker
+            if self.ack_seconds:
+                time.sleep(self.ack_seconds)
+            for partition, (_, size, records) in batches:
+                self._complete(partition, records)
+                with self._cond:
+                    self._buffered = max(0, self._buffered - size)
+                    self._cond.notify_all()
+
+    def _complete(self, partition: int, records: list):
+        self.batch_count += 1
+        if self.failure_rate and random.random() < self.failure_rate:
+            error = KafkaError("Simulated broker failure")
+            for _, future in records:
+                future.failure(error)
+            return
+        offsets = self._offsets[partition]
+        for value, future in records:
+            if self.records is not None:
+                self.records[partition].append(value)
+            self.record_count += 1
+            future.success(FakeRecordMetadata(self.topic, partition, next(offsets)))
+
+    def flush(self, timeout: Optional[float] = None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._buffered:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise KafkaTimeoutError("Timeout waiting for flush")
+                    self._cond.wait(remaining)
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: Optional[float] = None):
+        with self._cond:
+            if timeout == 0:
+                # Like the real producer, a zero timeout aborts what is still buffered
+                aborted = [record for batch in self._batches.values() for record in batch[2]]
+                self._batches.clear()
+                self._buffered = 0
+            else:
+                aborted = []
+            self._closed = True
+            self._cond.notify_all()
+        for _, future in aborted:
+            future.failure(KafkaError("Producer is closed forcefully."))
+        self._thread.join(timeout)
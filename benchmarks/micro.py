@@ -0,0 +1,133 @@
+# benchmarks/micro.py
+# Per-component micro-benchmarks. Prints one JSON document; --output also writes it
+# to a file so runs can be diffed for regressions.
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from deduplication_buffer import DeduplicationBuffer
+from drbg import DrbgExpander
+from entropy_processor import EntropyProcessor
+
+
+def timed(name: str, ops: int, fn, **extra) -> dict:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    result = {"name": name, "ops": ops, "ns_per_op": elapsed / ops * 1e9, "ops_per_second": ops / elapsed}
+    result.update(extra)
+    return result
+
+
+def make_messages(count: int, size: int, seed: int):
+    rng = random.Random(seed)
+    return [rng.randbytes(size) for _ in range(count)]
+
+
+def bench_dedup(backend: str, ops: int, duplicate_ratio: float, seed: int) -> dict:
+    config.DEDUPLICATION_BACKEND = backend
+    config.DEDUPLICATION_SNAPSHOT_PATH = None
+    rng = random.Random(seed)
+    unique = [hashlib.sha256(rng.randbytes(16)).digest() for _ in range(ops)]
+    digests = [unique[rng.randrange(i + 1)] if rng.random() < duplicate_ratio else unique[i] for i in range(ops)]
+
+    buffer = DeduplicationBuffer(max_size_gb=0.25)
+
+    def run():
+        add = buffer.add
+        for digest in digests:
+            add(digest)
+
+    result = timed(f"dedup_add_{backend}", ops, run, duplicate_ratio=duplicate_ratio)
+    stats = buffer.get_stats()
+    result.update({"entries": stats["entries"], "bytes_per_entry": stats["bytes_per_entry"]})
+    buffer.close()
+    return result
+
+
+def bench_add_message(ops: int, size: int, seed: int) -> dict:
+    messages = make_messages(ops, size, seed)
+    processor = EntropyProcessor()
+
+    def run():
+        add_message = processor.add_message
+        for message in messages:
+            add_message(message)
+
+    return timed("entropy_add_message", ops, run, message_bytes=size)
+
+
+def bench_process_batch(ops: int, size: int, seed: int) -> dict:
+    batch = make_messages(config.MESSAGE_BATCH_SIZE, size, seed)
+    processor = EntropyProcessor()
+
+    def run():
+        process = processor._process_batch
+        for _ in range(ops):
+            process(batch)
+
+    return timed("entropy_process_batch", ops, run, batch_size=len(batch), message_bytes=size)
+
+
+def bench_output_path(ops: int, size: int, seed: int, bytes_per_seed: int) -> dict:
+    # Output bytes per second from batch hashing alone versus hashing plus DRBG expansion
+    batch = make_messages(config.MESSAGE_BATCH_SIZE, size, seed)
+    processor = EntropyProcessor()
+    expander = DrbgExpander(bytes_per_seed=bytes_per_seed) if bytes_per_seed else None
+
+    def run():
+        process = processor._process_batch
+        for _ in range(ops):
+            digest = bytes.fromhex(process(batch))
+            if expander:
+                expander.expand_many([digest], [0])
+
+    name = f"output_expanded_{bytes_per_seed}" if bytes_per_seed else "output_digest_only"
+    result = timed(name, ops, run, bytes_per_seed=bytes_per_seed or 64)
+    result["output_bytes_per_second"] = result["ops_per_second"] * (bytes_per_seed or 64)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Component micro-benchmarks")
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--size", type=int, default=512, help="Message size in bytes")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--expansion-bytes", type=int, default=6400, help="DRBG bytes per seed for the output path benchmark")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    results = [
+        bench_dedup("table", args.ops, args.duplicate_ratio, args.seed),
+        bench_dedup("bloom", args.ops, args.duplicate_ratio, args.seed),
+        bench_add_message(args.ops, args.size, args.seed),
+        bench_process_batch(args.ops // config.MESSAGE_BATCH_SIZE, args.size, args.seed),
+        bench_output_path(args.ops // config.MESSAGE_BATCH_SIZE, args.size, args.seed, 0),
+        bench_output_path(args.ops // config.MESSAGE_BATCH_SIZE, args.size, args.seed, args.expansion_bytes),
+    ]
+    report = {
+        "benchmark": "micro",
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
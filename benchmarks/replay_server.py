@@ -0,0 +1,155 @@
+# benchmarks/replay_server.py
+# Local websocket stand-in for the upstream feeds. Each path serves one frame
+# mix at the rate given in the query string, e.g. ws://127.0.0.1:8765/kraken?rate=5000
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+TICK_SECONDS = 0.01
+KRAKEN_SYMBOLS = [f"{base}/{quote}" for base in ("BTC", "ETH", "SOL", "XRP", "ADA", "DOT", "LTC", "DOGE")
+                  for quote in ("USD", "EUR", "USDT")]
+
+
+def _stamp() -> str:
+    # Fixed-width leading field so the harness can read the send time without parsing JSON
+    return f'{{"ts":{time.time_ns():019d},'
+
+
+def kraken_frame(rng: random.Random) -> str:
+    price = rng.uniform(0.05, 70000)
+    return _stamp() + json.dumps({
+        "channel": "ticker",
+        "type": "update",
+        "data": [{
+            "symbol": rng.choice(KRAKEN_SYMBOLS),
+            "bid": round(price * 0.9999, 5),
+            "bid_qty": round(rng.uniform(0, 50), 8),
+            "ask": round(price * 1.0001, 5),
+            "ask_qty": round(rng.uniform(0, 50), 8),
+            "last": round(price, 5),
+            "volume": round(rng.uniform(0, 1e6), 8),
+            "vwap": round(price * rng.uniform(0.99, 1.01), 5),
+            "change_pct": round(rng.uniform(-10, 10), 2),
+        }],
+    })[1:]
+
+
+def blitzortung_frame(rng: random.Random) -> str:
+    return _stamp() + json.dumps({
+        "time": time.time_ns(),
+        "lat": round(rng.uniform(-60, 70), 6),
+        "lon": round(rng.uniform(-180, 180), 6),
+        "alt": 0,
+        "pol": rng.choice((-1, 1)),
+        "mds": rng.randint(5000, 15000),
+        "mcg": rng.randint(100, 250),
+        "status": 0,
+        "region": rng.randint(1, 7),
+        "sig": [{"sta": rng.randint(1, 3000), "time": rng.randint(0, 99999), "lat": round(rng.uniform(-60, 70), 4),
+                 "lon": round(rng.uniform(-180, 180), 4), "alt": rng.randint(0, 2000), "status": 0}
+                for _ in range(rng.randint(5, 20))],
+    })[1:]
+
+
+def certstream_frame(rng: random.Random) -> str:
+    def domain():
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 14))) + rng.choice(
+            (".com", ".net", ".org", ".io", ".dev"))
+
+    return _stamp() + json.dumps({
+        "message_type": "certificate_update",
+        "data": {
+            "update_type": "X509LogEntry",
+            "leaf_cert": {
+                "all_domains": [domain() for _ in range(rng.randint(1, 12))],
+                "fingerprint": ":".join(f"{rng.getrandbits(8):02X}" for _ in range(20)),
+                "not_before": int(time.time()) - rng.randint(0, 86400),
+                "not_after": int(time.time()) + rng.randint(86400, 86400 * 90),
+                "serial_number": f"{rng.getrandbits(128):032X}",
+                "signature_algorithm": "sha256, rsa",
+            },
+            "cert_index": rng.randint(0, 10 ** 9),
+            "seen": time.time(),
+            "source": {"name": "Google 'Argon2025' log", "url": "ct.googleapis.com/logs/argon2025/"},
+        },
+    })[1:]
+
+
+def snapshot_frames(rng: random.Random, count: int = 200):
+    # A reconnect replays the same book snapshots over and over
+    frames = []
+    for i in range(count):
+        frames.append(json.dumps({
+            "channel": "book",
+            "type": "snapshot",
+            "data": [{
+                "symbol": KRAKEN_SYMBOLS[i % len(KRAKEN_SYMBOLS)],
+                "bids": [[round(rng.uniform(1, 70000), 2), round(rng.uniform(0, 5), 8)] for _ in range(10)],
+                "asks": [[round(rng.uniform(1, 70000), 2), round(rng.uniform(0, 5), 8)] for _ in range(10)],
+            }],
+        }))
+    return frames
+
+
+def frame_source(mix: str, rng: random.Random):
+    if mix == "kraken":
+        return lambda: kraken_frame(rng)
+    if mix == "blitzortung":
+        return lambda: blitzortung_frame(rng)
+    if mix == "certstream":
+        return lambda: certstream_frame(rng)
+    if mix == "snapshots":
+        frames = snapshot_frames(rng)
+        return lambda: rng.choice(frames)
+    raise ValueError(f"Unknown mix: {mix}")
+
+
+async def serve_feed(websocket, seed: int):
+    request = getattr(websocket, "request", None)
+    url = urlparse(request.path if request is not None else websocket.path)
+    mix = url.path.strip("/")
+    params = parse_qs(url.query)
+    rate = float(params.get("rate", ["1000"])[0])
+    duration = float(params.get("duration", ["0"])[0])
+
+    rng = random.Random(f"{seed}:{mix}")
+    next_frame = frame_source(mix, rng)
+    per_tick = rate * TICK_SECONDS
+    owed = 0.0
+    start = time.monotonic()
+
+    try:
+        while not duration or time.monotonic() - start < duration:
+            tick_start = time.monotonic()
+            owed += per_tick
+            while owed >= 1:
+                await websocket.send(next_frame())
+                owed -= 1
+            await asyncio.sleep(max(0.0, TICK_SECONDS - (time.monotonic() - tick_start)))
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic upstream feeds over websockets")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    async with websockets.serve(lambda ws, *_: serve_feed(ws, args.seed), args.host, args.port,
+                                max_size=None, compression=None):
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+# benchmarks/run_e2e.py
+# Runs the full EntropySystem against benchmarks/replay_server.py with the null
+# sink and reports throughput, frame-to-sink latency, CPU and memory as JSON.
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import config
+
+DEFAULT_FEEDS = "kraken:5000,blitzortung:50,certstream:300,snapshots:1000"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Replay server did not come up on port {port}")
+
+
+def frame_sent_ns(message: bytes):
+    # replay_server puts a fixed-width {"ts":<19 digits>, prefix on every unique frame
+    if message[:6] == b'{"ts":':
+        return int(message[6:25])
+    return None
+
+
+class LatencyProbe:
+    # Remembers the send times of the frames in each batch and matches them to
+    # records as the sink receives them (one record per batch in hex/raw format).
+    def __init__(self, system):
+        self.first_frame_ms = []
+        self.last_frame_ms = []
+        self._pending_batch = []
+        self._batches = deque()
+
+        collect = system.entropy_processor.collect
+        send_many = system.sink.send_many
+
+        def timed_collect(message, *args, **kwargs):
+            sent = frame_sent_ns(message)
+            if sent is not None:
+                self._pending_batch.append(sent)
+            collected = collect(message, *args, **kwargs)
+            if collected is not None:
+                self._batches.append(self._pending_batch)
+                self._pending_batch = []
+            return collected
+
+        async def timed_send_many(records, sources=None):
+            now = time.time_ns()
+            for _ in records:
+                if not self._batches:
+                    break
+                stamps = self._batches.popleft()
+                if stamps:
+                    self.first_frame_ms.append((now - min(stamps)) / 1e6)
+                    self.last_frame_ms.append((now - max(stamps)) / 1e6)
+            return await send_many(records, sources)
+
+        system.entropy_processor.collect = timed_collect
+        system.sink.send_many = timed_send_many
+
+
+def frames_received(system) -> int:
+    stats = system.websocket_manager.get_pipeline_stats()["queues"]
+    return sum(queue["enqueued"] + queue["dropped"] for queue in stats.values())
+
+
+async def run(args) -> dict:
+    config.WEBSOCKET_ENDPOINTS = [
+        f"ws://127.0.0.1:{args.port}/{feed.split(':')[0]}?rate={feed.split(':')[1]}"
+        for feed in args.feeds.split(",")
+    ]
+    config.BLITZORTUNG_ENDPOINTS = []
+    config.OUTPUT_SINK = "null"
+    config.OUTPUT_FORMAT = "raw"
+    config.DEDUPLICATION_SNAPSHOT_PATH = None
+    config.DEDUPLICATION_BUFFER_MAX_SIZE_GB = args.dedup_gb
+    config.HASHING_EXECUTOR = args.hashing
+    config.STATS_LOG_INTERVAL_SECONDS = 10 ** 6
+    config.METRICS_PORT = 0
+    config.LOG_LEVEL = "WARNING"
+
+    import psutil
+    import main as entropy_main
+    entropy_main.setup_logging()
+
+    process = psutil.Process()
+    system = entropy_main.EntropySystem()
+    probe = LatencyProbe(system)
+
+    start_task = asyncio.create_task(system.start())
+    await asyncio.sleep(args.warmup)
+
+    rss_start = process.memory_info().rss
+    frames_start = frames_received(system)
+    messages_start = system.message_count
+    digests_start = system.sink.send_count
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    probe.first_frame_ms.clear()
+    probe.last_frame_ms.clear()
+
+    await asyncio.sleep(args.duration)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    frames = frames_received(system) - frames_start
+    messages = system.message_count - messages_start
+    digests = system.sink.send_count - digests_start
+    rss_end = process.memory_info().rss
+    dedup_stats = system.dedup_buffer.get_stats()
+    pipeline_stats = system.websocket_manager.get_pipeline_stats()
+
+    await system.stop()
+    start_task.cancel()
+
+    return {
+        "benchmark": "e2e",
+        "feeds": args.feeds,
+        "hashing": args.hashing,
+        "duration_seconds": wall,
+        "frames_per_second": frames / wall,
+        "messages_per_second": messages / wall,
+        "digests_per_second": digests / wall,
+        "duplicate_ratio": 1 - (messages / frames) if frames else 0,
+        "latency_first_frame_ms": {"p50": percentile(probe.first_frame_ms, 50),
+                                   "p99": percentile(probe.first_frame_ms, 99)},
+        "latency_last_frame_ms": {"p50": percentile(probe.last_frame_ms, 50),
+                                  "p99": percentile(probe.last_frame_ms, 99)},
+        "cpu_us_per_frame": cpu / frames * 1e6 if frames else None,
+        "cpu_utilisation": cpu / wall,
+        "rss_start_mb": rss_start / (1024 * 1024),
+        "rss_growth_mb": (rss_end - rss_start) / (1024 * 1024),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "dedup_entries": dedup_stats["entries"],
+        "dedup_bytes_per_entry": dedup_stats["bytes_per_entry"],
+        "queue_dropped": sum(queue["dropped"] for queue in pipeline_stats["queues"].values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end EntropySystem benchmark")
+    parser.add_argument("--feeds", default=DEFAULT_FEEDS, help="Comma-separated mix:rate list")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dedup-gb", type=float, default=0.25)
+    parser.add_argument("--hashing", default=config.HASHING_EXECUTOR, choices=("inline", "thread", "process"))
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "replay_server.py"),
+                               "--port", str(args.port), "--seed", str(args.seed)])
+    try:
+        wait_for_port(args.port)
+        result = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# bloom_filter.py
+import logging
+import math
+import struct
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_INDEX_WORDS = struct.Struct('<QQQ')
+
+
+class _BloomGeneration:
+    __slots__ = ("bits", "count", "created_at", "sampled")
+
+    def __init__(self, nbytes: int):
+        self.bits = bytearray(nbytes)
+        self.count = 0
+        self.created_at = time.monotonic()
+        self.sampled = set()
+
+
+class RotatingBloomFilter:
+    # N Bloom filter generations, newest first. Inserts go to the newest generation;
+    # lookups check all of them. Retiring the oldest generation drops one object,
+    # so expiry never walks individual entries.
+    def __init__(self, generations: int, generation_entries: int, false_positive_rate: float,
+                 generation_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+                 fp_sample_rate: int = 256):
+        if generations < 1:
+            raise ValueError("generations must be >= 1")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+
+        self.generations = generations
+        self.false_positive_rate = false_positive_rate
+        self.generation_seconds = generation_seconds
+        self.fp_sample_rate = max(1, fp_sample_rate)
+
+        # Lookups hit every generation, so split the FP budget between them
+        generation_fp = 1 - (1 - false_positive_rate) ** (1 / generations)
+        bits_per_entry = -math.log(generation_fp) / (math.log(2) ** 2)
+
+        if max_bytes is not None:
+            budget_entries = int(max_bytes * 8 // (generations * bits_per_entry))
+            if budget_entries < generation_entries:
+                logger.warning("Bloom generation size capped by memory budget", extra={
+                    "configured_entries": generation_entries,
+                    "generation_entries": budget_entries,
+                })
+                generation_entries = budget_entries
+        if generation_entries < 1:
+            raise ValueError("Bloom memory budget too small for a single entry")
+
+        self.generation_entries = generation_entries
+        self.max_entries = generations * generation_entries
+        self.num_bits = max(8, int(math.ceil(generation_entries * bits_per_entry)))
+        self.num_hashes = max(1, int(round(self.num_bits / generation_entries * math.log(2))))
+        self.generation_bytes = (self.num_bits + 7) // 8
+        self.nbytes = self.generation_bytes * generations
+
+        self._generations = deque([_BloomGeneration(self.generation_bytes)], maxlen=generations)
+        self.count = 0
+        self.eviction_count = 0
+        self.rotation_count = 0
+        self.sampled_negatives = 0
+        self.sampled_false_positives = 0
+
+    def _indexes(self, digest):
+        h1, h2, sample = _INDEX_WORDS.unpack_from(digest, 0)
+        h2 |= 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)], sample % self.fp_sample_rate == 0
+
+    @staticmethod
+    def _test(bits: bytearray, indexes) -> bool:
+        for idx in indexes:
+            if not bits[idx >> 3] & (1 << (idx & 7)):
+                return False
+        return True
+
+    @staticmethod
+    def _set(bits: bytearray, indexes):
+        for idx in indexes:
+            bits[idx >> 3] |= 1 << (idx & 7)
+
+    def _maybe_rotate(self):
+        current = self._generations[0]
+        if current.count >= self.generation_entries:
+            self._rotate()
+        elif self.generation_seconds and time.monotonic() - current.created_at >= self.generation_seconds:
+            self._rotate()
+
+    def _rotate(self):
+        if len(self._generations) == self.generations:
+            retired = self._generations[-1]
+            self.count -= retired.count
+            self.eviction_count += retired.count
+        self._generations.appendleft(_BloomGeneration(self.generation_bytes))
+        self.rotation_count += 1
+        logger.debug("Bloom generation rotated", extra={"rotations": self.rotation_count})
+
+    def add(self, digest) -> bool:
+        self._maybe_rotate()
+        indexes, sampled = self._indexes(digest)
+        current = self._generations[0]
+
+        hit = None
+        for generation in self._generations:
+            if self._test(generation.bits, indexes):
+                hit = generation
+                break
+
+        if sampled:
+            key = bytes(digest[:16])
+            truly_seen = any(key in generation.sampled for generation in self._generations)
+            if not truly_seen:
+                self.sampled_negatives += 1
+                if hit is not None:
+                    self.sampled_false_positives += 1
+            if hit is not current:
+                current.sampled.add(key)
+
+        if hit is current:
+            return False
+
+        # Re-seen entries are carried into the newest generation so they stay deduped
+        self._set(current.bits, indexes)
+        current.count += 1
+        self.count += 1
+        return hit is None
+
+    def contains(self, digest) -> bool:
+        indexes, _ = self._indexes(digest)
+        return any(self._test(generation.bits, indexes) for generation in self._generations)
+
+    def set_generations(self, generations: int):
+        # Lowering retires the oldest generations straight away, raising just lets more accumulate
+        generations = max(1, generations)
+        current = list(self._generations)
+        for retired in current[generations:]:
+            self.count -= retired.count
+            self.eviction_count += retired.count
+        self._generations = deque(current[:generations], maxlen=generations)
+        self.generations = generations
+        self.max_entries = generations * self.generation_entries
+        self.nbytes = self.generation_bytes * generations
+
+    def clear(self):
+        self._generations.clear()
+        self._generations.appendleft(_BloomGeneration(self.generation_bytes))
+        self.count = 0
+
+    def estimated_false_positive_rate(self) -> float:
+        miss = 1.0
+        for generation in self._generations:
+            fill = 1 - math.exp(-self.num_hashes * generation.count / self.num_bits)
+            miss *= 1 - fill ** self.num_hashes
+        return 1 - miss
+
+    def get_stats(self) -> dict:
+        return {
+            "generations": len(self._generations),
+            "rotations": self.rotation_count,
+            "hash_functions": self.num_hashes,
+            "bits_per_entry": (self.num_bits * len(self._generations)) / self.count if self.count else 0,
+            "target_fp_rate": self.false_positive_rate,
+            "estimated_fp_rate": self.estimated_false_positive_rate(),
+            "measured_fp_rate": (self.sampled_false_positives / self.sampled_negatives)
+                                if self.sampled_negatives else 0,
+            "fp_samples": self.sampled_negatives,
+        }
@@ -23,6 +23,22 @@ BLITZORTUNG_ENDPOINTS = [
 
 BLITZORTUNG_INIT_MESSAGE = '{"a": 111}'
 
+FRAME_FILTERS_ENABLED = True
+FRAME_FILTER_RULES = [ # Checked in order before fingerprinting; "endpoints" are URL substrings, empty matches all
+    {"name": "coinbase_heartbeat", "endpoints": ["coinbase.com"], "prefix": b'{"channel":"heartbeats"'},
+    {"name": "coinbase_subscriptions", "endpoints": ["coinbase.com"], "prefix": b'{"channel":"subscriptions"'},
+    {"name": "kraken_heartbeat", "endpoints": ["kraken.com"], "pattern": rb'^\{"(?:channel|event)":"heartbeat"'},
+    {"name": "kraken_ack", "endpoints": ["kraken.com"],
+     "pattern": rb'^\{(?:"method":"(?:subscribe|pong)"|"channel":"status"|.{0,64}"event":"(?:systemStatus|subscriptionStatus|pong)")'},
+    {"name": "okx_ack", "endpoints": ["okx.com"], "pattern": rb'^(?:pong$|\{"event":"(?:subscribe|channel-conn-count)")'},
+    {"name": "bybit_ack", "endpoints": ["bybit.com"], "prefix": b'{"success":', "pattern": rb'"op":"(?:subscribe|ping|pong)"'},
+    {"name": "blockchain_pong", "endpoints": ["blockchain.info"], "prefix": b'{"op":"pong"'},
+    {"name": "certstream_heartbeat", "endpoints": ["certstream"], "pattern": rb'^\{"message_type": ?"heartbeat"'},
+    # Normalizer example, strips Coinbase envelope timestamps so repeated updates dedup:
+    # {"name": "coinbase_envelope", "endpoints": ["coinbase.com"], "action": "strip",
+    #  "strip": rb'"timestamp":"[^"]*","sequence_num":\d+,'},
+]
+
 PEPPER_ROUNDS = [
     "PEPPER_ROUND_A", # Just make these jargon
     "PEPPER_ROUND_B",
@@ -38,13 +54,60 @@ PEPPER_ROUNDS = [
 
 MESSAGE_BATCH_SIZE = 10 # Leave
 
+HASH_BACKEND = "pepper_rounds" # "pepper_rounds" (original 13-pass chain), "blake2b_keyed", "sha3_512" or "shake256"
+HASH_SHAKE256_OUTPUT_BYTES = 64 # Multiple of 64, output beyond 64 bytes is emitted as extra 64-byte units
+MESSAGE_BATCH_MAX_AGE_SECONDS = None # Deadline: a batch this old is emitted below size, None or 0 (the default) disables
+MESSAGE_BATCH_DEADLINE_MIN_MESSAGES = 1 # Fewest messages the deadline will emit, smaller batches keep waiting
+MESSAGE_BATCH_MAX_BYTES = None # Emit once the batch holds this many message bytes, None disables
+MESSAGE_BATCH_MIN_SOURCES = 1 # Size and byte triggers wait for this many distinct endpoints in the batch
+MESSAGE_BATCH_MAX_MESSAGES = 1000 # Hard cap, emitted even below MESSAGE_BATCH_MIN_SOURCES
+
 ###
 DEDUPLICATION_BUFFER_MAX_SIZE_GB = 2    # Ajust these 2 based on compute
 DEDUPLICATION_MAX_ENTRIES = 50_000_000  # Ajust these 2 based on compute
 ###
+DEDUPLICATION_BACKEND = "table" # "table" (exact, FIFO eviction) or "bloom" (rotating Bloom filter generations)
+DEDUPLICATION_DIGEST_BYTES = 8 # 8 or 16, truncated SHA-256 bytes kept per entry
+DEDUPLICATION_TABLE_LOAD_FACTOR = 0.75 # ~19 bytes/entry at 8-byte digests
+DEDUPLICATION_SNAPSHOT_PATH = os.getenv("DEDUPLICATION_SNAPSHOT_PATH") # Table backend only, unset keeps it in anonymous memory
+DEDUPLICATION_SNAPSHOT_INTERVAL_SECONDS = 30
+DEDUPLICATION_LOCK_TIMEOUT_SECONDS = 0.2 # Shared table only: longest a worker's event loop waits for the dedup lock, a batch that times out is dropped unverified
+
+BLOOM_GENERATIONS = 4
+BLOOM_GENERATION_ENTRIES = 25_000_000
+BLOOM_GENERATION_SECONDS = 3600 # Rotate on whichever comes first, None for entry count only
+BLOOM_FALSE_POSITIVE_RATE = 0.001
+BLOOM_FP_SAMPLE_RATE = 256 # 1 in N fingerprints tracked exactly to measure the FP rate
 
-MESSAGE_QUEUE_MAX_SIZE = 100_000_000
-MESSAGE_PROCESSING_BATCH = 1000
+HASHING_EXECUTOR = "thread" # "inline", "thread" or "process"
+HASHING_WORKERS = None # None uses os.cpu_count()
+HASHING_JOB_MAX_ITEMS = 256
+HASHING_MAX_INFLIGHT_JOBS = 64
+
+MESSAGE_QUEUE_MAX_BYTES = 32 * 1024 * 1024 # Per endpoint, counts frame payload bytes
+MESSAGE_QUEUE_DROP_POLICY = "drop_oldest" # "drop_oldest", "drop_newest" or "block" (pauses that socket)
+MESSAGE_CONSUMER_TASKS = 4
+MESSAGE_PROCESSING_BATCH = 1000 # Max frames a consumer drains from one endpoint at a time
+SCHEDULER_POLICY = "drr" # "drr" (deficit round-robin by bytes and weight) or "fifo" (endpoints served in arrival order)
+SCHEDULER_QUANTUM_BYTES = 256 * 1024 # Bytes credited per round-robin visit, times the endpoint weight
+SCHEDULER_WEIGHTS = {"blitzortung": 4, "seismicportal": 4} # URL substring -> weight, unmatched endpoints get 1
+SCHEDULER_RATE_LIMITS = {} # URL substring -> frames/s cap (token bucket, 1s burst), excess is shed on receipt
+SCHEDULER_OVERLOAD_BYTES = 128 * 1024 * 1024 # Total queued bytes past which the largest backlog per weight is shed, None disables
+
+OUTPUT_SINK = os.getenv("OUTPUT_SINK", "kafka") # "kafka", "file", "unix", "memory" or "null"
+OUTPUT_FORMAT = "hex" # "hex" (128-char string per record), "raw" (64-byte digest) or "packed" (N digests + header)
+OUTPUT_PACK_RECORD_BYTES = 4096 # Packed record size target, keep at or below KAFKA_BATCH_SIZE
+OUTPUT_PACK_MAX_DELAY_SECONDS = 1.0
+OUTPUT_EXPANSION_BYTES_PER_SEED = 0 # Each batch digest reseeds an HMAC-DRBG that emits this many bytes instead, 0 disables
+OUTPUT_EXPANSION_BLOCK_BYTES = 65536 # Bytes per DRBG generate request, at most 65536
+OUTPUT_EXPANSION_RESEED_INTERVAL = 1024 # Generate requests allowed per seed
+OUTPUT_EXPANSION_MAX_BYTES_PER_SEED = 1024 * 1024 # Upper bound on OUTPUT_EXPANSION_BYTES_PER_SEED
+SINK_FILE_DIRECTORY = os.getenv("SINK_FILE_DIRECTORY", "entropy_segments")
+SINK_FILE_PREFIX = "entropy-"
+SINK_FILE_SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+SINK_FILE_BUFFER_BYTES = 1024 * 1024
+SINK_UNIX_SOCKET_PATH = os.getenv("SINK_UNIX_SOCKET_PATH", "/tmp/entropygen.sock")
+SINK_MEMORY_MAX_RECORDS = 100_000
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS")
 KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "EntropyGen-RAWHashes_Topic1")
@@ -58,17 +121,115 @@ KAFKA_LINGER_MS = 0 # Drop to 0 or push to 100 based on workload
 KAFKA_COMPRESSION_TYPE = "snappy" # Use snappy if CPU is suboptimal
 KAFKA_MAX_IN_FLIGHT_REQUESTS = 1000
 KAFKA_BUFFER_MEMORY = 67108864
-KAFKA_MAX_BLOCK_MS = 10000
+KAFKA_MAX_BLOCK_MS = 10000 # Only ever blocks the delivery thread, never the event loop
+KAFKA_PRODUCER_FACTORY = None # Callable taking KafkaProducer's keyword arguments, None uses kafka-python (the benchmarks plug in benchmarks/fake_kafka.py)
+KAFKA_PRODUCER_POOL_SIZE = 4 # KafkaProducers, each with its own I/O thread and every Nth partition of the topic
+KAFKA_PARTITION_KEY = "round_robin" # "round_robin" (sticky per batch, unkeyed), "source_mix" or "time_bucket"
+KAFKA_PARTITION_TIME_BUCKET_SECONDS = 1 # Bucket width for "time_bucket" keys
+KAFKA_PARTITION_REFRESH_SECONDS = 60 # Re-read the topic's partitions, picks up added partitions
+KAFKA_ADAPTIVE_LINGER = True # Tune linger_ms and batch_size from the measured send rate, recreating producers to apply them
+KAFKA_ADAPTIVE_INTERVAL_SECONDS = 5
+KAFKA_LINGER_MAX_MS = 20 # Never linger longer than this, it is added to output latency
+KAFKA_BATCH_SIZE_MAX = 262144 # Keep below the broker's message.max.bytes
+
+KAFKA_HANDOFF_MAX_RECORDS = 100_000
+KAFKA_SPOOL_DIRECTORY = os.getenv("KAFKA_SPOOL_DIRECTORY", "kafka_spool")
+KAFKA_SPOOL_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+KAFKA_SPOOL_RETRY_SECONDS = 5
+KAFKA_SPOOL_REPLAY_BATCH = 1000
+KAFKA_SHUTDOWN_FLUSH_SECONDS = 2
+
+CAPTURE_DIRECTORY = os.getenv("CAPTURE_DIRECTORY") # Unset disables raw frame capture
+CAPTURE_PREFIX = "frames-"
+CAPTURE_SEGMENT_MAX_BYTES = 256 * 1024 * 1024 # Compressed bytes per segment file
+CAPTURE_BLOCK_BYTES = 1024 * 1024 # Uncompressed frames per compressed block
+CAPTURE_FLUSH_SECONDS = 1.0 # Max age of a partial block before it is written
+CAPTURE_QUEUE_MAX_FRAMES = 100_000 # Frames beyond this are counted as dropped rather than blocking the reader
+CAPTURE_COMPRESSION_LEVEL = 1
 
-RECONNECT_DELAY_SECONDS = 5
+WEBSOCKET_RAW_FRAMES = True # Receive text frames as bytes without decoding when websockets supports it
+WEBSOCKET_OPTIONS = { # websockets.connect settings by URL substring, the first match is merged over ""
+    "": {
+        "compression": "deflate", # permessage-deflate, None turns it off
+        "max_size": 10 * 1024 * 1024,
+        "max_queue": 32, # Frames buffered by websockets before it stops reading the socket
+        "write_limit": 32768,
+        "ping_interval": 20,
+        "ping_timeout": 10,
+        "close_timeout": 10,
+        "recv_buffer_bytes": None, # SO_RCVBUF after connect, None keeps the kernel default
+    },
+    # "certstream": {"max_queue": 256, "recv_buffer_bytes": 4 * 1024 * 1024},
+}
+
+PERFORMANCE_RUNTIME = os.getenv("PERFORMANCE_RUNTIME", "0") == "1" # Opt-in fast-startup profile, sets the two defaults below
+EVENT_LOOP = os.getenv("EVENT_LOOP", "uvloop" if PERFORMANCE_RUNTIME else "asyncio") # "uvloop" falls back to asyncio when not installed
+SINK_START_CONCURRENT = PERFORMANCE_RUNTIME # Start the sink alongside the socket connects, records wait in memory until it is up
+SINK_START_BUFFER_RECORDS = 100_000 # Records held while the sink starts, any more count as failed
+SINK_START_SHUTDOWN_SECONDS = 10 # Longest shutdown waits for a sink that is still starting, its held records are lost after that
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1")) # >1 runs a supervisor sharding WEBSOCKET_ENDPOINTS across processes
+WORKER_HEARTBEAT_SECONDS = 2
+WORKER_HEARTBEAT_TIMEOUT_SECONDS = 20 # A worker silent this long, startup included, is killed and restarted
+WORKER_RESTART_BACKOFF_SECONDS = 1 # Doubles per consecutive failure
+WORKER_RESTART_BACKOFF_MAX_SECONDS = 60
+WORKER_SHUTDOWN_TIMEOUT_SECONDS = 15
+
+RECONNECT_DELAY_SECONDS = 5 # Backoff base, doubled per consecutive failure; the actual wait is uniform in [0, backoff]
+RECONNECT_MAX_DELAY_SECONDS = 300
+RECONNECT_STABLE_SECONDS = 60 # A connection up this long resets the failure count when it drops
+RECONNECT_FAILOVER_GROUPS = [BLITZORTUNG_ENDPOINTS] # Equivalent endpoints; each failed attempt moves on to the next member
+CONNECT_STAGGER_SECONDS = 0.5 # Minimum gap between connection attempts across all endpoints
+ENDPOINT_SILENT_SECONDS = {"seismicportal": None, "blockchain.info/blocks": None, "": 300} # URL substring -> seconds without a frame before reconnecting, None never
+ENDPOINT_HEALTH_CHECK_SECONDS = 5
+ENDPOINT_DEMOTE_FAILURES = 5 # Consecutive failures before an endpoint is demoted
+ENDPOINT_DEMOTE_SECONDS = 600 # Demoted endpoints make no attempts for this long
 MAX_RECONNECT_ATTEMPTS = None
 
-MEMORY_CHECK_INTERVAL_SECONDS = 60
-MEMORY_THRESHOLD_PERCENT = 85
+MEMORY_CHECK_INTERVAL_SECONDS = 5
+MEMORY_LIMIT_BYTES = int(os.getenv("MEMORY_LIMIT_BYTES", "0")) # 0 reads the cgroup v2/v1 limit, falling back to host RAM
+MEMORY_THRESHOLD_PERCENT = 85 # Of the limit, counting the cgroup working set (usage minus inactive file cache)
 MEMORY_CRITICAL_PERCENT = 95
+MEMORY_RECOVERY_SECONDS = 60 # Below the threshold this long before the newest relief step is lifted
+MEMORY_QUEUE_SHRINK_FACTOR = 0.25 # Relief: per-endpoint queue bound scaled by this
+MEMORY_DEDUP_SHRINK_FACTOR = 0.5 # Relief: Bloom dedup generations scaled by this; the table backend keeps its size
+MEMORY_SHED_ENDPOINTS = [] # Relief: endpoint URLs disconnected at critical, lowest priority first
+
+GC_FREEZE_AFTER_STARTUP = True # Move startup objects to the permanent generation so collections skip them
+GC_THRESHOLDS = (50_000, 20, 50) # gc.set_threshold arguments, None keeps the interpreter defaults
+
+PROFILE_DIRECTORY = os.getenv("PROFILE_DIRECTORY", "profiles") # Stack samples, tracemalloc snapshots and loop-lag reports
+PROFILE_CONTROL_SOCKET = os.getenv("PROFILE_CONTROL_SOCKET") # UNIX socket taking profiler commands, unset disables (signals still work)
+PROFILE_SAMPLE_HZ = 100 # Stack samples per second while sampling is on
+PROFILE_TRACEMALLOC_FRAMES = 1 # Frames kept per allocation, more costs memory and CPU while tracing
+PROFILE_TOP_ENTRIES = 30
+LOOP_LAG_CHECK_SECONDS = 0.1 # Event loop heartbeat, None disables the lag monitor
+LOOP_LAG_THRESHOLD_SECONDS = 0.25 # A stall this long records the loop thread's stack
+LOOP_LAG_MAX_EVENTS = 100
+
+STATS_LOG_INTERVAL_SECONDS = 60
+
+ENTROPY_SERVER_HOST = os.getenv("ENTROPY_SERVER_HOST", "127.0.0.1")
+ENTROPY_SERVER_PORT = int(os.getenv("ENTROPY_SERVER_PORT", "0")) # GET /bytes?n= over HTTP, 0 disables
+ENTROPY_SERVER_UNIX_PATH = os.getenv("ENTROPY_SERVER_UNIX_PATH") # Same API on a UNIX socket, unset disables
+ENTROPY_SERVER_REUSE_PORT = False # SO_REUSEPORT, set for workers so they share one port
+ENTROPY_SERVER_MAX_REQUEST_BYTES = 1024 * 1024
+ENTROPY_SERVER_IDLE_SECONDS = 60 # Idle keep-alive connections are closed after this
+ENTROPY_POOL_BYTES = 16 * 1024 * 1024
+ENTROPY_POOL_EMPTY_POLICY = "block" # "block" (wait up to the timeout), "error" (503) or "drbg" (HMAC-DRBG the pool reseeds)
+ENTROPY_POOL_BLOCK_TIMEOUT_SECONDS = 5
+ENTROPY_POOL_DRBG_MAX_BYTES_PER_SEED = 1024 * 1024 # DRBG output allowed before the pool must reseed it
+ENTROPY_POOL_EXCLUSIVE = True # Digests taken into the pool are not also sent to the sink
+ENTROPY_POOL_RATE_WINDOW_SECONDS = 10
 
-STATS_LOG_INTERVAL_MESSAGES = 1000
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # Prometheus text format on /metrics, 0 disables
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "entropy_system.log") # Workers write <name>.w<index><ext>
 LOG_MAX_BYTES = 100 * 1024 * 1024
 LOG_BACKUP_COUNT = 5
+LOG_ASYNC = True # Format and write log records on a background thread
+LOG_QUEUE_MAX_RECORDS = 100_000 # Records beyond this are dropped (and counted) instead of blocking
+LOG_RATE_LIMIT_SECONDS = 10 # Repeats of a warning/error within this window are suppressed and counted, 0 disables
+LOG_SUMMARY_INTERVAL_SECONDS = 10 # Emitted hashes are logged as one summary line per interval
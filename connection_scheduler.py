@@ -0,0 +1,190 @@
+# connection_scheduler.py
+import asyncio
+import logging
+import random
+import time
+from typing import Collection, Dict, List, Optional
+import config
+
+logger = logging.getLogger(__name__)
+
+_clock = time.perf_counter # Same clock as the receive loop's frame timestamps
+
+
+def _lookup(table: Dict[str, Optional[float]], url: str):
+    # Keys are URL substrings, first match wins; "" matches everything
+    return next((value for key, value in table.items() if key in url), None)
+
+
+class EndpointHealth:
+    __slots__ = ("url", "members", "attempts", "connects", "errors", "failures", "reconnects",
+                 "connected_at", "connected_to", "down_since", "uptime", "downtime", "frames", "last_frame_at",
+                 "first_frame_seconds", "silenced", "demoted_until", "silent_seconds")
+
+    def __init__(self, url: str, members: List[str]):
+        self.url = url
+        self.members = members
+        self.attempts = 0
+        self.connects = 0
+        self.errors = 0
+        self.failures = 0 # Consecutive
+        self.reconnects = 0
+        self.connected_at: Optional[float] = None
+        self.connected_to: Optional[str] = None # The group member the live connection went to
+        self.down_since: Optional[float] = _clock()
+        self.uptime = 0.0
+        self.downtime = 0.0
+        self.frames = 0
+        self.last_frame_at: Optional[float] = None
+        self.first_frame_seconds: Optional[float] = None
+        self.silenced = False
+        self.demoted_until = 0.0
+        self.silent_seconds = _lookup(config.ENDPOINT_SILENT_SECONDS, url)
+
+    def target(self, busy: Collection[str] = ()) -> str:
+        # Equivalent endpoints are tried round-robin, one step per consecutive failure,
+        # skipping members another endpoint is already connected to
+        index = self.members.index(self.url)
+        for step in range(len(self.members)):
+            member = self.members[(index + self.failures + step) % len(self.members)]
+            if member not in busy:
+                return member
+        return self.url
+
+    def on_frame(self, now: float):
+        if self.last_frame_at is None and self.connected_at is not None:
+            self.first_frame_seconds = now - self.connected_at
+        self.frames += 1
+        self.last_frame_at = now
+
+    def is_silent(self, now: float) -> bool:
+        if self.connected_at is None or not self.silent_seconds:
+            return False
+        return now - (self.last_frame_at or self.connected_at) > self.silent_seconds
+
+    def total_uptime(self, now: float) -> float:
+        return self.uptime + (now - self.connected_at if self.connected_at is not None else 0.0)
+
+    def total_downtime(self, now: float) -> float:
+        return self.downtime + (now - self.down_since if self.down_since is not None else 0.0)
+
+    def score(self, now: float) -> float:
+        # Share of time connected times share of attempts without error, 0 while demoted
+        if now < self.demoted_until:
+            return 0.0
+        up, down = self.total_uptime(now), self.total_downtime(now)
+        availability = up / (up + down) if up + down else 0.0
+        return availability * (1 - self.errors / self.attempts if self.attempts else 1.0)
+
+    def get_stats(self, now: float) -> dict:
+        up = self.total_uptime(now)
+        return {
+            "score": round(self.score(now), 3),
+            "connected": self.connected_at is not None,
+            "connected_to": self.connected_to,
+            "target": self.target(),
+            "attempts": self.attempts,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "uptime_seconds": round(up, 1),
+            "downtime_seconds": round(self.total_downtime(now), 1),
+            "frames_per_second": round(self.frames / up, 2) if up else 0.0,
+            "first_frame_seconds": self.first_frame_seconds,
+            "demoted": now < self.demoted_until,
+        }
+
+
+class ConnectionScheduler:
+    # Paces connection attempts across all endpoints: every connect, initial or
+    # recovery, waits for a slot CONNECT_STAGGER_SECONDS after the previous one, and
+    # retries back off exponentially with full jitter, so a network blip does not
+    # turn into a synchronized reconnect storm and a burst of snapshot replays.
+    def __init__(self):
+        self.health: Dict[str, EndpointHealth] = {}
+        self.groups = [list(group) for group in config.RECONNECT_FAILOVER_GROUPS]
+        self._next_slot = 0.0
+
+    def register(self, url: str) -> EndpointHealth:
+        if url not in self.health:
+            members = next((group for group in self.groups if url in group), [url])
+            self.health[url] = EndpointHealth(url, members)
+        return self.health[url]
+
+    def remove(self, url: str):
+        self.health.pop(url, None)
+
+    async def wait_turn(self, health: EndpointHealth):
+        now = _clock()
+        if health.demoted_until:
+            if now < health.demoted_until:
+                await asyncio.sleep(health.demoted_until - now)
+                now = _clock()
+            # Back from demotion with a clean count, or the next failure would demote it again
+            health.demoted_until = 0.0
+            health.failures = 0
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + config.CONNECT_STAGGER_SECONDS
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        health.attempts += 1
+        if health.connects:
+            health.reconnects += 1
+
+    def target(self, health: EndpointHealth) -> str:
+        busy = {other.connected_to for other in self.health.values()
+                if other is not health and other.connected_at is not None}
+        return health.target(busy)
+
+    def on_connect(self, health: EndpointHealth, target: Optional[str] = None):
+        now = _clock()
+        health.connects += 1
+        health.connected_at = now
+        health.connected_to = target or health.url
+        health.last_frame_at = None
+        health.first_frame_seconds = None
+        health.silenced = False
+        if health.down_since is not None:
+            health.downtime += now - health.down_since
+            health.down_since = None
+
+    def on_disconnect(self, health: EndpointHealth, error: bool = False):
+        # Errors, silent closes and connections that never became stable count as failures
+        now = _clock()
+        stable = False
+        if health.connected_at is not None:
+            stable = now - health.connected_at >= config.RECONNECT_STABLE_SECONDS and not health.silenced
+            health.uptime += now - health.connected_at
+            health.connected_at = None
+            health.connected_to = None
+        if health.down_since is None:
+            health.down_since = now
+        if error:
+            health.errors += 1
+
+        if stable and not error:
+            health.failures = 0
+            return
+        health.failures += 1
+        if health.failures >= config.ENDPOINT_DEMOTE_FAILURES and now >= health.demoted_until:
+            health.demoted_until = now + config.ENDPOINT_DEMOTE_SECONDS
+            logger.warning("Endpoint demoted", extra={
+                "url": health.url, "failures": health.failures, "seconds": config.ENDPOINT_DEMOTE_SECONDS,
+            })
+
+    def backoff(self, health: EndpointHealth) -> float:
+        if not health.failures:
+            return random.uniform(0, config.RECONNECT_DELAY_SECONDS)
+        ceiling = min(config.RECONNECT_MAX_DELAY_SECONDS, config.RECONNECT_DELAY_SECONDS * 2 ** (health.failures - 1))
+        return random.uniform(0, ceiling)
+
+    def silent(self) -> List[str]:
+        now = _clock()
+        urls = [url for url, health in self.health.items() if not health.silenced and health.is_silent(now)]
+        for url in urls:
+            self.health[url].silenced = True
+        return urls
+
+    def get_stats(self) -> dict:
+        now = _clock()
+        return {url: health.get_stats(now) for url, health in self.health.items()}
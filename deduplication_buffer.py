@@ -1,49 +1,531 @@
 # deduplication_buffer.py
+import fcntl
 import logging
-from collections import OrderedDict
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+from bloom_filter import RotatingBloomFilter
 import config
 
 logger = logging.getLogger(__name__)
 
-class DeduplicationBuffer:
-    def __init__(self, max_size_gb: int = 10):
-        self.max_entries = config.DEDUPLICATION_MAX_ENTRIES
-        self.buffer: OrderedDict[str, None] = OrderedDict()
+_WORD = struct.Struct('<Q')
+_DOUBLE_WORD = struct.Struct('<QQ')
+_ZERO_CHUNK = bytes(1024 * 1024)
+
+_MAGIC = b'EGDEDUP\0'
+_VERSION = 1
+_HEADER_SIZE = 4096
+_STATIC_HEADER = struct.Struct('<8sIIQQ')
+_TRAILER = struct.Struct('<II16s')
+_META_WORD = 8
+_META = struct.Struct('<QQ')
+_HOLDER_WORD = 10
+_STATE_OPEN = 1
+_STATE_CLEAN = 2
+
+
+def _boot_id() -> bytes:
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return bytes.fromhex(f.read().strip().replace('-', ''))
+    except (OSError, ValueError):
+        return bytes(16)
+
+
+class CompactDigestTable:
+    # Open-addressing (linear probing) table of truncated binary digests plus a FIFO
+    # ring of the same keys in insertion order. Both live in one preallocated mapping,
+    # so inserts and evictions never allocate per-entry Python objects. With a path the
+    # mapping is a file, and a later process maps the same table straight back in. With
+    # shared set it is a multiprocessing.shared_memory block: True creates one, a name
+    # attaches to an existing one. Callers sharing a table must serialize add() and
+    # record themselves in holder while they do.
+    def __init__(self, max_entries: int, digest_bytes: int = 8, max_bytes: Optional[int] = None,
+                 load_factor: float = 0.75, path: Optional[str] = None, shared=None):
+        if digest_bytes not in (8, 16):
+            raise ValueError("digest_bytes must be 8 or 16")
+        if not 0.1 <= load_factor <= 0.9:
+            raise ValueError("load_factor must be between 0.1 and 0.9")
+
+        self.digest_bytes = digest_bytes
+        self.words = digest_bytes // 8
+        self.load_factor = load_factor
+
+        entry_bytes = digest_bytes / load_factor + digest_bytes
+        if max_bytes is not None:
+            max_entries = min(max_entries, int((max_bytes - _HEADER_SIZE) // entry_bytes))
+        if max_entries < 1:
+            raise ValueError("Deduplication memory budget too small for a single entry")
+
+        self.max_entries = max_entries
+        self.capacity = int(max_entries / load_factor) + 1
+        self.nbytes = _HEADER_SIZE + (self.capacity + self.max_entries) * digest_bytes
+
+        self.path = path
+        self.restored = False
+        self.repaired = False
         self.eviction_count = 0
-        self.duplicate_count = 0
+        self.last_checkpoint: Optional[float] = None
+        self._file = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self.shared_name: Optional[str] = None
+        self.shared_owner = shared is True
 
-    def add(self, message_hash: str) -> bool:
-        if message_hash in self.buffer:
-            self.duplicate_count += 1
-            self.buffer.move_to_end(message_hash)
+        if path and shared:
+            raise ValueError("A dedup table is either file-backed or shared, not both")
+        if shared:
+            self._map_shared(shared)
+        elif path:
+            self._map_file(path)
+        else:
+            self._storage = mmap.mmap(-1, self.nbytes)
+            self._write_header(_STATE_OPEN)
+
+        self._words = memoryview(self._storage).cast('Q')
+        table_start = _HEADER_SIZE // 8
+        table_end = table_start + self.capacity * self.words
+        self._meta = self._words[_META_WORD:_META_WORD + 2]
+        self._holder = self._words[_HOLDER_WORD:_HOLDER_WORD + 1]
+        self._table = self._words[table_start:table_end]
+        self._ring = self._words[table_end:]
+        if self.repaired:
+            self.rebuild_index()
+            logger.info("Dedup snapshot index rebuilt", extra={"path": self.path, "entries": self.count})
+
+    def _static_header(self) -> bytes:
+        return _STATIC_HEADER.pack(_MAGIC, _VERSION, self.digest_bytes, self.capacity, self.max_entries)
+
+    def _write_header(self, state: int):
+        static = self._static_header()
+        self._storage[:len(static)] = static
+        _TRAILER.pack_into(self._storage, len(static), zlib.crc32(static), state, _boot_id())
+
+    def _header_usable(self, header: bytes) -> bool:
+        static = self._static_header()
+        if header[:len(static)] != static:
+            logger.warning("Dedup snapshot header mismatch, starting empty", extra={"path": self.path})
+            return False
+
+        crc, state, boot_id = _TRAILER.unpack_from(header, len(static))
+        head, count = _META.unpack_from(header, _META_WORD * 8)
+        if crc != zlib.crc32(static) or head >= self.max_entries or count > self.max_entries:
+            logger.warning("Dedup snapshot header corrupt, starting empty", extra={"path": self.path})
+            return False
+        if state == _STATE_CLEAN:
+            return True
+        # Dirty but same boot: the process died, the page cache still holds every write.
+        # It may have died mid-add though, with a probe chain half shifted or a 16-byte
+        # slot half written, so the index is rebuilt from the ring before use
+        if state == _STATE_OPEN and boot_id == _boot_id() and boot_id != bytes(16):
+            self.repaired = True
+            return True
+
+        logger.warning("Dedup snapshot not cleanly closed, starting empty", extra={"path": self.path})
+        return False
+
+    def _map_file(self, path: str):
+        self._file = open(path, 'a+b')
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            raise RuntimeError(f"Dedup snapshot {path} is in use by another process")
+
+        existing_size = os.fstat(self._file.fileno()).st_size
+        if existing_size == self.nbytes:
+            self._file.seek(0)
+            self.restored = self._header_usable(self._file.read(_HEADER_SIZE))
+        elif existing_size:
+            logger.warning("Dedup snapshot size mismatch, starting empty", extra={
+                "path": path, "size": existing_size, "expected": self.nbytes,
+            })
+
+        if not self.restored:
+            # Truncating first leaves a sparse, all-zero file instead of rewriting it
+            self._file.truncate(0)
+            self._file.truncate(self.nbytes)
+
+        self._storage = mmap.mmap(self._file.fileno(), self.nbytes)
+        self._write_header(_STATE_OPEN)
+        os.fsync(self._file.fileno())
+
+        logger.info("Dedup snapshot mapped", extra={"path": path, "restored": self.restored})
+
+    def _map_shared(self, shared):
+        if shared is True:
+            # Fresh shared memory is zero-filled, which is an empty table
+            self._shm = shared_memory.SharedMemory(create=True, size=self.nbytes)
+            self._storage = self._shm.buf[:self.nbytes]
+            self._write_header(_STATE_OPEN)
+        else:
+            self._shm = shared_memory.SharedMemory(name=shared)
+            if self._shm.size < self.nbytes:
+                self._shm.close()
+                raise RuntimeError(f"Shared dedup table {shared} is smaller than this geometry needs")
+            self._storage = self._shm.buf[:self.nbytes]
+            static = self._static_header()
+            if bytes(self._storage[:len(static)]) != static:
+                self._storage.release()
+                self._shm.close()
+                raise RuntimeError(f"Shared dedup table {shared} has a different geometry")
+        self.shared_name = self._shm.name
+
+    @property
+    def count(self) -> int:
+        return self._meta[1]
+
+    @property
+    def holder(self) -> int:
+        # Pid of the process inside a shared add, 0 when none
+        return self._holder[0]
+
+    @holder.setter
+    def holder(self, pid: int):
+        self._holder[0] = pid
+
+    def _key(self, digest) -> Tuple[int, int]:
+        if self.words == 1:
+            k0, = _WORD.unpack_from(digest, 0)
+            k1 = 0
+        else:
+            k0, k1 = _DOUBLE_WORD.unpack_from(digest, 0)
+        # Word 0 doubles as the empty-slot marker
+        return (k0 or 1), k1
+
+    def _lookup(self, k0: int, k1: int) -> Tuple[bool, int]:
+        table = self._table
+        cap = self.capacity
+        i = k0 % cap
+
+        if self.words == 1:
+            while True:
+                v = table[i]
+                if v == 0:
+                    return False, i
+                if v == k0:
+                    return True, i
+                i += 1
+                if i == cap:
+                    i = 0
+
+        while True:
+            v = table[2 * i]
+            if v == 0:
+                return False, i
+            if v == k0 and table[2 * i + 1] == k1:
+                return True, i
+            i += 1
+            if i == cap:
+                i = 0
+
+    def _delete(self, k0: int, k1: int):
+        found, i = self._lookup(k0, k1)
+        if not found:
+            return
+
+        table = self._table
+        cap = self.capacity
+        w = self.words
+        j = i
+        # Backward-shift deletion keeps probe chains intact without tombstones
+        while True:
+            j += 1
+            if j == cap:
+                j = 0
+            v = table[j * w]
+            if v == 0:
+                break
+            home = v % cap
+            if i <= j:
+                if i < home <= j:
+                    continue
+            elif i < home or home <= j:
+                continue
+            table[i * w] = v
+            if w == 2:
+                table[2 * i + 1] = table[2 * j + 1]
+            i = j
+
+        table[i * w] = 0
+        if w == 2:
+            table[2 * i + 1] = 0
+
+    def _evict_oldest(self):
+        meta = self._meta
+        tail = (meta[0] - meta[1]) % self.max_entries
+        w = self.words
+        k0 = self._ring[tail * w]
+        k1 = self._ring[tail * w + 1] if w == 2 else 0
+        self._delete(k0, k1)
+        meta[1] -= 1
+        self.eviction_count += 1
+
+    def add(self, digest) -> bool:
+        return self._add_key(*self._key(digest))
+
+    def _add_key(self, k0: int, k1: int) -> bool:
+        found, slot = self._lookup(k0, k1)
+        if found:
             return False
-        
-        if len(self.buffer) >= self.max_entries:
-            evicted_count = max(1, self.max_entries // 10)
-            for _ in range(evicted_count):
-                if self.buffer:
-                    self.buffer.popitem(last=False)
-                    self.eviction_count += 1
-        
-        self.buffer[message_hash] = None
+
+        meta = self._meta
+        if meta[1] >= self.max_entries:
+            self._evict_oldest()
+            found, slot = self._lookup(k0, k1)
+
+        w = self.words
+        table = self._table
+        ring = self._ring
+        head = meta[0]
+
+        table[slot * w] = k0
+        ring[head * w] = k0
+        if w == 2:
+            table[2 * slot + 1] = k1
+            ring[2 * head + 1] = k1
+
+        head += 1
+        # Head and count live in the mapping so a restored ring lines up with its table
+        meta[0] = 0 if head == self.max_entries else head
+        meta[1] += 1
         return True
 
-    def contains(self, message_hash: str) -> bool:
-        return message_hash in self.buffer
+    def contains(self, digest) -> bool:
+        return self._lookup(*self._key(digest))[0]
+
+    def rebuild_index(self):
+        # Re-derives the hash index from the insertion ring. A writer killed mid-add can
+        # leave a probe chain half shifted; the ring and its count are still the truth
+        storage = self._storage
+        end_offset = _HEADER_SIZE + self.capacity * self.digest_bytes
+        for offset in range(_HEADER_SIZE, end_offset, len(_ZERO_CHUNK)):
+            end = min(offset + len(_ZERO_CHUNK), end_offset)
+            storage[offset:end] = _ZERO_CHUNK[:end - offset]
+
+        table = self._table
+        ring = self._ring
+        w = self.words
+        head, count = self._meta[0], self._meta[1]
+        for back in range(count, 0, -1):
+            i = (head - back) % self.max_entries
+            k0 = ring[i * w]
+            k1 = ring[i * w + 1] if w == 2 else 0
+            found, slot = self._lookup(k0, k1)
+            if not found:
+                table[slot * w] = k0
+                if w == 2:
+                    table[2 * slot + 1] = k1
+
+    def clear(self):
+        storage = self._storage
+        for offset in range(_HEADER_SIZE, self.nbytes, len(_ZERO_CHUNK)):
+            end = min(offset + len(_ZERO_CHUNK), self.nbytes)
+            storage[offset:end] = _ZERO_CHUNK[:end - offset]
+        self._meta[0] = 0
+        self._meta[1] = 0
+
+    def checkpoint(self):
+        # fsync writes back only the dirty pages and releases the GIL, run it off the loop
+        if self._file:
+            os.fsync(self._file.fileno())
+            self.last_checkpoint = time.time()
+
+    def close(self):
+        if self._storage is None:
+            return
+        if self._file:
+            os.fsync(self._file.fileno())
+            self._write_header(_STATE_CLEAN)
+            os.fsync(self._file.fileno())
+
+        for view in (self._meta, self._holder, self._table, self._ring, self._words):
+            view.release()
+        if self._shm:
+            self._storage.release()
+            self._shm.close()
+            if self.shared_owner:
+                self._shm.unlink()
+            self._shm = None
+        else:
+            self._storage.close()
+        self._storage = None
+
+        if self._file:
+            self._file.close()
+            self._file = None
+            logger.info("Dedup snapshot closed", extra={"path": self.path})
 
     def get_stats(self) -> dict:
-        entry_count = len(self.buffer)
-        estimated_bytes = entry_count * 100
-        
         return {
+            "digest_bytes": self.digest_bytes,
+            "load_factor": self.load_factor,
+            "snapshot_path": self.path,
+            "snapshot_restored": self.restored,
+            "snapshot_repaired": self.repaired,
+            "shared_name": self.shared_name,
+            "last_checkpoint": self.last_checkpoint,
+        }
+
+
+class DeduplicationBuffer:
+    # shared/lock attach to a table created by the supervisor (see supervisor.py)
+    def __init__(self, max_size_gb: float = config.DEDUPLICATION_BUFFER_MAX_SIZE_GB,
+                 shared: Optional[str] = None, lock=None):
+        self.max_bytes = int(max_size_gb * 1024 * 1024 * 1024)
+        self.backend = config.DEDUPLICATION_BACKEND
+        self._lock = lock
+        self._lock_stalled = False
+        self.lock_timeout_count = 0
+
+        if shared and self.backend != "table":
+            raise ValueError("A shared dedup store needs the table backend")
+
+        if self.backend == "bloom":
+            self.store = RotatingBloomFilter(
+                config.BLOOM_GENERATIONS,
+                config.BLOOM_GENERATION_ENTRIES,
+                config.BLOOM_FALSE_POSITIVE_RATE,
+                generation_seconds=config.BLOOM_GENERATION_SECONDS,
+                max_bytes=self.max_bytes,
+                fp_sample_rate=config.BLOOM_FP_SAMPLE_RATE,
+            )
+        elif self.backend == "table":
+            self.store = CompactDigestTable(
+                config.DEDUPLICATION_MAX_ENTRIES,
+                digest_bytes=config.DEDUPLICATION_DIGEST_BYTES,
+                max_bytes=self.max_bytes,
+                load_factor=config.DEDUPLICATION_TABLE_LOAD_FACTOR,
+                path=None if shared else config.DEDUPLICATION_SNAPSHOT_PATH,
+                shared=shared,
+            )
+        else:
+            raise ValueError(f"Unknown deduplication backend: {self.backend}")
+
+        self.max_entries = self.store.max_entries
+        self.configured_max_entries = self.max_entries
+        self.duplicate_count = 0
+
+        if self.backend != "table" and config.DEDUPLICATION_SNAPSHOT_PATH:
+            logger.warning("Dedup snapshots need the table backend, ignoring path",
+                           extra={"backend": self.backend})
+        if shared and config.DEDUPLICATION_SNAPSHOT_PATH:
+            logger.warning("Dedup snapshots are not taken of a shared table, ignoring path",
+                           extra={"shared_name": shared})
+
+        if self.backend == "table" and self.max_entries < config.DEDUPLICATION_MAX_ENTRIES:
+            logger.warning("Dedup entries capped by memory budget", extra={
+                "configured_entries": config.DEDUPLICATION_MAX_ENTRIES,
+                "max_entries": self.max_entries,
+                "max_size_gb": max_size_gb,
+            })
+
+    def _acquire(self) -> bool:
+        # The shared lock is taken on the event loop thread, so never wait on it
+        # unbounded: a worker killed while holding it leaves it locked until the
+        # supervisor repairs the table. After one timeout, only try without waiting
+        # until it comes back, so the loop isn't stalled once per batch meanwhile.
+        if self._lock is None:
+            return True
+        if self._lock_stalled:
+            acquired = self._lock.acquire(False)
+        else:
+            acquired = self._lock.acquire(timeout=config.DEDUPLICATION_LOCK_TIMEOUT_SECONDS)
+        if not acquired:
+            self.lock_timeout_count += 1
+            if not self._lock_stalled:
+                self._lock_stalled = True
+                logger.error("Timed out waiting for the shared dedup lock, dropping unverified frames", extra={
+                    "holder": self.store.holder, "timeout": config.DEDUPLICATION_LOCK_TIMEOUT_SECONDS,
+                })
+            return False
+        if self._lock_stalled:
+            self._lock_stalled = False
+            logger.info("Shared dedup lock available again", extra={"timeouts": self.lock_timeout_count})
+        self.store.holder = os.getpid()
+        return True
+
+    def _release(self):
+        if self._lock is not None:
+            self.store.holder = 0
+            self._lock.release()
+
+    def add(self, message_digest: bytes) -> bool:
+        # Frames that can't be checked against the shared table are dropped, not passed
+        if not self._acquire():
+            return False
+        try:
+            added = self.store.add(message_digest)
+        finally:
+            self._release()
+        if not added:
+            self.duplicate_count += 1
+        return added
+
+    def add_many(self, message_digests: List[bytes]) -> List[bool]:
+        # One lock round trip per consumer batch rather than per frame
+        if not self._acquire():
+            return [False] * len(message_digests)
+        add = self.store.add
+        try:
+            added = [add(message_digest) for message_digest in message_digests]
+        finally:
+            self._release()
+        self.duplicate_count += len(added) - sum(added)
+        return added
+
+    def contains(self, message_digest: bytes) -> bool:
+        return self.store.contains(message_digest)
+
+    def resize(self, max_entries: int) -> bool:
+        # Memory relief for the Bloom backend: drops or re-allows whole generations, which
+        # frees their bit arrays. The table backend is one preallocated mapping, so a
+        # smaller copy would only add memory while both exist; it keeps its size.
+        if self.backend != "bloom":
+            return False
+        self.store.set_generations(math.ceil(max_entries / self.store.generation_entries))
+        self.max_entries = self.store.max_entries
+        logger.info("Dedup resized", extra={"max_entries": self.max_entries})
+        return True
+
+    def get_stats(self) -> dict:
+        entry_count = self.store.count
+        nbytes = self.store.nbytes
+
+        stats = {
+            "backend": self.backend,
             "entries": entry_count,
             "max_entries": self.max_entries,
             "fill_percent": (entry_count / self.max_entries * 100) if self.max_entries > 0 else 0,
-            "evictions": self.eviction_count,
+            "evictions": self.store.eviction_count,
             "duplicates": self.duplicate_count,
-            "estimated_mb": estimated_bytes / (1024 * 1024),
+            "bytes": nbytes,
+            "mb": nbytes / (1024 * 1024),
+            "bytes_per_entry": nbytes / self.max_entries,
+            "budget_bytes": self.max_bytes,
+            "lock_timeouts": self.lock_timeout_count,
         }
+        stats.update(self.store.get_stats())
+        return stats
+
+    def checkpoint(self):
+        if self.backend == "table":
+            self.store.checkpoint()
+
+    def close(self):
+        if self.backend == "table":
+            self.store.close()
 
     def clear(self):
-        self.buffer.clear()
+        if not self._acquire():
+            return
+        try:
+            self.store.clear()
+        finally:
+            self._release()
         logger.info("Deduplication buffer cleared", extra={})
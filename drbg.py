@@ -0,0 +1,143 @@
+# drbg.py
+# HMAC_DRBG from NIST SP 800-90A Rev. 1 (section 10.1.2), no prediction resistance
+import hashlib
+import hmac
+import logging
+import time
+from typing import List, Optional, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+RESEED_INTERVAL = 1 << 48 # Generate requests allowed between reseeds
+MAX_REQUEST_BYTES = 1 << 16 # Per generate call, 2^19 bits
+_IPAD = bytes(x ^ 0x36 for x in range(256))
+_OPAD = bytes(x ^ 0x5C for x in range(256))
+
+
+class ReseedRequired(Exception):
+    pass
+
+
+class HmacDrbg:
+    def __init__(self, entropy: bytes, nonce: bytes = b"", personalization: bytes = b"",
+                 hash_name: str = "sha512", reseed_interval: int = RESEED_INTERVAL):
+        self.hash_name = hash_name
+        self.outlen = hashlib.new(hash_name).digest_size
+        self.block_size = hashlib.new(hash_name).block_size
+        self.security_bytes = min(32, self.outlen // 2)
+        if len(entropy) < self.security_bytes:
+            raise ValueError(f"DRBG needs at least {self.security_bytes} bytes of entropy")
+        self.reseed_interval = reseed_interval
+        self._key = b"\x00" * self.outlen
+        self._value = b"\x01" * self.outlen
+        self._update(entropy + nonce + personalization)
+        self.reseed_counter = 1
+        self.reseed_count = 0
+        self.generated_bytes = 0
+
+    def _hmac(self, key: bytes, data: bytes) -> bytes:
+        return hmac.new(key, data, self.hash_name).digest()
+
+    def _update(self, provided: bytes = b""):
+        self._key = self._hmac(self._key, self._value + b"\x00" + provided)
+        self._value = self._hmac(self._key, self._value)
+        if provided:
+            self._key = self._hmac(self._key, self._value + b"\x01" + provided)
+            self._value = self._hmac(self._key, self._value)
+
+    def reseed(self, entropy: bytes, additional: bytes = b""):
+        if len(entropy) < self.security_bytes:
+            raise ValueError(f"DRBG needs at least {self.security_bytes} bytes of entropy")
+        self._update(entropy + additional)
+        self.reseed_counter = 1
+        self.reseed_count += 1
+
+    def generate(self, nbytes: int, additional: bytes = b"") -> bytes:
+        if nbytes > MAX_REQUEST_BYTES:
+            raise ValueError(f"DRBG requests are limited to {MAX_REQUEST_BYTES} bytes")
+        if self.reseed_counter > self.reseed_interval:
+            raise ReseedRequired()
+        if additional:
+            self._update(additional)
+
+        # HMAC(K, V) = H(K^opad || H(K^ipad || V)). The padded key states are hashed
+        # once per request and copied per block, which skips hmac's per-call setup.
+        key = self._key.ljust(self.block_size, b"\x00")
+        inner = hashlib.new(self.hash_name, key.translate(_IPAD))
+        outer = hashlib.new(self.hash_name, key.translate(_OPAD))
+        value = self._value
+        blocks = []
+        for _ in range(-(-nbytes // self.outlen)):
+            block = inner.copy()
+            block.update(value)
+            digest = outer.copy()
+            digest.update(block.digest())
+            value = digest.digest()
+            blocks.append(value)
+        self._value = value
+
+        self._update(additional)
+        self.reseed_counter += 1
+        self.generated_bytes += nbytes
+        return b"".join(blocks)[:nbytes]
+
+
+class DrbgExpander:
+    # Stretches each batch digest into bytes_per_seed output bytes: the digest
+    # instantiates (first time) or reseeds an HMAC_DRBG, which then generates in
+    # requests of block_bytes. Output is cut into unit_bytes pieces so it can go
+    # through the same record formats as plain digests.
+    def __init__(self, bytes_per_seed: int = None, block_bytes: int = None, reseed_interval: int = None,
+                 unit_bytes: int = 64):
+        self.bytes_per_seed = bytes_per_seed or config.OUTPUT_EXPANSION_BYTES_PER_SEED
+        self.block_bytes = block_bytes or config.OUTPUT_EXPANSION_BLOCK_BYTES
+        self.reseed_interval = reseed_interval or config.OUTPUT_EXPANSION_RESEED_INTERVAL
+        self.unit_bytes = unit_bytes
+
+        if self.bytes_per_seed % unit_bytes:
+            raise ValueError(f"OUTPUT_EXPANSION_BYTES_PER_SEED must be a multiple of {unit_bytes}")
+        if self.bytes_per_seed > config.OUTPUT_EXPANSION_MAX_BYTES_PER_SEED:
+            raise ValueError(f"OUTPUT_EXPANSION_BYTES_PER_SEED is limited to {config.OUTPUT_EXPANSION_MAX_BYTES_PER_SEED}")
+        if not 0 < self.block_bytes <= MAX_REQUEST_BYTES:
+            raise ValueError(f"OUTPUT_EXPANSION_BLOCK_BYTES must be 1..{MAX_REQUEST_BYTES}")
+        if -(-self.bytes_per_seed // self.block_bytes) > min(self.reseed_interval, RESEED_INTERVAL):
+            raise ValueError("OUTPUT_EXPANSION_BYTES_PER_SEED needs more requests than the reseed interval allows")
+
+        self.drbg: Optional[HmacDrbg] = None
+        self.seed_count = 0
+        self.output_bytes = 0
+
+    def expand(self, digest: bytes) -> bytes:
+        if self.drbg is None:
+            self.drbg = HmacDrbg(digest, nonce=time.time_ns().to_bytes(16, "big"),
+                                 personalization=b"entropygen-expand", reseed_interval=self.reseed_interval)
+        else:
+            self.drbg.reseed(digest)
+        self.seed_count += 1
+
+        generate = self.drbg.generate
+        remaining = self.bytes_per_seed
+        blocks = []
+        while remaining:
+            blocks.append(generate(min(self.block_bytes, remaining)))
+            remaining -= len(blocks[-1])
+        self.output_bytes += self.bytes_per_seed
+        return b"".join(blocks)
+
+    def expand_many(self, digests: List[bytes], sources: List[int]) -> Tuple[List[bytes], List[int]]:
+        unit = self.unit_bytes
+        units, unit_sources = [], []
+        for digest, source_mask in zip(digests, sources):
+            output = self.expand(digest)
+            pieces = [output[offset:offset + unit] for offset in range(0, len(output), unit)]
+            units.extend(pieces)
+            unit_sources.extend([source_mask] * len(pieces))
+        return units, unit_sources
+
+    def get_stats(self) -> dict:
+        return {
+            "expansion_bytes_per_seed": self.bytes_per_seed,
+            "expansion_seeds": self.seed_count,
+            "expansion_output_bytes": self.output_bytes,
+        }
@@ -0,0 +1,85 @@
+# endpoints.py
+import base64
+import binascii
+import logging
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence
+import config
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ';===;'
+
+
+class Endpoint(NamedTuple):
+    config: str # The WEBSOCKET_ENDPOINTS entry, which is what gets sharded and assigned
+    url: str
+    index: int # Position in the full WEBSOCKET_ENDPOINTS list, also the source bit and capture id
+    init_message: Optional[str]
+    options: Mapping # Keyword arguments for websockets.connect plus recv_buffer_bytes
+
+
+def websocket_options(url: str) -> Mapping:
+    # WEBSOCKET_OPTIONS keys are URL substrings; the first match is merged over the "" defaults
+    options = dict(config.WEBSOCKET_OPTIONS.get("", {}))
+    options.update(next((value for key, value in config.WEBSOCKET_OPTIONS.items() if key and key in url), {}))
+    return MappingProxyType(options)
+
+
+def parse_endpoint(endpoint_config: str, index: int) -> Endpoint:
+    url, *init_parts = endpoint_config.split(SEPARATOR, 1)
+    init_message = None
+    if init_parts:
+        try:
+            init_message = base64.b64decode(init_parts[0]).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError) as e:
+            logger.error("Failed to decode init message", extra={"url": url, "error": str(e)})
+    return Endpoint(endpoint_config, url, index, init_message, websocket_options(url))
+
+
+class EndpointRegistry:
+    # WEBSOCKET_ENDPOINTS parsed once: URL, decoded init message and websocket options
+    # per entry, read-only afterwards. Entries outside the list (an explicit endpoint
+    # list in tests or replay) are parsed on first use and numbered after it.
+    def __init__(self, endpoint_configs: Sequence[str]):
+        self.configs = tuple(endpoint_configs)
+        self._by_config: Dict[str, Endpoint] = {}
+        self._by_url: Dict[str, Endpoint] = {}
+        self.by_url = MappingProxyType(self._by_url) # Live view, includes entries parsed on first use
+        for endpoint_config in endpoint_configs:
+            self._add(endpoint_config)
+
+    def _add(self, endpoint_config: str) -> Endpoint:
+        endpoint = parse_endpoint(endpoint_config, len(self._by_config))
+        self._by_config[endpoint_config] = endpoint
+        self._by_url[endpoint.url] = endpoint
+        return endpoint
+
+    def get(self, endpoint_config: str) -> Endpoint:
+        endpoint = self._by_config.get(endpoint_config)
+        return endpoint if endpoint is not None else self._add(endpoint_config)
+
+    def resolve(self, endpoint_configs: Sequence[str]) -> List[Endpoint]:
+        return [self.get(endpoint_config) for endpoint_config in endpoint_configs]
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self.by_url)
+
+    def __iter__(self) -> Iterator[Endpoint]:
+        return iter(list(self.by_url.values()))
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+
+_registry: Optional[EndpointRegistry] = None
+
+
+def endpoint_registry() -> EndpointRegistry:
+    # Rebuilt if WEBSOCKET_ENDPOINTS was replaced, as the benchmarks and replay do before starting
+    global _registry
+    configs = tuple(config.WEBSOCKET_ENDPOINTS)
+    if _registry is None or _registry.configs != configs:
+        _registry = EndpointRegistry(configs)
+    return _registry
@@ -0,0 +1,236 @@
+# entropy_pool.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from drbg import HmacDrbg
+from metrics import registry
+import config
+
+logger = logging.getLogger(__name__)
+
+POLICY_BLOCK = "block"
+POLICY_ERROR = "error"
+POLICY_DRBG = "drbg"
+
+REQUESTS = registry.counter("entropygen_pool_requests_total", "Entropy API requests by response status", ("status",))
+
+
+class EntropyPool:
+    # Ring buffer of digest bytes waiting to be served, each byte served once.
+    # take() hands out memoryview slices of the ring itself, which are only valid
+    # until the next fill(), so callers copy them out before yielding to the loop.
+    def __init__(self, capacity_bytes: int = None, empty_policy: str = None):
+        self.capacity = capacity_bytes or config.ENTROPY_POOL_BYTES
+        self.empty_policy = empty_policy or config.ENTROPY_POOL_EMPTY_POLICY
+        if self.empty_policy not in (POLICY_BLOCK, POLICY_ERROR, POLICY_DRBG):
+            raise ValueError(f"Unknown empty pool policy: {self.empty_policy}")
+
+        self._ring = bytearray(self.capacity)
+        self._view = memoryview(self._ring)
+        self._start = 0
+        self.size = 0
+        self._filled = asyncio.Event()
+        self._fill_window: deque = deque()
+
+        self.drbg: Optional[HmacDrbg] = None
+        self._drbg_generated_at_reseed = 0
+        self.filled_bytes = 0
+        self.overflow_bytes = 0
+        self.served_bytes = 0
+        self.drbg_bytes = 0
+        self.empty_count = 0
+
+    def fill(self, data: bytes) -> bool:
+        # All or nothing, so with ENTROPY_POOL_EXCLUSIVE a digest is either pooled or left for the sink
+        if len(data) > self.capacity - self.size:
+            self.overflow_bytes += len(data)
+            return False
+        if self.empty_policy == POLICY_DRBG:
+            data = self._seed_drbg(data)
+
+        nbytes = len(data)
+        end = (self._start + self.size) % self.capacity
+        first = min(nbytes, self.capacity - end)
+        self._view[end:end + first] = data[:first]
+        if nbytes > first:
+            self._view[:nbytes - first] = data[first:]
+        self.size += nbytes
+        self.filled_bytes += nbytes
+        self._fill_window.append((time.monotonic(), nbytes))
+        self._filled.set()
+        return True
+
+    def _seed_drbg(self, data: bytes) -> bytes:
+        # The first fill instantiates the fallback DRBG; once it has been drawn on,
+        # the next fill reseeds it, so it is never stretched across quiet periods
+        # longer than ENTROPY_POOL_DRBG_MAX_BYTES_PER_SEED
+        if self.drbg is None:
+            if len(data) < 48:
+                return data
+            self.drbg = HmacDrbg(data[:32], nonce=data[32:48], personalization=b"entropygen-pool")
+            self._drbg_generated_at_reseed = 0
+            return data[48:]
+        if self.drbg.generated_bytes > self._drbg_generated_at_reseed and len(data) >= 32:
+            self.drbg.reseed(data[:32])
+            self._drbg_generated_at_reseed = self.drbg.generated_bytes
+            return data[32:]
+        return data
+
+    def take(self, nbytes: int) -> List[memoryview]:
+        nbytes = min(nbytes, self.size)
+        if not nbytes:
+            return []
+        first = min(nbytes, self.capacity - self._start)
+        chunks = [self._view[self._start:self._start + first]]
+        if nbytes > first:
+            chunks.append(self._view[:nbytes - first])
+        self._start = (self._start + nbytes) % self.capacity
+        self.size -= nbytes
+        self.served_bytes += nbytes
+        return chunks
+
+    def _from_drbg(self, nbytes: int) -> Optional[bytes]:
+        if self.drbg is None:
+            return None
+        if self.drbg.generated_bytes - self._drbg_generated_at_reseed + nbytes > config.ENTROPY_POOL_DRBG_MAX_BYTES_PER_SEED:
+            return None
+        self.drbg_bytes += nbytes
+        return b"".join(self.drbg.generate(min(65536, nbytes - offset)) for offset in range(0, nbytes, 65536))
+
+    async def acquire(self, nbytes: int) -> Optional[List]:
+        # Chunks making up exactly nbytes, or None if the empty-pool policy refuses
+        if self.size >= nbytes:
+            return self.take(nbytes)
+        self.empty_count += 1
+
+        if self.empty_policy == POLICY_DRBG:
+            shortfall = self._from_drbg(nbytes - self.size)
+            if shortfall is None:
+                return None
+            return self.take(nbytes) + [shortfall]
+
+        if self.empty_policy == POLICY_BLOCK:
+            deadline = time.monotonic() + config.ENTROPY_POOL_BLOCK_TIMEOUT_SECONDS
+            while self.size < nbytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._filled.clear()
+                try:
+                    await asyncio.wait_for(self._filled.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            return self.take(nbytes)
+
+        return None
+
+    def refill_rate(self) -> float:
+        now = time.monotonic()
+        window = self._fill_window
+        while window and now - window[0][0] > config.ENTROPY_POOL_RATE_WINDOW_SECONDS:
+            window.popleft()
+        return sum(nbytes for _, nbytes in window) / config.ENTROPY_POOL_RATE_WINDOW_SECONDS
+
+    def get_stats(self) -> dict:
+        return {
+            "pool_bytes": self.size,
+            "pool_capacity": self.capacity,
+            "pool_filled_bytes": self.filled_bytes,
+            "pool_overflow_bytes": self.overflow_bytes,
+            "pool_served_bytes": self.served_bytes,
+            "pool_drbg_bytes": self.drbg_bytes,
+            "pool_empty": self.empty_count,
+            "pool_refill_bytes_per_second": self.refill_rate(),
+        }
+
+
+class EntropyServer:
+    # GET /bytes?n=<count> over HTTP/1.1 keep-alive, on TCP and/or a UNIX socket.
+    # Responses are raw application/octet-stream bodies of exactly n bytes.
+    def __init__(self, pool: EntropyPool, host: str = None, port: Optional[int] = None,
+                 unix_path: Optional[str] = None):
+        self.pool = pool
+        self.host = host or config.ENTROPY_SERVER_HOST
+        self.port = port if port is not None else config.ENTROPY_SERVER_PORT
+        self.unix_path = unix_path if unix_path is not None else config.ENTROPY_SERVER_UNIX_PATH
+        self.connection_count = 0
+        self.active_connections = 0
+        self._servers: List[asyncio.AbstractServer] = []
+
+    async def start(self):
+        if self.port:
+            self._servers.append(await asyncio.start_server(
+                self._handle, self.host, self.port, reuse_port=config.ENTROPY_SERVER_REUSE_PORT or None,
+            ))
+            logger.info("Entropy API listening", extra={"host": self.host, "port": self.port})
+        if self.unix_path:
+            if os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
+            self._servers.append(await asyncio.start_unix_server(self._handle, self.unix_path))
+            logger.info("Entropy API listening", extra={"path": self.unix_path})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connection_count += 1
+        self.active_connections += 1
+        try:
+            while True:
+                request = await asyncio.wait_for(reader.readline(), timeout=config.ENTROPY_SERVER_IDLE_SECONDS)
+                if not request:
+                    break
+                keep_alive = request.rstrip().endswith(b"HTTP/1.1")
+                while True:
+                    header = await asyncio.wait_for(reader.readline(), timeout=5)
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.partition(b":")
+                    if name.strip().lower() == b"connection":
+                        keep_alive = value.strip().lower() == b"keep-alive"
+
+                status, chunks, content_type = await self._respond(request)
+                REQUESTS.labels(status.split(" ", 1)[0]).inc()
+                head = (
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {sum(len(chunk) for chunk in chunks)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode("latin-1")
+                # Pool slices are copied into the transport here, before anything can refill the ring
+                writer.write(b"".join([head, *chunks]))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug("Entropy API connection closed", extra={"error": str(e)})
+        finally:
+            self.active_connections -= 1
+            writer.close()
+
+    async def _respond(self, request: bytes) -> Tuple[str, List, str]:
+        parts = request.decode("latin-1").split()
+        if len(parts) < 2 or parts[0] != "GET":
+            return "405 Method Not Allowed", [b"only GET is supported\n"], "text/plain"
+        url = urlsplit(parts[1])
+        if url.path != "/bytes":
+            return "404 Not Found", [b"not found\n"], "text/plain"
+        try:
+            nbytes = int(parse_qs(url.query).get("n", ["32"])[0])
+        except ValueError:
+            nbytes = 0
+        if not 0 < nbytes <= config.ENTROPY_SERVER_MAX_REQUEST_BYTES:
+            return "400 Bad Request", [f"n must be 1..{config.ENTROPY_SERVER_MAX_REQUEST_BYTES}\n".encode()], "text/plain"
+
+        chunks = await self.pool.acquire(nbytes)
+        if chunks is None:
+            return "503 Service Unavailable", [b"entropy pool empty\n"], "text/plain"
+        return "200 OK", chunks, "application/octet-stream"
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
@@ -1,65 +1,115 @@
 # entropy_processor.py
-import hashlib
-import random
 import logging
-from typing import List, Optional
-from datetime import datetime
-from collections import deque
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from batch_policy import FLUSH, BatchPolicy
+from hash_backends import create_backend, timestamp_bytes
+from metrics import registry
 import config
 
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+BATCH_AGE_SECONDS = registry.histogram(
+    "entropygen_batch_age_seconds", "Age of a batch's oldest message when the batch is emitted", ("trigger",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+BATCH_MESSAGES = registry.histogram(
+    "entropygen_batch_messages", "Messages per emitted batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+
+def encode_peppers(pepper_rounds: List[str]) -> List[bytes]:
+    return [pepper.encode('utf-8') for pepper in pepper_rounds]
+
+def process_batch(batch: List[bytes], backend) -> bytes:
+    return backend.hash(batch, timestamp_bytes())
+
 class EntropyProcessor:
-    def __init__(self):
-        self.message_buffer: deque = deque(maxlen=config.MESSAGE_BATCH_SIZE * 2)
-        self.pepper_rounds = config.PEPPER_ROUNDS
+    def __init__(self, policy: Optional[BatchPolicy] = None):
+        self.policy = policy or BatchPolicy()
+        self.message_buffer: List[bytes] = []
+        self.source_counts: Dict[int, int] = {}
+        self.buffer_bytes = 0
+        self.batch_started: Optional[float] = None
+        self.pepper_rounds = encode_peppers(config.PEPPER_ROUNDS)
+        self.backend = create_backend(self.pepper_rounds)
         self.processed_count = 0
+        self.trigger_counts: Dict[str, int] = {}
+        self._age_seconds: Dict[str, object] = {}
 
-    def add_message(self, message: str) -> Optional[str]:
+    def collect(self, message: Union[bytes, str], source: int = 0) -> Optional[Tuple[List[bytes], int]]:
         try:
-            if len(message) > 1024 * 1024:
+            if isinstance(message, str):
+                message = message.encode('utf-8', errors='ignore')
+            
+            if len(message) > MAX_MESSAGE_BYTES:
                 logger.warning("Too large, truncating", extra={"size": len(message)})
-                message = message[:1024 * 1024]
+                message = message[:MAX_MESSAGE_BYTES]
             
-            message_bytes = message.encode('utf-8', errors='ignore')
-            self.message_buffer.append(message_bytes)
+            if not self.message_buffer:
+                self.batch_started = time.monotonic()
+            self.message_buffer.append(message)
+            self.buffer_bytes += len(message)
+            self.source_counts[source] = self.source_counts.get(source, 0) + 1
             
-            if len(self.message_buffer) >= config.MESSAGE_BATCH_SIZE:
-                batch = [self.message_buffer.popleft() for _ in range(min(config.MESSAGE_BATCH_SIZE, len(self.message_buffer)))]
-                result = self._process_batch(batch)
-                return result
+            trigger = self.policy.on_message(len(self.message_buffer), self.buffer_bytes, len(self.source_counts))
+            if trigger:
+                return self._take(trigger)
             
             return None
         except Exception as e:
             logger.error("Err pushing", extra={"error": str(e)}, exc_info=True)
             return None
 
+    def collect_due(self, flush: bool = False) -> Optional[Tuple[List[bytes], int]]:
+        # Called from a timer; flush takes whatever is buffered (used at shutdown)
+        if flush:
+            return self._take(FLUSH) if self.message_buffer else None
+        if len(self.message_buffer) < self.policy.deadline_min_messages:
+            return None
+        trigger = self.policy.on_timer(len(self.message_buffer), time.monotonic() - self.batch_started)
+        if trigger:
+            return self._take(trigger)
+        return None
+
+    def next_deadline(self) -> Optional[float]:
+        # time.monotonic() at which the buffered batch becomes due, None when empty or no deadline
+        if len(self.message_buffer) < self.policy.deadline_min_messages or not self.policy.max_age_seconds:
+            return None
+        return self.batch_started + self.policy.max_age_seconds
+
+    def _take(self, trigger: str) -> Tuple[List[bytes], int]:
+        batch = self.message_buffer
+        source_mask = 0
+        for source in self.source_counts:
+            source_mask |= 1 << (source % 64)
+        
+        age_seconds = self._age_seconds.get(trigger)
+        if age_seconds is None:
+            age_seconds = self._age_seconds[trigger] = BATCH_AGE_SECONDS.labels(trigger)
+        age_seconds.observe(time.monotonic() - self.batch_started)
+        BATCH_MESSAGES.observe(len(batch))
+        
+        self.message_buffer = []
+        self.source_counts = {}
+        self.buffer_bytes = 0
+        self.batch_started = None
+        self.processed_count += 1
+        self.trigger_counts[trigger] = self.trigger_counts.get(trigger, 0) + 1
+        return batch, source_mask
+
+    def add_message(self, message: Union[bytes, str]) -> Optional[str]:
+        collected = self.collect(message)
+        if collected is None:
+            return None
+        return self._process_batch(collected[0])
+
     def _process_batch(self, batch: List[bytes]) -> str:
         try:
-            combined_data = b''.join(batch)
-            
-            seed_value = int(hashlib.sha256(combined_data).hexdigest()[:16], 16)
-            rng = random.Random(seed_value)
-            
-            pepper_order = list(range(len(self.pepper_rounds)))
-            rng.shuffle(pepper_order)
-            
-            current_hash = hashlib.sha512(combined_data).digest()
+            final_hash = process_batch(batch, self.backend).hex()
             
-            for round_idx in pepper_order:
-                pepper = self.pepper_rounds[round_idx].encode('utf-8')
-                current_hash = hashlib.sha512(current_hash + pepper).digest()
-            
-            now = datetime.utcnow()
-            timestamp_string = (
-                f"{now.year}{now.month:02d}{now.day:02d}"
-                f"{now.hour:02d}{now.minute:02d}{now.second:02d}"
-                f"{now.microsecond:06d}"
-            ).encode('utf-8')
-            
-            final_hash = hashlib.sha512(current_hash + timestamp_string).hexdigest()
-            
-            self.processed_count += 1
             logger.debug("Batch complete", extra={"batch_number": self.processed_count, "batch_size": len(batch)})
             
             return final_hash
@@ -70,5 +120,22 @@ class EntropyProcessor:
     def get_buffer_size(self) -> int:
         return len(self.message_buffer)
 
+    def get_buffer_age(self) -> float:
+        return time.monotonic() - self.batch_started if self.message_buffer else 0.0
+
     def clear_buffer(self):
-        self.message_buffer.clear()
+        self.message_buffer = []
+        self.source_counts = {}
+        self.buffer_bytes = 0
+        self.batch_started = None
+
+    def get_stats(self) -> dict:
+        stats = self.policy.get_stats()
+        stats.update({
+            "batches": self.processed_count,
+            "batch_triggers": dict(self.trigger_counts),
+            "buffered": len(self.message_buffer),
+            "buffered_bytes": self.buffer_bytes,
+            "buffer_age_seconds": self.get_buffer_age(),
+        })
+        return stats
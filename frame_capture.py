@@ -0,0 +1,137 @@
+# frame_capture.py
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, List, Tuple
+from segment_log import SegmentWriter, read_segment
+import config
+
+logger = logging.getLogger(__name__)
+
+BLOCK_ENDPOINTS = 0
+BLOCK_FRAMES = 1
+# receive time (ns since epoch), endpoint id, frame length
+_FRAME_HEADER = struct.Struct('<QHI')
+
+
+def read_capture(path: str) -> Iterator[Tuple[int, str, bytes]]:
+    # Each segment starts with an endpoint table block, so it can be read on its own
+    endpoints: List[str] = []
+    for payload in read_segment(path):
+        kind, block = payload[0], zlib.decompress(payload[1:])
+        if kind == BLOCK_ENDPOINTS:
+            endpoints = json.loads(block)
+            continue
+        if kind != BLOCK_FRAMES:
+            logger.warning("Skipping unknown capture block", extra={"path": path, "kind": kind})
+            continue
+        view = memoryview(block)
+        offset = 0
+        while offset < len(view):
+            received_ns, endpoint_id, length = _FRAME_HEADER.unpack_from(view, offset)
+            offset += _FRAME_HEADER.size
+            endpoint = endpoints[endpoint_id] if endpoint_id < len(endpoints) else str(endpoint_id)
+            yield received_ns, endpoint, bytes(view[offset:offset + length])
+            offset += length
+
+
+class FrameCapture:
+    # Tees raw frames to zlib-compressed, size-rotated segment files. The read loop
+    # only does a non-blocking put; a writer thread builds blocks of up to
+    # CAPTURE_BLOCK_BYTES, compresses them and appends one CRC-framed record per block.
+    def __init__(self, endpoints: List[str], directory: str = None, prefix: str = None):
+        self.endpoints = list(endpoints)
+        self.endpoint_ids = {url: index for index, url in enumerate(self.endpoints)}
+        self.writer = SegmentWriter(
+            directory or config.CAPTURE_DIRECTORY,
+            prefix or config.CAPTURE_PREFIX,
+            config.CAPTURE_SEGMENT_MAX_BYTES,
+        )
+        self._queue: queue.Queue = queue.Queue(maxsize=config.CAPTURE_QUEUE_MAX_FRAMES)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._block = bytearray()
+        self._block_started = 0.0
+        self.frame_count = 0
+        self.dropped_count = 0
+        self.block_count = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    def start(self):
+        self._thread.start()
+        logger.info("Capturing raw frames", extra={"directory": self.writer.directory})
+
+    def record(self, endpoint: str, frame: bytes):
+        try:
+            self._queue.put_nowait((time.time_ns(), self.endpoint_ids.get(endpoint, 0xFFFF), frame))
+        except queue.Full:
+            self.dropped_count += 1
+
+    def _append_block(self, kind: int, block: bytes):
+        payload = bytes((kind,)) + zlib.compress(block, config.CAPTURE_COMPRESSION_LEVEL)
+        self.writer.append(payload)
+        self.compressed_bytes += len(payload)
+
+    def _write_block(self):
+        if not self._block:
+            return
+        if self.writer.current_path is None:
+            # New segment: lead with the endpoint table
+            self._append_block(BLOCK_ENDPOINTS, json.dumps(self.endpoints).encode('utf-8'))
+        self._append_block(BLOCK_FRAMES, bytes(self._block))
+        self.block_count += 1
+        self._block.clear()
+
+    def _run(self):
+        while True:
+            try:
+                received_ns, endpoint_id, frame = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                if self._block and time.monotonic() - self._block_started >= config.CAPTURE_FLUSH_SECONDS:
+                    self._flush_block()
+                continue
+
+            if not self._block:
+                self._block_started = time.monotonic()
+            self._block += _FRAME_HEADER.pack(received_ns, endpoint_id, len(frame))
+            self._block += frame
+            self.frame_count += 1
+            self.raw_bytes += len(frame)
+            if (len(self._block) >= config.CAPTURE_BLOCK_BYTES
+                    or time.monotonic() - self._block_started >= config.CAPTURE_FLUSH_SECONDS):
+                self._flush_block()
+
+        self._flush_block()
+
+    def _flush_block(self):
+        try:
+            self._write_block()
+            self.writer.flush()
+        except OSError as e:
+            logger.error("Err writing capture segment", extra={"error": str(e)})
+            self._block.clear()
+
+    def close(self):
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.writer.close()
+        logger.info("Frame capture stopped", extra=self.get_stats())
+
+    def get_stats(self) -> dict:
+        return {
+            "capture_frames": self.frame_count,
+            "capture_dropped": self.dropped_count,
+            "capture_queue": self._queue.qsize(),
+            "capture_blocks": self.block_count,
+            "capture_raw_bytes": self.raw_bytes,
+            "capture_compressed_bytes": self.compressed_bytes,
+            "capture_segment": self.writer.current_path,
+        }
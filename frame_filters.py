@@ -0,0 +1,107 @@
+# frame_filters.py
+# Per-endpoint rules applied to raw frames before fingerprinting. Protocol chatter
+# (heartbeats, subscription acks, pongs) is dropped outright; normalizers strip
+# boilerplate fields so repeats of the same payload fingerprint the same.
+import logging
+import re
+from typing import Callable, Dict, List, Optional
+from metrics import registry
+import config
+
+logger = logging.getLogger(__name__)
+
+DROP = "drop"
+STRIP = "strip"
+
+FILTERED_FRAMES = registry.counter(
+    "entropygen_filter_frames_total", "Frames dropped or rewritten by a filter rule", ("rule", "action"))
+FILTERED_BYTES = registry.counter(
+    "entropygen_filter_bytes_saved_total", "Frame bytes kept out of fingerprinting and hashing by a filter rule",
+    ("rule", "action"))
+
+
+class FrameRule:
+    # Matches on a byte prefix and/or a regex searched in the first `window` bytes,
+    # both cheap enough to run on every frame without parsing JSON. A strip rule
+    # with no match condition applies to every frame of its endpoints.
+    __slots__ = ("name", "endpoints", "action", "prefix", "pattern", "window", "strip",
+                 "frames", "saved_bytes", "_frames_counter", "_bytes_counter")
+
+    def __init__(self, name: str, endpoints: List[str] = (), action: str = DROP, prefix: bytes = None,
+                 pattern: bytes = None, window: int = 256, strip: bytes = None):
+        if action not in (DROP, STRIP):
+            raise ValueError(f"Unknown frame filter action: {action}")
+        if action == STRIP and not strip:
+            raise ValueError(f"Frame filter {name} strips but has no strip pattern")
+        if action == DROP and not (prefix or pattern):
+            raise ValueError(f"Frame filter {name} drops but has no prefix or pattern")
+        self.name = name
+        self.endpoints = list(endpoints)
+        self.action = action
+        self.prefix = prefix
+        self.pattern = re.compile(pattern) if pattern else None
+        self.window = window
+        self.strip = re.compile(strip) if strip else None
+        self.frames = 0
+        self.saved_bytes = 0
+        self._frames_counter = FILTERED_FRAMES.labels(name, action)
+        self._bytes_counter = FILTERED_BYTES.labels(name, action)
+
+    def applies_to(self, url: str) -> bool:
+        return not self.endpoints or any(endpoint in url for endpoint in self.endpoints)
+
+    def matches(self, frame: bytes) -> bool:
+        if self.prefix and not frame.startswith(self.prefix):
+            return False
+        if self.pattern and not self.pattern.search(frame, 0, self.window):
+            return False
+        return True
+
+    def count(self, nbytes: int):
+        self.frames += 1
+        self.saved_bytes += nbytes
+        self._frames_counter.inc()
+        self._bytes_counter.inc(nbytes)
+
+
+class FrameFilters:
+    def __init__(self, rules: Optional[List[dict]] = None):
+        specs = config.FRAME_FILTER_RULES if rules is None else rules
+        self.rules = [FrameRule(**spec) for spec in specs] if config.FRAME_FILTERS_ENABLED else []
+        self._by_endpoint: Dict[str, Optional[Callable]] = {}
+        logger.info("Frame filters loaded", extra={"rules": len(self.rules)})
+
+    def for_endpoint(self, url: str) -> Optional[Callable[[bytes], Optional[bytes]]]:
+        # A filter function bound to the endpoint's rules, or None if no rule applies,
+        # so unfiltered endpoints pay nothing per frame
+        if url not in self._by_endpoint:
+            rules = tuple(rule for rule in self.rules if rule.applies_to(url))
+            self._by_endpoint[url] = self._bind(rules) if rules else None
+        return self._by_endpoint[url]
+
+    @staticmethod
+    def _bind(rules) -> Callable[[bytes], Optional[bytes]]:
+        def apply(frame: bytes) -> Optional[bytes]:
+            for rule in rules:
+                if not rule.matches(frame):
+                    continue
+                if rule.action == DROP:
+                    rule.count(len(frame))
+                    return None
+                stripped = rule.strip.sub(b"", frame)
+                if len(stripped) != len(frame):
+                    rule.count(len(frame) - len(stripped))
+                    frame = stripped
+            return frame
+        return apply
+
+    def apply(self, url: str, frame: bytes) -> Optional[bytes]:
+        apply = self.for_endpoint(url)
+        return frame if apply is None else apply(frame)
+
+    def get_stats(self) -> dict:
+        return {
+            "filtered_frames": sum(rule.frames for rule in self.rules if rule.action == DROP),
+            "normalized_frames": sum(rule.frames for rule in self.rules if rule.action == STRIP),
+            "filtered_bytes": sum(rule.saved_bytes for rule in self.rules),
+        }
@@ -0,0 +1,121 @@
+# frame_queue.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+
+class FrameQueue:
+    # FIFO of raw frames bounded by total payload bytes rather than item count.
+    # When full, the policy either evicts the oldest frames, rejects the new one,
+    # or makes the producer wait, which stops that socket being read.
+    def __init__(self, max_bytes: int, policy: str = DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.scheduled = False
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.enqueued_count = 0
+        self.dropped_count = 0
+        self.dropped_bytes = 0
+        self.blocked_count = 0
+        self._frames = deque()
+        self._times = deque()
+        self._space = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _drop_oldest(self) -> int:
+        frame = self._frames.popleft()
+        self._times.popleft()
+        self.bytes -= len(frame)
+        self.dropped_count += 1
+        self.dropped_bytes += len(frame)
+        return len(frame)
+
+    async def put(self, frame) -> int:
+        size = len(frame)
+        dropped = 0
+
+        # A single oversized frame is still admitted into an empty queue
+        if self.bytes + size > self.max_bytes and self._frames:
+            if self.policy == DROP_NEWEST:
+                self.dropped_count += 1
+                self.dropped_bytes += size
+                return 1
+            if self.policy == DROP_OLDEST:
+                while self._frames and self.bytes + size > self.max_bytes:
+                    self._drop_oldest()
+                    dropped += 1
+            else:
+                self.blocked_count += 1
+                while self._frames and self.bytes + size > self.max_bytes:
+                    self._space.clear()
+                    await self._space.wait()
+
+        self._frames.append(frame)
+        self._times.append(time.monotonic())
+        self.bytes += size
+        self.enqueued_count += 1
+        if self.bytes > self.peak_bytes:
+            self.peak_bytes = self.bytes
+        return dropped
+
+    def drain(self, max_items: int, max_bytes: Optional[int] = None) -> List:
+        # With max_bytes, stops before the first frame that would exceed it
+        frames, times = self._frames, self._times
+        count = min(max_items, len(frames))
+        if max_bytes is None:
+            batch = [frames.popleft() for _ in range(count)]
+            nbytes = sum(len(frame) for frame in batch)
+        else:
+            batch, nbytes = [], 0
+            while len(batch) < count and nbytes + len(frames[0]) <= max_bytes:
+                nbytes += len(frames[0])
+                batch.append(frames.popleft())
+        for _ in range(len(batch)):
+            times.popleft()
+        self.bytes -= nbytes
+        self._space.set()
+        return batch
+
+    def head_age(self) -> float:
+        return time.monotonic() - self._times[0] if self._times else 0.0
+
+    def shed(self, nbytes: int) -> Tuple[int, int]:
+        # Drops oldest frames until nbytes are freed; the caller does the counting
+        count = freed = 0
+        while self._frames and freed < nbytes:
+            freed += len(self._frames.popleft())
+            self._times.popleft()
+            count += 1
+        self.bytes -= freed
+        self._space.set()
+        return count, freed
+
+    def clear(self):
+        self._frames.clear()
+        self._times.clear()
+        self.bytes = 0
+        self._space.set()
+
+    def get_stats(self) -> dict:
+        return {
+            "depth": len(self._frames),
+            "bytes": self.bytes,
+            "peak_bytes": self.peak_bytes,
+            "enqueued": self.enqueued_count,
+            "dropped": self.dropped_count,
+            "dropped_bytes": self.dropped_bytes,
+            "blocked": self.blocked_count,
+        }
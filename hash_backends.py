@@ -0,0 +1,157 @@
+# hash_backends.py
+# Batch mixing constructions selected by HASH_BACKEND. Each turns a batch of
+# messages, the pepper rounds and a timestamp into output bytes (64 unless
+# SHAKE256 is asked for more).
+import hashlib
+import random
+import struct
+from datetime import datetime
+from typing import Dict, List
+import config
+
+_LENGTH = struct.Struct('>I')
+_PERSON = b"entropygen-mix"
+
+
+def timestamp_bytes() -> bytes:
+    now = datetime.utcnow()
+    return (
+        f"{now.year}{now.month:02d}{now.day:02d}"
+        f"{now.hour:02d}{now.minute:02d}{now.second:02d}"
+        f"{now.microsecond:06d}"
+    ).encode('utf-8')
+
+
+def _pepper_key(pepper_rounds: List[bytes]) -> bytes:
+    # All peppers folded into one 64-byte key, length-prefixed so boundaries count
+    hasher = hashlib.blake2b(digest_size=64, person=b"entropygen-key")
+    for pepper in pepper_rounds:
+        hasher.update(_LENGTH.pack(len(pepper)))
+        hasher.update(pepper)
+    return hasher.digest()
+
+
+class PepperRoundsBackend:
+    # The original construction: SHA-256 of the batch seeds a shuffle of the
+    # pepper rounds, SHA-512 of the batch is chained through each pepper in that
+    # order, then hashed once more with the timestamp. 13 passes per output.
+    name = "pepper_rounds"
+    output_bytes = 64
+
+    def __init__(self, pepper_rounds: List[bytes]):
+        self.pepper_rounds = pepper_rounds
+
+    def hash(self, batch: List[bytes], timestamp: bytes) -> bytes:
+        # Members are streamed into the hashers, the batch is never concatenated
+        seed_hasher = hashlib.sha256()
+        data_hasher = hashlib.sha512()
+        for message in batch:
+            seed_hasher.update(message)
+            data_hasher.update(message)
+
+        rng = random.Random(int.from_bytes(seed_hasher.digest()[:8], 'big'))
+        pepper_order = list(range(len(self.pepper_rounds)))
+        rng.shuffle(pepper_order)
+
+        current_hash = data_hasher.digest()
+        for round_idx in pepper_order:
+            current_hash = hashlib.sha512(current_hash + self.pepper_rounds[round_idx]).digest()
+
+        return hashlib.sha512(current_hash + timestamp).digest()
+
+
+class Blake2bKeyedBackend:
+    # One keyed BLAKE2b-512 pass with the folded peppers as the key
+    name = "blake2b_keyed"
+    output_bytes = 64
+
+    def __init__(self, pepper_rounds: List[bytes]):
+        self.key = _pepper_key(pepper_rounds)
+
+    def hash(self, batch: List[bytes], timestamp: bytes) -> bytes:
+        hasher = hashlib.blake2b(key=self.key, digest_size=64, person=_PERSON)
+        for message in batch:
+            hasher.update(_LENGTH.pack(len(message)))
+            hasher.update(message)
+        hasher.update(timestamp)
+        return hasher.digest()
+
+
+class Sha3Backend:
+    # SHA3-512 over key || messages || timestamp; sponge hashes have no length
+    # extension, so prefixing the key is a sound keyed construction
+    name = "sha3_512"
+    output_bytes = 64
+
+    def __init__(self, pepper_rounds: List[bytes]):
+        self.key = _pepper_key(pepper_rounds)
+
+    def _absorb(self, hasher, batch: List[bytes], timestamp: bytes):
+        for message in batch:
+            hasher.update(_LENGTH.pack(len(message)))
+            hasher.update(message)
+        hasher.update(timestamp)
+        return hasher
+
+    def hash(self, batch: List[bytes], timestamp: bytes) -> bytes:
+        return self._absorb(hashlib.sha3_512(self.key), batch, timestamp).digest()
+
+
+class Shake256Backend(Sha3Backend):
+    # Same absorb as SHA3-512, squeezing HASH_SHAKE256_OUTPUT_BYTES
+    name = "shake256"
+
+    def __init__(self, pepper_rounds: List[bytes], output_bytes: int = None):
+        super().__init__(pepper_rounds)
+        self.output_bytes = output_bytes or config.HASH_SHAKE256_OUTPUT_BYTES
+        if self.output_bytes % 64:
+            raise ValueError("HASH_SHAKE256_OUTPUT_BYTES must be a multiple of 64")
+
+    def hash(self, batch: List[bytes], timestamp: bytes) -> bytes:
+        return self._absorb(hashlib.shake_256(self.key), batch, timestamp).digest(self.output_bytes)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (PepperRoundsBackend, Blake2bKeyedBackend, Sha3Backend, Shake256Backend)
+}
+
+# Known answers for a fixed batch, peppers and timestamp; a mismatch means the
+# construction changed and every consumer's expectations with it
+_KNOWN_BATCH = [b"alpha", b"beta", b"gamma"]
+_KNOWN_PEPPERS = [b"pepper-one", b"pepper-two", b"pepper-three"]
+_KNOWN_TIMESTAMP = b"20260102030405678901"
+KNOWN_ANSWERS: Dict[str, str] = {
+    "pepper_rounds": "c39831c52692a06abdd31dcd136b859d7bf98abb04a0690bcd1c2a9a999993359daf0272b82a3fe6ca9e4c424b3ec214f5c9dbe46dd6781239fd1ce6e4463979",
+    "blake2b_keyed": "01473470be73ce8eaeb0dffb82fe08c22e5247c03098b36b30925b69e8586f323a0475151636c2e4e3c759cb829690f5c6c3b3b913737678aef6274abc99314b",
+    "sha3_512": "fa4d0f5e0b8865060ffebf6ec989c0a179f2c6347743dce9aa394dbf96d908f867da60566b757cc835ec85706daad66c498e311c0b1f93e46657faa9e22660c0",
+    "shake256": "5c047acef16c895eb659728afd807833567d9af618e118806f6690f7cf9ebd1cebb0b91a4317cff158da200521156e9bcfe0850841bd007b64bbc1fb99cf3fe68f7d5fa0ea44ee719ccf21adfffae1244335c20e591573139ecd63cb17ed943fd62df6b667e10ec299f3219e87fa5f228ef3852486915028f49077285a98c6cf",
+}
+
+
+def create_backend(pepper_rounds: List[bytes], name: str = None):
+    name = name or config.HASH_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown hash backend: {name}")
+    return BACKENDS[name](pepper_rounds)
+
+
+def split_units(outputs: List[bytes], sources: List[int], unit_bytes: int = 64):
+    # Long SHAKE256 outputs become unit_bytes digests, each keeping its batch's source mask
+    units, unit_sources = [], []
+    for output, source_mask in zip(outputs, sources):
+        pieces = [output[offset:offset + unit_bytes] for offset in range(0, len(output), unit_bytes)]
+        units.extend(pieces)
+        unit_sources.extend([source_mask] * len(pieces))
+    return units, unit_sources
+
+
+def self_test(names=None):
+    for name in names or BACKENDS:
+        if name == "shake256":
+            backend = Shake256Backend(_KNOWN_PEPPERS, output_bytes=128)
+        else:
+            backend = BACKENDS[name](_KNOWN_PEPPERS)
+        got = backend.hash(_KNOWN_BATCH, _KNOWN_TIMESTAMP).hex()
+        if got != KNOWN_ANSWERS[name]:
+            raise RuntimeError(f"Hash backend {name} failed its known-answer test")
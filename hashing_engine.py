@@ -0,0 +1,152 @@
+# hashing_engine.py
+import asyncio
+import hashlib
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from entropy_processor import encode_peppers, process_batch
+from hash_backends import create_backend, self_test
+import config
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT = 0
+BATCH = 1
+
+
+def hash_items(items: List[Tuple[int, object]], backend) -> list:
+    results = []
+    for kind, payload in items:
+        if kind == FINGERPRINT:
+            results.append(hashlib.sha256(payload).digest())
+        else:
+            results.append(process_batch(payload, backend))
+    return results
+
+
+class HashingEngine:
+    # Coalesces fingerprint and batch-hash requests made during one loop iteration into
+    # jobs for a worker pool. Jobs resolve strictly in submission order, and at most
+    # HASHING_MAX_INFLIGHT_JOBS exist at once; later chunks wait as plain lists.
+    def __init__(self, pepper_rounds: List[str]):
+        # Backends are plain picklable objects, so process mode ships them with each job
+        self.backend = create_backend(encode_peppers(pepper_rounds))
+        self_test([self.backend.name])
+        self.mode = config.HASHING_EXECUTOR
+        self.workers = config.HASHING_WORKERS or os.cpu_count() or 1
+        self.max_job_items = config.HASHING_JOB_MAX_ITEMS
+
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+        elif self.mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.mode == "inline":
+            self._executor = None
+        else:
+            raise ValueError(f"Unknown hashing executor: {self.mode}")
+
+        self.max_inflight_jobs = config.HASHING_MAX_INFLIGHT_JOBS
+        self._pending: List[Tuple[int, object, asyncio.Future]] = []
+        self._queued: deque = deque() # Chunks waiting for a job slot, no task until they get one
+        self._dispatch_scheduled = False
+        self._last_job: Optional[asyncio.Task] = None
+        self.inflight_jobs = 0
+        self.job_count = 0
+        self.item_count = 0
+
+        logger.info("Hashing engine ready", extra={"mode": self.mode, "workers": self.workers, "backend": self.backend.name})
+
+    async def fingerprint(self, data: bytes) -> bytes:
+        if self._executor is None:
+            self.item_count += 1
+            return hashlib.sha256(data).digest()
+        return await self._submit(FINGERPRINT, data)
+
+    async def hash_batch(self, batch: List[bytes]) -> bytes:
+        if self._executor is None:
+            self.item_count += 1
+            return process_batch(batch, self.backend)
+        return await self._submit(BATCH, batch)
+
+    async def fingerprint_many(self, items: List[bytes]) -> List[bytes]:
+        # Plain futures straight onto the pending list, no coroutine or task per item
+        if self._executor is None:
+            self.item_count += len(items)
+            return [hashlib.sha256(data).digest() for data in items]
+        return list(await asyncio.gather(*[self._submit(FINGERPRINT, data) for data in items]))
+
+    async def hash_batches(self, batches: List[List[bytes]]) -> List[bytes]:
+        if self._executor is None:
+            self.item_count += len(batches)
+            return [process_batch(batch, self.backend) for batch in batches]
+        return list(await asyncio.gather(*[self._submit(BATCH, batch) for batch in batches]))
+
+    def _submit(self, kind: int, payload) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((kind, payload, future))
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_job_items):
+            self._queued.append(pending[start:start + self.max_job_items])
+        self._start_jobs()
+
+    def _start_jobs(self):
+        # Jobs start in submission order and keep their slot until their futures are
+        # resolved, so the oldest unresolved job always holds one and can't be starved
+        while self._queued and self.inflight_jobs < self.max_inflight_jobs:
+            self.inflight_jobs += 1
+            self._last_job = asyncio.create_task(self._run_job(self._queued.popleft(), self._last_job))
+
+    async def _run_job(self, chunk, previous: Optional[asyncio.Task]):
+        items = [(kind, payload) for kind, payload, _ in chunk]
+        results = None
+        error = None
+        try:
+            try:
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(self._executor, hash_items, items, self.backend)
+            except Exception as e:
+                error = e
+                logger.error("Err in hashing job", extra={"error": str(e), "items": len(items)}, exc_info=True)
+
+            if previous is not None:
+                await asyncio.wait([previous])
+
+            self.job_count += 1
+            self.item_count += len(items)
+            for i, (_, _, future) in enumerate(chunk):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+        finally:
+            self.inflight_jobs -= 1
+            self._start_jobs()
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "backend": self.backend.name,
+            "workers": self.workers,
+            "jobs": self.job_count,
+            "items": self.item_count,
+            "pending": len(self._pending),
+            "queued_jobs": len(self._queued),
+            "inflight_jobs": self.inflight_jobs,
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            logger.info("Hashing engine stopped")
@@ -0,0 +1,230 @@
+# kafka_delivery.py
+import functools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from kafka_pool import ProducerPool
+from spool import SegmentSpool
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class KafkaDelivery:
+    # Owns the producer pool on a dedicated thread. The event loop only does a
+    # non-blocking put into a bounded handoff; anything the broker can't take right
+    # now (full handoff, send timeout, failed delivery) goes to an on-disk spool that
+    # the same thread replays in order once sends succeed again. A replayed segment is
+    # deleted only once every record from it is acked or spooled again.
+    def __init__(self):
+        self.spool = SegmentSpool(
+            config.KAFKA_SPOOL_DIRECTORY,
+            "spool-",
+            config.KAFKA_SPOOL_SEGMENT_MAX_BYTES,
+        )
+        self.producer = ProducerPool(on_failure=self._on_delivery_failure)
+        self._handoff: queue.Queue = queue.Queue(maxsize=config.KAFKA_HANDOFF_MAX_RECORDS)
+        # Overflow of a full handoff, written to the spool by its own thread so the event
+        # loop never touches the disk and a send blocked on the broker doesn't hold it up
+        self._overflow: queue.SimpleQueue = queue.SimpleQueue()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="kafka-delivery", daemon=True)
+        self._spool_thread = threading.Thread(target=self._spool_overflow, name="kafka-spool", daemon=True)
+        self._retry_at = 0.0
+        self._replay_path: Optional[str] = None
+        self._replay_records: Optional[Iterator[Tuple[float, bytes]]] = None
+        self._replay_pending: Optional[bytes] = None
+        self._replay_done: Optional[Callable[[], None]] = None
+        # segment path -> [records sent and not yet acked or spooled again, all sent]
+        self._replay_outstanding: Dict[str, list] = {}
+        self._replay_lock = threading.Lock()
+        self.handoff_count = 0
+        self.handoff_full_count = 0
+        self.replayed_count = 0
+        self.record_bytes = 0
+
+    def start(self):
+        self._spool_thread.start()
+        self._thread.start()
+
+    def submit(self, value: bytes, source_mask: Optional[int] = None):
+        self.record_bytes = len(value)
+        try:
+            self._handoff.put_nowait((value, source_mask))
+            self.handoff_count += 1
+        except queue.Full:
+            self.handoff_full_count += 1
+            self._overflow.put(value)
+
+    def _spool_overflow(self):
+        while True:
+            value = self._overflow.get()
+            if value is None:
+                return
+            self.spool.append(value)
+
+    def _on_delivery_failure(self, value):
+        # Runs on kafka-python's I/O thread
+        self._mark_unhealthy()
+        self.spool.append(value if isinstance(value, bytes) else value.encode('utf-8'))
+
+    def _mark_unhealthy(self):
+        self._retry_at = time.monotonic() + config.KAFKA_SPOOL_RETRY_SECONDS
+
+    def _healthy(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def _send(self, value: bytes, source_mask: Optional[int] = None,
+              on_done: Optional[Callable[[], None]] = None) -> bool:
+        if self.producer.send(value, source_mask, on_done):
+            return True
+        self._mark_unhealthy()
+        return False
+
+    def _route(self, value: bytes, source_mask: Optional[int]):
+        # Once anything is spooled, new records queue behind it to keep order.
+        # The spool keeps only the record, so replayed records are routed unkeyed
+        if self._replay_path or self.spool.depth or not self._healthy() or not self._send(value, source_mask):
+            self.spool.append(value)
+
+    def _replay_chunk(self):
+        if self._replay_records is None:
+            with self._replay_lock:
+                segments = [path for path in self.spool.closed_segments() if path not in self._replay_outstanding]
+                if not segments:
+                    return
+                self._replay_path = segments[0]
+                self._replay_outstanding[self._replay_path] = [0, False]
+            self._replay_records = self.spool.read(self._replay_path)
+            self._replay_done = functools.partial(self._on_replayed, self._replay_path)
+
+        for _ in range(config.KAFKA_SPOOL_REPLAY_BATCH):
+            if self._replay_pending is None:
+                record = next(self._replay_records, None)
+                if record is None:
+                    break
+                self._replay_pending = record[1]
+            with self._replay_lock:
+                self._replay_outstanding[self._replay_path][0] += 1
+            if not self._send(self._replay_pending, on_done=self._replay_done):
+                with self._replay_lock:
+                    self._replay_outstanding[self._replay_path][0] -= 1
+                return
+            self._replay_pending = None
+            self.replayed_count += 1
+        else:
+            return
+
+        self._replay_segment_sent()
+
+    def _replay_segment_sent(self):
+        # Everything is handed to the producer; the segment goes once the last record is
+        # acked or spooled again. Until then a crash replays the whole segment.
+        path = self._replay_path
+        self._replay_path = None
+        self._replay_records = None
+        self._replay_done = None
+        with self._replay_lock:
+            state = self._replay_outstanding[path]
+            state[1] = True
+            finished = state[0] == 0
+            if finished:
+                del self._replay_outstanding[path]
+        if finished:
+            self._remove_replayed(path)
+
+    def _on_replayed(self, path: str):
+        # Runs on kafka-python's I/O thread, after the ack or after on_failure spooled it
+        with self._replay_lock:
+            state = self._replay_outstanding[path]
+            state[0] -= 1
+            finished = state[1] and state[0] == 0
+            if finished:
+                del self._replay_outstanding[path]
+        if finished:
+            self._remove_replayed(path)
+
+    def _remove_replayed(self, path: str):
+        self.spool.remove(path)
+        logger.info("Replayed spool segment", extra={"path": path})
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self.producer.maintain()
+            try:
+                item = self._handoff.get(timeout=0.2)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                self._route(*item)
+                # Keep draining without blocking before spending time on replay
+                for _ in range(config.KAFKA_SPOOL_REPLAY_BATCH):
+                    try:
+                        self._route(*self._handoff.get_nowait())
+                    except queue.Empty:
+                        break
+
+            if (self._replay_path or self.spool.depth) and self._healthy():
+                try:
+                    self._replay_chunk()
+                except Exception as e:
+                    logger.error("Err replaying spool", extra={"error": str(e)}, exc_info=True)
+                    self._mark_unhealthy()
+
+        # Shutdown: whatever is still queued goes to disk instead of racing a flush timeout.
+        # The unsent rest of a segment being replayed is spooled again, so the segment
+        # can go once its sent records are acked or taken back by close()
+        if self._replay_path is not None:
+            logger.debug("Replay interrupted by shutdown", extra={"path": self._replay_path})
+            if self._replay_pending is not None:
+                self.spool.append(self._replay_pending)
+            for _, value in self._replay_records:
+                self.spool.append(value)
+            self._replay_pending = None
+            self._replay_segment_sent()
+        while True:
+            try:
+                self._overflow.put(self._handoff.get_nowait()[0])
+            except queue.Empty:
+                break
+
+    def flush(self, timeout: Optional[float] = None):
+        deadline = time.monotonic() + timeout if timeout else None
+        while not self._handoff.empty() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.01)
+        self.producer.flush(timeout=timeout)
+        while not self._overflow.empty() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.01)
+        self.spool.flush()
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join()
+        self.producer.flush(timeout=config.KAFKA_SHUTDOWN_FLUSH_SECONDS)
+        # Aborts undelivered batches; their errbacks spool them
+        self.producer.close(timeout=0)
+        for value, on_done in self.producer.take_unacked():
+            self.spool.append(value if isinstance(value, bytes) else value.encode('utf-8'))
+            if on_done is not None:
+                on_done()
+        self._overflow.put(None)
+        self._spool_thread.join()
+        self.spool.close()
+        logger.info("Kafka delivery stopped", extra=self.spool.get_stats())
+
+    def buffered_bytes(self) -> int:
+        # Records are one size per output format, so count times the latest size
+        return (self._handoff.qsize() + self._overflow.qsize() + self.producer.unacked_count()) * self.record_bytes
+
+    def get_stats(self) -> dict:
+        stats = self.producer.get_stats()
+        stats.update(self.spool.get_stats())
+        stats.update({
+            "handoff_depth": self._handoff.qsize(),
+            "handoff_full": self.handoff_full_count,
+            "replayed": self.replayed_count,
+        })
+        return stats
@@ -0,0 +1,230 @@
+# kafka_pool.py
+import itertools
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from kafka.partitioner.default import murmur2
+from kafka_producer import KafkaEntropyProducer
+import config
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+SOURCE_MIX = "source_mix"
+TIME_BUCKET = "time_bucket"
+
+_KEY_CACHE_MAX = 4096
+
+
+def partition_for_key(key: bytes, partitions: List[int]) -> int:
+    # Same mapping as the Java client's default partitioner, so consumers can compute it
+    return partitions[(murmur2(key) & 0x7FFFFFFF) % len(partitions)]
+
+
+class ProducerPool:
+    # kafka-python does all of a producer's batching, compression and network I/O on
+    # one thread, which saturates long before the broker does. The pool runs
+    # KAFKA_PRODUCER_POOL_SIZE producers and gives each every Nth partition of the
+    # topic, so records for different partitions go out in parallel. Same interface as
+    # KafkaEntropyProducer; only the delivery thread calls send() and maintain().
+    def __init__(self, on_failure: Optional[Callable[[bytes], None]] = None, size: Optional[int] = None,
+                 key_policy: Optional[str] = None, producer_factory: Optional[Callable] = None):
+        self.key_policy = key_policy or config.KAFKA_PARTITION_KEY
+        if self.key_policy not in (ROUND_ROBIN, SOURCE_MIX, TIME_BUCKET):
+            raise ValueError(f"Unknown partition key policy: {self.key_policy}")
+        factory = producer_factory or config.KAFKA_PRODUCER_FACTORY
+        size = size or config.KAFKA_PRODUCER_POOL_SIZE
+        # Each producer bootstraps against the cluster on creation, so create them side by side
+        with ThreadPoolExecutor(max_workers=size, thread_name_prefix="kafka-init") as executor:
+            self.producers = list(executor.map(
+                lambda index: KafkaEntropyProducer(on_failure, index, factory), range(size)))
+        self.partitions: List[int] = []
+        self.owners: Dict[int, KafkaEntropyProducer] = {}
+        self.rates = [0.0] * len(self.producers)
+        self.record_bytes = 0
+        self.adaptive = config.KAFKA_ADAPTIVE_LINGER
+        # key value -> (key bytes, partition)
+        self._keys: Dict[int, Tuple[bytes, int]] = {}
+        self._sticky_index = -1
+        self._sticky_left = 0
+        self._sticky_records = 1
+        self._fallback = itertools.count()
+        self._refreshed_at = float("-inf")
+        self._tuned_at = time.monotonic()
+        self._submitted = [0] * len(self.producers)
+        self._partition_acked: Dict[int, int] = {}
+        self.partition_rates: Dict[int, float] = {}
+
+    def send(self, value: Union[bytes, str], source_mask: Optional[int] = None,
+             on_done: Optional[Callable[[], None]] = None) -> bool:
+        self.record_bytes = len(value)
+        if self.key_policy == SOURCE_MIX and source_mask is not None:
+            key, partition = self._keyed(source_mask)
+        elif self.key_policy == TIME_BUCKET:
+            key, partition = self._keyed(int(time.time() // config.KAFKA_PARTITION_TIME_BUCKET_SECONDS))
+        else:
+            key, partition = None, self._sticky()
+        if partition is None:
+            # No partition metadata yet, spread over the producers and let their partitioner pick
+            producer = self.producers[next(self._fallback) % len(self.producers)]
+            return producer.send(value, key=key, on_done=on_done)
+        return self.owners[partition].send(value, key=key, partition=partition, on_done=on_done)
+
+    def _keyed(self, value: int) -> Tuple[bytes, Optional[int]]:
+        cached = self._keys.get(value)
+        if cached is None:
+            key = value.to_bytes(8, "big")
+            if not self.partitions:
+                return key, None
+            if len(self._keys) >= _KEY_CACHE_MAX:
+                self._keys.clear()
+            cached = self._keys[value] = (key, partition_for_key(key, self.partitions))
+        return cached
+
+    def _sticky(self) -> Optional[int]:
+        # Unkeyed records stay on one partition for a batch worth, then move to the next,
+        # which belongs to the next producer, so batches fill and producers take turns
+        if not self.partitions:
+            return None
+        if self._sticky_left <= 0:
+            self._sticky_index = (self._sticky_index + 1) % len(self.partitions)
+            self._sticky_left = self._sticky_records
+        self._sticky_left -= 1
+        return self.partitions[self._sticky_index]
+
+    def maintain(self):
+        now = time.monotonic()
+        if now - self._refreshed_at >= config.KAFKA_PARTITION_REFRESH_SECONDS:
+            self.refresh(now)
+        if now - self._tuned_at >= config.KAFKA_ADAPTIVE_INTERVAL_SECONDS:
+            self.tune(now)
+
+    def refresh(self, now: float):
+        self._refreshed_at = now
+        try:
+            partitions = self.producers[0].partitions_for(config.KAFKA_TOPIC)
+        except Exception as e:
+            # Retry sooner than the regular refresh
+            self._refreshed_at = now - config.KAFKA_PARTITION_REFRESH_SECONDS + config.KAFKA_SPOOL_RETRY_SECONDS
+            logger.error("Err reading topic partitions", extra={"topic": config.KAFKA_TOPIC, "error": str(e)})
+            return
+        if partitions == self.partitions:
+            return
+        self.partitions = partitions
+        self.owners = {
+            partition: self.producers[index % len(self.producers)] for index, partition in enumerate(partitions)
+        }
+        self._keys.clear()
+        self._sticky_left = 0
+        logger.info("Kafka partitions assigned", extra={
+            "topic": config.KAFKA_TOPIC, "partitions": len(partitions), "producers": len(self.producers),
+        })
+
+    def tune(self, now: float):
+        elapsed = now - self._tuned_at
+        self._tuned_at = now
+        for index, producer in enumerate(self.producers):
+            submitted = producer.submitted_count
+            self.rates[index] = (submitted - self._submitted[index]) / elapsed if elapsed > 0 else 0.0
+            self._submitted[index] = submitted
+        acked = {partition: counts[0] for partition, counts in self.partition_totals().items()}
+        self.partition_rates = {
+            partition: (count - self._partition_acked.get(partition, 0)) / elapsed if elapsed > 0 else 0.0
+            for partition, count in acked.items()
+        }
+        self._partition_acked = acked
+        if not self.adaptive or not self.record_bytes:
+            return
+
+        for producer, rate in zip(self.producers, self.rates):
+            linger_ms, batch_size = self._settings(producer, rate)
+            # Applying settings recreates the producer, so small linger moves aren't worth it
+            if batch_size == producer.batch_size and abs(linger_ms - producer.linger_ms) <= max(1, producer.linger_ms // 4):
+                continue
+            if not producer.tune(linger_ms, batch_size):
+                self.adaptive = False
+                logger.warning("Could not recreate producer with new batching settings, adaptive linger disabled")
+                return
+            logger.debug("Kafka producer tuned", extra={
+                "producer": producer.index, "records_per_second": round(rate, 1),
+                "linger_ms": linger_ms, "batch_size": batch_size,
+            })
+        self._sticky_records = max(1, max(producer.batch_size for producer in self.producers) // self.record_bytes)
+
+    def _settings(self, producer: KafkaEntropyProducer, rate: float) -> Tuple[int, int]:
+        # Bytes/s reaching the producer's busiest partition. Sticky round-robin fills one
+        # partition at a time at the producer's full rate; keyed records go where the
+        # keys hash, so use the measured per-partition rates
+        if self.key_policy == ROUND_ROBIN:
+            per_partition = rate * self.record_bytes
+        else:
+            per_partition = max((self.partition_rates.get(partition, 0.0)
+                                 for partition, owner in self.owners.items() if owner is producer),
+                                default=0.0) * self.record_bytes
+        linger_ms, batch_size = config.KAFKA_LINGER_MS, max(config.KAFKA_BATCH_SIZE, self.record_bytes)
+        if not per_partition:
+            return linger_ms, batch_size
+        # Largest doubling of the configured batch size that still fills within the linger cap
+        window = per_partition * config.KAFKA_LINGER_MAX_MS / 1000
+        while batch_size * 2 <= min(window, config.KAFKA_BATCH_SIZE_MAX):
+            batch_size *= 2
+        # Linger just long enough to fill a batch; if that takes longer than the cap,
+        # waiting only adds latency
+        fill_ms = batch_size / per_partition * 1000
+        if fill_ms <= config.KAFKA_LINGER_MAX_MS:
+            linger_ms = max(linger_ms, math.ceil(fill_ms))
+        return linger_ms, batch_size
+
+    def take_unacked(self) -> List[Tuple[Union[bytes, str], Optional[Callable[[], None]]]]:
+        return [record for producer in self.producers for record in producer.take_unacked()]
+
+    def unacked_count(self) -> int:
+        return sum(producer.unacked_count() for producer in self.producers)
+
+    def flush(self, timeout: Optional[float] = None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for producer in self.producers:
+            producer.flush(timeout=max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+
+    def close(self, timeout: Optional[float] = 10):
+        for producer in self.producers:
+            producer.close(timeout=timeout)
+
+    def partition_totals(self) -> Dict[int, list]:
+        # partition -> [acked, errors, ack seconds], summed over producers in case ownership moved
+        totals: Dict[int, list] = {}
+        for producer in self.producers:
+            for partition, counts in list(producer.partition_stats.items()):
+                total = totals.setdefault(partition, [0, 0, 0.0])
+                for index, count in enumerate(counts):
+                    total[index] += count
+        return totals
+
+    def get_stats(self) -> dict:
+        sent = sum(producer.send_count for producer in self.producers)
+        errors = sum(producer.error_count for producer in self.producers)
+        producers = []
+        for producer, rate in zip(self.producers, self.rates):
+            stats = producer.get_stats()
+            stats.update({
+                "records_per_second": round(rate, 1),
+                "partitions": sum(1 for owner in self.owners.values() if owner is producer),
+            })
+            producers.append(stats)
+        return {
+            "sent": sent,
+            "errors": errors,
+            "success_rate": (sent / (sent + errors) * 100) if (sent + errors) > 0 else 0,
+            "partition_key": self.key_policy,
+            "producers": producers,
+            "partitions": {
+                partition: {
+                    "acked": acked,
+                    "errors": failed,
+                    "ack_mean_ms": round(seconds / acked * 1000, 3) if acked else None,
+                }
+                for partition, (acked, failed, seconds) in sorted(self.partition_totals().items())
+            },
+        }
@@ -1,75 +1,175 @@
 # kafka_producer.py
+import itertools
 import logging
+import threading
+import time
 from kafka import KafkaProducer
 from kafka.errors import KafkaError, KafkaTimeoutError
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from metrics import STAGE_SECONDS, registry
 import config
 
 logger = logging.getLogger(__name__)
 
+ACK_SECONDS = registry.histogram(
+    "entropygen_kafka_ack_seconds", "Send to broker ack per pooled producer", ("producer",),
+)
+# The sink_ack stage child is shared by every pooled producer's I/O thread
+_STAGE_ACK_LOCK = threading.Lock()
+
+
 class KafkaEntropyProducer:
-    def __init__(self):
+    def __init__(self, on_failure: Optional[Callable[[bytes], None]] = None, index: int = 0,
+                 producer_factory: Optional[Callable[..., KafkaProducer]] = None):
         self.producer: Optional[KafkaProducer] = None
+        self.index = index
         self.send_count = 0
         self.error_count = 0
+        self.submitted_count = 0
+        self.on_failure = on_failure
+        self.producer_factory = producer_factory or KafkaProducer
+        # partition -> [acked, errors, ack seconds]
+        self.partition_stats: Dict[int, list] = {}
+        self.ack_seconds_total = 0.0
+        self.linger_ms = config.KAFKA_LINGER_MS
+        self.batch_size = config.KAFKA_BATCH_SIZE
+        # Records handed to kafka-python but not yet acked, so failures can be spooled
+        # token -> (value, send time, on_done)
+        self._unacked: Dict[int, Tuple[Union[bytes, str], float, Optional[Callable[[], None]]]] = {}
+        self._unacked_lock = threading.Lock()
+        self._tokens = itertools.count()
+        self._ack_seconds = STAGE_SECONDS.labels("sink_ack")
+        self._producer_ack_seconds = ACK_SECONDS.labels(str(index))
+        self._retiring: List[threading.Thread] = []
         self._initialize_producer()
 
-    def _initialize_producer(self):
-        try:
-            kafka_config = {
+    def _kafka_config(self) -> dict:
+        return {
                 'bootstrap_servers': config.KAFKA_BOOTSTRAP_SERVERS,
                 'security_protocol': config.KAFKA_SECURITY_PROTOCOL,
                 'sasl_mechanism': config.KAFKA_SASL_MECHANISM,
                 'sasl_plain_username': config.KAFKA_SASL_USERNAME,
                 'sasl_plain_password': config.KAFKA_SASL_PASSWORD,
-                'batch_size': config.KAFKA_BATCH_SIZE,
-                'linger_ms': config.KAFKA_LINGER_MS,
+                'batch_size': self.batch_size,
+                'linger_ms': self.linger_ms,
                 'compression_type': config.KAFKA_COMPRESSION_TYPE,
                 'max_in_flight_requests_per_connection': config.KAFKA_MAX_IN_FLIGHT_REQUESTS,
                 'buffer_memory': config.KAFKA_BUFFER_MEMORY,
                 'max_block_ms': config.KAFKA_MAX_BLOCK_MS,
                 'acks': 'all',
                 'retries': 3,
-                'value_serializer': lambda v: v.encode('utf-8'),
+                'value_serializer': lambda v: v if isinstance(v, bytes) else v.encode('utf-8'),
                 'api_version': (2, 5, 0),
             }
-            
-            self.producer = KafkaProducer(**kafka_config)
-            logger.info("Kafka producer initialized successfully")
+
+    def _initialize_producer(self):
+        try:
+            self.producer = self.producer_factory(**self._kafka_config())
+            logger.info("Kafka producer initialized successfully", extra={"producer": self.index})
         except Exception as e:
             logger.error("Producer init fail", extra={"error": str(e)}, exc_info=True)
             raise
 
-    def send(self, entropy_hash: str) -> bool:
+    def send(self, entropy_hash: Union[bytes, str], key: Optional[bytes] = None,
+             partition: Optional[int] = None, on_done: Optional[Callable[[], None]] = None) -> bool:
+        # on_done runs once the record is acked or, after a failure, handed to on_failure
         if not self.producer:
             logger.error("MQ producer not init")
             return False
         
+        token = next(self._tokens)
+        with self._unacked_lock:
+            self._unacked[token] = (entropy_hash, time.monotonic(), on_done)
         try:
-            future = self.producer.send(config.KAFKA_TOPIC, value=entropy_hash)
-            future.add_callback(self._on_send_success)
-            future.add_errback(self._on_send_error)
+            future = self.producer.send(config.KAFKA_TOPIC, value=entropy_hash, key=key, partition=partition)
+            future.add_callback(self._on_send_success, token)
+            future.add_errback(self._on_send_error, token, partition)
+            self.submitted_count += 1
             return True
         except KafkaTimeoutError:
             logger.error("MQ send timeout")
-            self.error_count += 1
-            return False
         except Exception as e:
             logger.error("Err sending to MQ", extra={"error": str(e)}, exc_info=True)
+        with self._unacked_lock:
+            self._unacked.pop(token, None)
             self.error_count += 1
-            return False
+        return False
 
-    def _on_send_success(self, record_metadata):
-        self.send_count += 1
+    def _on_send_success(self, token, record_metadata):
+        with self._unacked_lock:
+            pending = self._unacked.pop(token, None)
+            partition = self.partition_stats.get(record_metadata.partition)
+            if partition is None:
+                partition = self.partition_stats[record_metadata.partition] = [0, 0, 0.0]
+            partition[0] += 1
+            self.send_count += 1
+            if pending is not None:
+                waited = time.monotonic() - pending[1]
+                partition[2] += waited
+                self.ack_seconds_total += waited
+                # A retiring producer's I/O thread can be acking alongside the new one
+                self._producer_ack_seconds.observe(waited)
+        if pending is not None:
+            with _STAGE_ACK_LOCK:
+                self._ack_seconds.observe(waited)
+            if pending[2] is not None:
+                pending[2]()
         logger.debug("Message sent", extra={
             "topic": record_metadata.topic,
             "partition": record_metadata.partition,
             "offset": record_metadata.offset,
         })
 
-    def _on_send_error(self, exc):
-        self.error_count += 1
+    def _on_send_error(self, token, partition, exc):
+        with self._unacked_lock:
+            pending = self._unacked.pop(token, None)
+            if partition is not None:
+                self.partition_stats.setdefault(partition, [0, 0, 0.0])[1] += 1
+            self.error_count += 1
         logger.error("Err sending message", extra={"error": str(exc)})
+        if pending is not None:
+            if self.on_failure:
+                self.on_failure(pending[0])
+            if pending[2] is not None:
+                pending[2]()
+
+    def take_unacked(self) -> List[Tuple[Union[bytes, str], Optional[Callable[[], None]]]]:
+        # (value, on_done) per record still in flight; the caller owns both from here
+        with self._unacked_lock:
+            records = [(value, on_done) for value, _, on_done in self._unacked.values()]
+            self._unacked.clear()
+        return records
+
+    def unacked_count(self) -> int:
+        return len(self._unacked)
+
+    def partitions_for(self, topic: str) -> List[int]:
+        return sorted(self.producer.partitions_for(topic)) if self.producer else []
+
+    def tune(self, linger_ms: int, batch_size: int) -> bool:
+        # KafkaProducer fixes linger_ms and batch_size at construction, so a new producer
+        # takes over and the old one drains and closes on a thread of its own. Records
+        # it still holds keep their tokens here, so their acks and errbacks land as usual
+        old, old_settings = self.producer, (self.linger_ms, self.batch_size)
+        self.linger_ms, self.batch_size = linger_ms, batch_size
+        try:
+            self.producer = self.producer_factory(**self._kafka_config())
+        except Exception as e:
+            self.producer = old
+            self.linger_ms, self.batch_size = old_settings
+            logger.error("Err recreating producer", extra={"producer": self.index, "error": str(e)}, exc_info=True)
+            return False
+        self._retiring = [thread for thread in self._retiring if thread.is_alive()]
+        thread = threading.Thread(target=self._retire, args=(old,), name=f"kafka-retire-{self.index}", daemon=True)
+        thread.start()
+        self._retiring.append(thread)
+        return True
+
+    def _retire(self, producer):
+        try:
+            producer.close(timeout=config.KAFKA_SHUTDOWN_FLUSH_SECONDS)
+        except Exception as e:
+            logger.error("Err closing retired producer", extra={"producer": self.index, "error": str(e)}, exc_info=True)
 
     def flush(self, timeout: Optional[float] = None):
         if self.producer:
@@ -78,10 +178,12 @@ class KafkaEntropyProducer:
             except Exception as e:
                 logger.error("Err flushing producer", extra={"error": str(e)}, exc_info=True)
 
-    def close(self):
+    def close(self, timeout: Optional[float] = 10):
+        for thread in self._retiring:
+            thread.join()
         if self.producer:
             try:
-                self.producer.close(timeout=10)
+                self.producer.close(timeout=timeout)
                 logger.info("Producer closed")
             except Exception as e:
                 logger.error("Err closing producer", extra={"error": str(e)}, exc_info=True)
@@ -91,5 +193,9 @@ class KafkaEntropyProducer:
             "sent": self.send_count,
             "errors": self.error_count,
             "success_rate": (self.send_count / (self.send_count + self.error_count) * 100) 
-                           if (self.send_count + self.error_count) > 0 else 0
+                           if (self.send_count + self.error_count) > 0 else 0,
+            "unacked": self.unacked_count(),
+            "ack_mean_ms": round(self.ack_seconds_total / self.send_count * 1000, 3) if self.send_count else None,
+            "linger_ms": self.linger_ms,
+            "batch_size": self.batch_size,
         }
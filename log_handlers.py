@@ -0,0 +1,114 @@
+# log_handlers.py
+import logging
+import queue
+import threading
+import time
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+from metrics import registry
+import config
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Hands records to a QueueListener thread that formats and writes them. The
+    # caller never blocks: when the queue is full the record is counted and dropped.
+    def __init__(self, max_records: int):
+        super().__init__(queue.Queue(maxsize=max_records))
+        self.dropped_count = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same-process listener, so skip QueueHandler's eager formatting on the caller's thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+_KEY_FIELDS = ("endpoint", "url", "step")
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets the first WARNING-or-above record per (logger, message, endpoint/step) through
+    # each window and swallows repeats; the next one let through carries "suppressed".
+    def __init__(self, window_seconds: float, min_level: int = logging.WARNING):
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.min_level = min_level
+        self.suppressed_count = 0
+        self._windows: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+        self._decided = weakref.WeakKeyDictionary()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level or self.window_seconds <= 0:
+            return True
+        # Decide once per record so the filter can sit on several handlers
+        admitted = self._decided.get(record)
+        if admitted is None:
+            admitted = self._decided[record] = self._admit(record)
+        return admitted
+
+    def _admit(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg,
+               next((getattr(record, field) for field in _KEY_FIELDS if getattr(record, field, None)), None))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.window_seconds:
+                window[1] += 1
+                self.suppressed_count += 1
+                return False
+            if window is not None and window[1]:
+                record.suppressed = window[1]
+            self._windows[key] = [now, 0]
+            if len(self._windows) > 10_000:
+                self._windows = {k: v for k, v in self._windows.items() if now - v[0] < self.window_seconds}
+        return True
+
+
+class EventSummary:
+    # Aggregates a hot-path event into one INFO line per interval instead of one per event
+    def __init__(self, logger: logging.Logger, message: str, interval_seconds: float):
+        self.logger = logger
+        self.message = message
+        self.interval_seconds = interval_seconds
+        self.count = 0
+        self.fields: dict = {}
+        self._since = time.monotonic()
+
+    def add(self, count: int = 1, **fields):
+        self.count += count
+        self.fields = fields
+        if time.monotonic() - self._since >= self.interval_seconds:
+            self.flush()
+
+    def flush(self):
+        now = time.monotonic()
+        if self.count and self.logger.isEnabledFor(logging.INFO):
+            extra = {"count": self.count, "per_second": f"{self.count / max(now - self._since, 1e-9):.1f}"}
+            extra.update(self.fields)
+            self.logger.info(self.message, extra=extra)
+        self.count = 0
+        self._since = now
+
+
+def install_queue_logging(root: logging.Logger, handlers: List[logging.Handler]) -> QueueListener:
+    queue_handler = DroppingQueueHandler(config.LOG_QUEUE_MAX_RECORDS)
+    rate_limit = RateLimitFilter(config.LOG_RATE_LIMIT_SECONDS)
+    queue_handler.addFilter(rate_limit)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    registry.gauge("entropygen_log_dropped_total", "Log records dropped because the log queue was full",
+                   lambda: queue_handler.dropped_count, metric_type="counter")
+    registry.gauge("entropygen_log_suppressed_total", "Repeated warnings and errors swallowed by rate limiting",
+                   lambda: rate_limit.suppressed_count, metric_type="counter")
+    registry.gauge("entropygen_log_queue_depth", "Log records waiting for the writer thread",
+                   queue_handler.queue.qsize)
+    return listener
@@ -1,19 +1,30 @@
 # main.py
 import asyncio
+import atexit
 import logging
 import signal
 import sys
-import hashlib
-from logging.handlers import RotatingFileHandler
-from pythonjsonlogger import jsonlogger
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+from log_handlers import EventSummary, RateLimitFilter, install_queue_logging
 from websocket_manager import WebSocketManager
 from entropy_processor import EntropyProcessor
+from hashing_engine import HashingEngine
 from deduplication_buffer import DeduplicationBuffer
-from kafka_producer import KafkaEntropyProducer
-from memory_monitor import MemoryMonitor
+from sinks import create_sink
+from record_format import DIGEST_SIZE, RecordEncoder
+from memory_monitor import CRITICAL, WARNING, MemoryMonitor
+from metrics import STAGE_SECONDS, MetricsServer, registry
+from hash_backends import split_units
+from profiler import Profiler
+from runtime import loop_name, run
 import config
 
-def setup_logging():
+def setup_logging(log_file: str = None):
+    from logging.handlers import RotatingFileHandler
+    from pythonjsonlogger import jsonlogger
+
     logger = logging.getLogger()
     logger.setLevel(getattr(logging, config.LOG_LEVEL))
     
@@ -23,146 +34,580 @@ def setup_logging():
     
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
     
     file_handler = RotatingFileHandler(
-        'entropy_system.log',
+        log_file or config.LOG_FILE,
         maxBytes=config.LOG_MAX_BYTES,
         backupCount=config.LOG_BACKUP_COUNT
     )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    
+    handlers = [console_handler, file_handler]
+    if config.LOG_ASYNC:
+        # Formatting, writes and rotation happen on the listener thread
+        listener = install_queue_logging(logger, handlers)
+        atexit.register(listener.stop)
+    else:
+        rate_limit = RateLimitFilter(config.LOG_RATE_LIMIT_SECONDS)
+        for handler in handlers:
+            handler.addFilter(rate_limit)
+            logger.addHandler(handler)
     
     return logger
 
-logger = setup_logging()
+logger = logging.getLogger()
+
+MESSAGES = registry.counter("entropygen_messages_total", "Unique frames passed to the batcher", ("endpoint",))
+DUPLICATES = registry.counter("entropygen_duplicates_total", "Frames dropped as duplicates", ("endpoint",))
+DIGESTS = registry.counter("entropygen_digests_total", "64-byte batch digests produced")
+RECORDS = registry.counter("entropygen_sink_records_total", "Records handed to the sink")
+RECORDS_FAILED = registry.counter("entropygen_sink_records_failed_total", "Records the sink did not accept")
 
 class EntropySystem:
-    def __init__(self):
+    def __init__(self, endpoints: Optional[List[str]] = None, dedup_buffer: Optional[DeduplicationBuffer] = None):
         self.entropy_processor = EntropyProcessor()
-        self.dedup_buffer = DeduplicationBuffer(config.DEDUPLICATION_BUFFER_MAX_SIZE_GB)
-        self.kafka_producer = KafkaEntropyProducer()
-        self.websocket_manager = WebSocketManager(self._handle_message)
+        self.hashing_engine = HashingEngine(config.PEPPER_ROUNDS)
+        self.dedup_buffer = dedup_buffer or DeduplicationBuffer(config.DEDUPLICATION_BUFFER_MAX_SIZE_GB)
+        self.sink = create_sink()
+        self.record_encoder = RecordEncoder()
+        self.expander = None
+        if config.OUTPUT_EXPANSION_BYTES_PER_SEED:
+            from drbg import DrbgExpander
+            self.expander = DrbgExpander()
+        self.websocket_manager = WebSocketManager(self._handle_messages, endpoints)
         self.memory_monitor = MemoryMonitor()
+        self.profiler = Profiler()
         self.shutdown_event = asyncio.Event()
         self.message_count = 0
-        self.processing_semaphore = asyncio.Semaphore(config.MESSAGE_PROCESSING_BATCH)
+        self.stats_snapshot = (time.monotonic(), 0, 0)
+        self.metrics_server = MetricsServer() if config.METRICS_PORT else None
+        self.entropy_pool = self.entropy_server = None
+        if config.ENTROPY_SERVER_PORT or config.ENTROPY_SERVER_UNIX_PATH:
+            from entropy_pool import EntropyPool, EntropyServer
+            self.entropy_pool = EntropyPool()
+            self.entropy_server = EntropyServer(self.entropy_pool)
+        self.stats_task = None
+        self.stop_task = None
+        self.hash_log = EventSummary(logger, "Generated entropy hashes", config.LOG_SUMMARY_INTERVAL_SECONDS)
         self.memory_check_task = None
+        self.snapshot_task = None
+        self.output_flush_task = None
+        self.batch_deadline_task = None
+        # Live, so endpoints the manager parses on first use get their own source bit
+        self.endpoints_by_url = self.websocket_manager.registry.by_url
+        self.sink_ready = False
+        self.sink_start_task = None
+        # (records, sources) emitted before the sink was up, SINK_START_CONCURRENT only
+        self.sink_backlog: deque = deque()
+        self.sink_backlog_records = 0
+        self.first_hash_seconds: Optional[float] = None
+        self.stage_seconds = {
+            stage: STAGE_SECONDS.labels(stage)
+            for stage in ("fingerprint", "dedup", "batch_hash", "expand", "sink_enqueue")
+        }
+        self._register_metrics()
+        self._register_memory_relief()
 
-    async def _handle_message(self, endpoint: str, message: str):
-        async with self.processing_semaphore:
-            try:
-                if len(message) == 0:
-                    return
-                
-                message_hash = hashlib.sha256(message.encode('utf-8', errors='ignore')).hexdigest()
-                
-                if not self.dedup_buffer.add(message_hash):
-                    logger.debug("Dupe, excl", extra={"endpoint": endpoint, "hash": message_hash})
-                    return
-                
-                self.message_count += 1
+    def _register_memory_relief(self):
+        monitor = self.memory_monitor
+        manager = self.websocket_manager
+        monitor.track("dedup", lambda: self.dedup_buffer.store.nbytes)
+        monitor.track("queues", lambda: sum(queue.bytes for queue in manager.message_queues.values()))
+        monitor.track("sink", lambda: self.sink.buffered_bytes() + sum(
+            len(record) for records, _ in list(self.sink_backlog) for record in records))
+
+        # Cheapest first: queue bounds, then Bloom dedup history, then whole endpoints
+        monitor.add_relief(
+            "tighten_queues", WARNING,
+            lambda: manager.set_queue_max_bytes(int(config.MESSAGE_QUEUE_MAX_BYTES * config.MEMORY_QUEUE_SHRINK_FACTOR)),
+            lambda: manager.set_queue_max_bytes(config.MESSAGE_QUEUE_MAX_BYTES),
+        )
+        if self.dedup_buffer.backend == "bloom":
+            monitor.add_relief(
+                "shrink_dedup", WARNING,
+                lambda: self.dedup_buffer.resize(
+                    int(self.dedup_buffer.configured_max_entries * config.MEMORY_DEDUP_SHRINK_FACTOR)),
+                lambda: self.dedup_buffer.resize(self.dedup_buffer.configured_max_entries),
+            )
+        if config.MEMORY_SHED_ENDPOINTS:
+            monitor.add_relief(
+                "shed_endpoints", CRITICAL,
+                lambda: manager.pause_endpoints(config.MEMORY_SHED_ENDPOINTS),
+                manager.resume_endpoints,
+            )
+
+    def _register_metrics(self):
+        manager = self.websocket_manager
+
+        def queues(field):
+            return lambda: {(url,): queue.get_stats()[field] for url, queue in manager.message_queues.items()}
+
+        def duplicate_ratio():
+            ratios = {}
+            for key, messages in MESSAGES.items():
+                duplicates = DUPLICATES.value(*key)
+                total = messages.value + duplicates
+                ratios[key] = duplicates / total if total else 0.0
+            return ratios
+
+        registry.gauge("entropygen_queue_depth", "Frames waiting per endpoint queue", queues("depth"), ("endpoint",))
+        registry.gauge("entropygen_queue_bytes", "Frame bytes waiting per endpoint queue", queues("bytes"), ("endpoint",))
+        registry.gauge("entropygen_queue_dropped_total", "Frames dropped by the queue policy", queues("dropped"),
+                       ("endpoint",), metric_type="counter")
+        registry.gauge("entropygen_duplicate_ratio", "Share of frames dropped as duplicates", duplicate_ratio,
+                       ("endpoint",))
+        sources = manager.scheduler.sources
+        registry.gauge("entropygen_scheduler_frames_total", "Frames admitted or shed by the scheduler",
+                       lambda: {key: value for url, state in sources.items() for key, value in (
+                           ((url, "admitted"), state.admitted),
+                           ((url, "shed_rate"), state.shed_rate),
+                           ((url, "shed_overload"), state.shed_overload),
+                       )}, ("endpoint", "outcome"), metric_type="counter")
+        health = manager.connection_scheduler.health
+
+        def endpoint_health(fn):
+            return lambda: {(url,): fn(state, time.perf_counter()) for url, state in health.items()}
+
+        registry.gauge("entropygen_endpoint_reconnects_total", "Connection attempts after the first successful connect",
+                       endpoint_health(lambda state, now: state.reconnects), ("endpoint",), metric_type="counter")
+        registry.gauge("entropygen_endpoint_errors_total", "Connection attempts or sessions that ended in an error",
+                       endpoint_health(lambda state, now: state.errors), ("endpoint",), metric_type="counter")
+        registry.gauge("entropygen_endpoint_downtime_seconds_total", "Time spent disconnected",
+                       endpoint_health(lambda state, now: state.total_downtime(now)), ("endpoint",),
+                       metric_type="counter")
+        registry.gauge("entropygen_endpoint_health_score", "Availability times error-free attempt share, 0 while demoted",
+                       endpoint_health(lambda state, now: state.score(now)), ("endpoint",))
+        registry.gauge("entropygen_endpoint_first_frame_seconds", "Time from connect to first frame, last connection",
+                       endpoint_health(lambda state, now: state.first_frame_seconds or 0.0), ("endpoint",))
+        registry.gauge("entropygen_endpoint_demoted", "1 while the endpoint is demoted",
+                       endpoint_health(lambda state, now: int(now < state.demoted_until)), ("endpoint",))
+        registry.gauge("entropygen_scheduler_weight", "Deficit round-robin weight per endpoint",
+                       lambda: {(url,): state.weight for url, state in sources.items()}, ("endpoint",))
+        registry.gauge("entropygen_connection_up", "1 while the endpoint socket is open",
+                       lambda: {(url,): int(up) for url, up in manager.get_connection_status().items()},
+                       ("endpoint",))
+        registry.gauge("entropygen_busy_consumers", "Consumer tasks currently processing",
+                       lambda: manager.busy_consumers)
+        registry.gauge("entropygen_batcher_buffered", "Messages waiting for a full batch",
+                       self.entropy_processor.get_buffer_size)
+        registry.gauge("entropygen_batcher_age_seconds", "Age of the oldest message waiting for a batch",
+                       self.entropy_processor.get_buffer_age)
+        registry.gauge("entropygen_hash_inflight_jobs", "Hashing jobs handed to the pool",
+                       lambda: self.hashing_engine.get_stats()['inflight_jobs'])
+        registry.gauge("entropygen_dedup_entries", "Fingerprints held by the dedup store",
+                       lambda: self.dedup_buffer.get_stats()['entries'])
+        registry.gauge("entropygen_dedup_fill_ratio", "Dedup store fill as a fraction of capacity",
+                       lambda: self.dedup_buffer.get_stats()['fill_percent'] / 100)
+        registry.gauge("entropygen_sink_sent_total", "Records the sink reports as sent",
+                       lambda: self.sink.get_stats()['sent'], metric_type="counter")
+        registry.gauge("entropygen_sink_errors_total", "Records the sink reports as failed",
+                       lambda: self.sink.get_stats()['errors'], metric_type="counter")
+        registry.gauge("entropygen_kafka_spool_depth", "Records waiting in the Kafka spool",
+                       lambda: self.sink.get_stats().get('spool_depth'))
+        registry.gauge("entropygen_process_rss_bytes", "Resident set size",
+                       lambda: self.memory_monitor.process.memory_info().rss)
+        if self.entropy_pool:
+            self._register_pool_metrics()
+        if self.sink.name == "kafka":
+            self._register_kafka_metrics()
+        registry.gauge("entropygen_first_hash_seconds", "Process start to the first batch digest",
+                       lambda: self.first_hash_seconds)
+        if self.expander:
+            registry.gauge("entropygen_expansion_output_bytes_total", "DRBG bytes generated from batch digests",
+                           lambda: self.expander.output_bytes, metric_type="counter")
+        registry.gauge("entropygen_memory_usage_bytes", "Working set counted against the memory limit",
+                       lambda: self.memory_monitor.check_memory()['usage_mb'] * 1024 * 1024)
+        registry.gauge("entropygen_memory_limit_bytes", "Container (cgroup) or configured memory limit",
+                       lambda: self.memory_monitor.memory.limit)
+        registry.gauge("entropygen_memory_component_bytes", "Bytes held per tracked component",
+                       lambda: {(name,): nbytes() for name, nbytes in self.memory_monitor.components.items()},
+                       ("component",))
+        registry.gauge("entropygen_memory_relief_active", "1 while a memory relief step is applied",
+                       lambda: {(step.name,): int(step.applied_at is not None) for step in self.memory_monitor.steps},
+                       ("step",))
+
+    def _register_kafka_metrics(self):
+        # The producer pool only exists once the sink has started
+        def pool():
+            return self.sink.delivery.producer if self.sink.delivery else None
+
+        def per_producer(fn):
+            return lambda: {(str(producer.index),): fn(producer, rate)
+                            for producer, rate in (zip(pool().producers, pool().rates) if pool() else ())}
+
+        def per_partition(index):
+            return lambda: {(str(partition),): counts[index]
+                            for partition, counts in (pool().partition_totals().items() if pool() else ())}
+
+        registry.gauge("entropygen_kafka_producer_records_total", "Records acked per pooled producer",
+                       per_producer(lambda producer, rate: producer.send_count), ("producer",), metric_type="counter")
+        registry.gauge("entropygen_kafka_producer_errors_total", "Records failed per pooled producer",
+                       per_producer(lambda producer, rate: producer.error_count), ("producer",), metric_type="counter")
+        registry.gauge("entropygen_kafka_producer_records_per_second", "Send rate per pooled producer, last interval",
+                       per_producer(lambda producer, rate: rate), ("producer",))
+        registry.gauge("entropygen_kafka_producer_linger_ms", "Current linger_ms per pooled producer",
+                       per_producer(lambda producer, rate: producer.linger_ms), ("producer",))
+        registry.gauge("entropygen_kafka_producer_batch_size_bytes", "Current batch_size per pooled producer",
+                       per_producer(lambda producer, rate: producer.batch_size), ("producer",))
+        registry.gauge("entropygen_kafka_partition_records_total", "Records acked per partition",
+                       per_partition(0), ("partition",), metric_type="counter")
+        registry.gauge("entropygen_kafka_partition_errors_total", "Records failed per partition",
+                       per_partition(1), ("partition",), metric_type="counter")
+        registry.gauge("entropygen_kafka_partition_ack_seconds_total", "Summed send to ack time per partition",
+                       per_partition(2), ("partition",), metric_type="counter")
+
+    def _register_pool_metrics(self):
+        pool = self.entropy_pool
+        registry.gauge("entropygen_pool_bytes", "Bytes waiting in the entropy pool", lambda: pool.size)
+        registry.gauge("entropygen_pool_capacity_bytes", "Entropy pool capacity", lambda: pool.capacity)
+        registry.gauge("entropygen_pool_refill_bytes_per_second", "Pool refill rate over the last window",
+                       pool.refill_rate)
+        registry.gauge("entropygen_pool_filled_bytes_total", "Bytes added to the pool",
+                       lambda: pool.filled_bytes, metric_type="counter")
+        registry.gauge("entropygen_pool_overflow_bytes_total", "Digest bytes that did not fit in the pool",
+                       lambda: pool.overflow_bytes, metric_type="counter")
+        registry.gauge("entropygen_pool_served_bytes_total", "Bytes served to API clients",
+                       lambda: {("pool",): pool.served_bytes, ("drbg",): pool.drbg_bytes}, ("source",),
+                       metric_type="counter")
+        registry.gauge("entropygen_pool_empty_total", "Requests that found too few bytes in the pool",
+                       lambda: pool.empty_count, metric_type="counter")
+        registry.gauge("entropygen_pool_connections", "Open entropy API connections",
+                       lambda: self.entropy_server.active_connections)
+
+    async def _handle_messages(self, endpoint: str, messages: List[bytes]):
+        try:
+            messages = [message for message in messages if len(message) > 0]
+            if not messages:
+                return
+            
+            started = time.perf_counter()
+            digests = await self.hashing_engine.fingerprint_many(messages)
+            fingerprinted = time.perf_counter()
+            self.stage_seconds["fingerprint"].observe(fingerprinted - started)
+            
+            known = self.endpoints_by_url.get(endpoint)
+            source = known.index if known is not None else 0
+            debug = logger.isEnabledFor(logging.DEBUG)
+            batches = []
+            unique = 0
+            for message, message_digest, added in zip(messages, digests, self.dedup_buffer.add_many(digests)):
+                if not added:
+                    if debug:
+                        logger.debug("Dupe, excl", extra={"endpoint": endpoint, "hash": message_digest.hex()})
+                    continue
                 
-                entropy_hash = self.entropy_processor.add_message(message)
+                unique += 1
                 
-                if entropy_hash:
-                    success = self.kafka_producer.send(entropy_hash)
-                    if success:
-                        logger.info("Generated and sent entropy hash", extra={"hash_prefix": f"{entropy_hash[:16]}..."})
-                    else:
-                        logger.error("Failed to send entropy hash to Kafka", extra={"hash": entropy_hash})
+                collected = self.entropy_processor.collect(message, source)
+                if collected:
+                    batches.append(collected)
+            
+            self.message_count += unique
+            MESSAGES.labels(endpoint).inc(unique)
+            DUPLICATES.labels(endpoint).inc(len(messages) - unique)
+            self.stage_seconds["dedup"].observe(time.perf_counter() - fingerprinted)
+            
+            if batches:
+                await self._hash_batches(batches)
                 
-                if self.message_count % config.STATS_LOG_INTERVAL_MESSAGES == 0:
-                    await self._log_stats()
-                    
+        except Exception as e:
+            logger.error("Err handling message", extra={"endpoint": endpoint, "error": str(e)}, exc_info=True)
+
+    async def _hash_batches(self, batches: List[Tuple[List[bytes], int]]):
+        started = time.perf_counter()
+        digests = await self.hashing_engine.hash_batches([batch for batch, _ in batches])
+        self.stage_seconds["batch_hash"].observe(time.perf_counter() - started)
+        if self.first_hash_seconds is None:
+            self.first_hash_seconds = time.time() - self.memory_monitor.process.create_time()
+            logger.info("First entropy hash", extra={
+                "seconds_since_process_start": round(self.first_hash_seconds, 3), "event_loop": loop_name(),
+            })
+        DIGESTS.inc(len(digests))
+        self.hash_log.add(len(digests), hash_prefix=f"{digests[-1][:8].hex()}...")
+        sources = [sources for _, sources in batches]
+        if self.hashing_engine.backend.output_bytes > DIGEST_SIZE:
+            digests, sources = split_units(digests, sources, DIGEST_SIZE)
+        if self.expander:
+            started = time.perf_counter()
+            digests, sources = self.expander.expand_many(digests, sources)
+            self.stage_seconds["expand"].observe(time.perf_counter() - started)
+        if self.entropy_pool:
+            digests, sources = self._fill_pool(digests, sources)
+        await self._emit(*self.record_encoder.encode(digests, sources))
+
+    def _fill_pool(self, digests: List[bytes], sources: List[int]) -> Tuple[List[bytes], List[int]]:
+        # Pooled digests are served locally; with ENTROPY_POOL_EXCLUSIVE only the overflow reaches the sink
+        fill = self.entropy_pool.fill
+        if not config.ENTROPY_POOL_EXCLUSIVE:
+            for digest in digests:
+                fill(digest)
+            return digests, sources
+        kept = [(digest, source) for digest, source in zip(digests, sources) if not fill(digest)]
+        return [digest for digest, _ in kept], [source for _, source in kept]
+
+    async def _batch_deadline_loop(self):
+        # Emits partial batches once they reach MESSAGE_BATCH_MAX_AGE_SECONDS
+        max_age = self.entropy_processor.policy.max_age_seconds
+        while not self.shutdown_event.is_set():
+            try:
+                deadline = self.entropy_processor.next_deadline()
+                delay = max_age if deadline is None else deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                collected = self.entropy_processor.collect_due()
+                if collected:
+                    await self._hash_batches([collected])
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Err emitting due batch", extra={"error": str(e)}, exc_info=True)
+                await asyncio.sleep(max_age)
+
+    async def _emit(self, records: List[bytes], sources: List[int]):
+        if not records:
+            return
+        if not self.sink_ready:
+            self._hold(records, sources)
+            return
+        await self._send(records, sources)
+
+    def _hold(self, records: List[bytes], sources: List[int]):
+        if self.sink_backlog_records + len(records) > config.SINK_START_BUFFER_RECORDS:
+            RECORDS_FAILED.inc(len(records))
+            logger.error("Sink not ready, dropping records", extra={"dropped": len(records)})
+            return
+        self.sink_backlog.append((records, sources))
+        self.sink_backlog_records += len(records)
+
+    async def _start_sink(self):
+        # Runs alongside the socket connects with SINK_START_CONCURRENT; _emit holds
+        # records until the sink is up, then they go out ahead of anything newer
+        started = time.perf_counter()
+        try:
+            await self.sink.start()
+        except Exception as e:
+            logger.critical("Err starting sink", extra={"sink": self.sink.name, "error": str(e)}, exc_info=True)
+            asyncio.create_task(self.stop())
+            return
+        while self.sink_backlog:
+            records, sources = self.sink_backlog.popleft()
+            self.sink_backlog_records -= len(records)
+            await self._send(records, sources)
+        self.sink_ready = True
+        logger.info("Sink ready", extra={"sink": self.sink.name, "seconds": round(time.perf_counter() - started, 3)})
+
+    async def _send(self, records: List[bytes], sources: List[int]):
+        started = time.perf_counter()
+        sent = await self.sink.send_many(records, sources)
+        self.stage_seconds["sink_enqueue"].observe(time.perf_counter() - started)
+        RECORDS.inc(sent)
+        if sent < len(records):
+            RECORDS_FAILED.inc(len(records) - sent)
+            logger.error("Failed to send entropy records to sink", extra={"failed": len(records) - sent})
+
+    async def _output_flush_loop(self):
+        # Bounds how long a partially filled packed record can wait
+        while not self.shutdown_event.is_set():
+            try:
+                await asyncio.sleep(config.OUTPUT_PACK_MAX_DELAY_SECONDS)
+                await self._emit(*self.record_encoder.flush())
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                logger.error("Err handling message", extra={"endpoint": endpoint, "error": str(e)}, exc_info=True)
+                logger.error("Err flushing output records", extra={"error": str(e)}, exc_info=True)
 
     async def _log_stats(self):
+        self.hash_log.flush()
         try:
             dedup_stats = self.dedup_buffer.get_stats()
-            kafka_stats = self.kafka_producer.get_stats()
+            sink_stats = self.sink.get_stats()
             status = self.websocket_manager.get_connection_status()
             queue_sizes = self.websocket_manager.get_queue_sizes()
+            pipeline_stats = self.websocket_manager.get_pipeline_stats()
             memory_stats = self.memory_monitor.check_memory()
             
             active_connections = sum(1 for v in status.values() if v)
             total_queue_size = sum(queue_sizes.values())
             buffer_size = self.entropy_processor.get_buffer_size()
+            hashing_stats = self.hashing_engine.get_stats()
+            
+            now = time.monotonic()
+            logged_at, messages_then, frames_then = self.stats_snapshot
+            elapsed = max(now - logged_at, 1e-9)
+            self.stats_snapshot = (now, self.message_count, pipeline_stats['consumed_frames'])
             
             logger.info("STATS", extra={
                 "messages": self.message_count,
+                "messages_per_second": f"{(self.message_count - messages_then) / elapsed:.1f}",
+                "frames_per_second": f"{(pipeline_stats['consumed_frames'] - frames_then) / elapsed:.1f}",
                 "connections_active": active_connections,
                 "connections_total": len(status),
                 "dedup_entries": dedup_stats['entries'],
-                "dedup_mb": f"{dedup_stats['estimated_mb']:.2f}",
+                "dedup_mb": f"{dedup_stats['mb']:.2f}",
                 "dedup_fill_percent": f"{dedup_stats['fill_percent']:.1f}",
-                "kafka_sent": kafka_stats['sent'],
-                "kafka_success_rate": f"{kafka_stats['success_rate']:.1f}",
+                "sink": sink_stats['sink'],
+                "sink_sent": sink_stats['sent'],
+                "sink_success_rate": f"{sink_stats['success_rate']:.1f}",
                 "queue_size": total_queue_size,
+                "queue_bytes": pipeline_stats['queued_bytes'],
+                "queue_dropped": sum(q['dropped'] for q in pipeline_stats['queues'].values()),
+                "busy_consumers": pipeline_stats['busy_consumers'],
+                "scheduler_shed": sum(state.shed_rate + state.shed_overload
+                                      for state in self.websocket_manager.scheduler.sources.values()),
+                "filtered_frames": pipeline_stats['filtered_frames'],
+                "filtered_bytes": pipeline_stats['filtered_bytes'],
                 "buffer_size": buffer_size,
+                "batch_triggers": self.entropy_processor.get_stats()['batch_triggers'],
+                "hash_jobs": hashing_stats['jobs'],
+                "hash_inflight_jobs": hashing_stats['inflight_jobs'],
                 "memory_rss_mb": f"{memory_stats['rss_mb']:.2f}",
+                "memory_usage_mb": f"{memory_stats['usage_mb']:.2f}",
+                "memory_limit_mb": f"{memory_stats['limit_mb']:.0f}",
                 "memory_percent": f"{memory_stats['percent']:.2f}",
+                "memory_relief": ",".join(self.memory_monitor.get_stats()['relief_applied']),
             })
-            
-            if memory_stats['status'] == 'critical':
-                logger.critical("CRITICAL MEM USAGE - Forcing cleanup", extra=memory_stats)
-                self.memory_monitor.force_gc()
-                self.entropy_processor.clear_buffer()
-                
         except Exception as e:
             logger.error("Err logging stats", extra={"error": str(e)}, exc_info=True)
 
+    def get_summary(self) -> dict:
+        # Flat counters a supervisor can sum across workers
+        pipeline_stats = self.websocket_manager.get_pipeline_stats()
+        sink_stats = self.sink.get_stats()
+        return {
+            "messages": self.message_count,
+            "frames": pipeline_stats['consumed_frames'],
+            "duplicates": self.dedup_buffer.duplicate_count,
+            "dedup_lock_timeouts": self.dedup_buffer.lock_timeout_count,
+            "digests": self.record_encoder.digest_count,
+            "sink_sent": sink_stats['sent'],
+            "sink_errors": sink_stats['errors'],
+            "queue_bytes": pipeline_stats['queued_bytes'],
+            "queue_dropped": sum(q['dropped'] for q in pipeline_stats['queues'].values()),
+            "connections_active": sum(1 for up in self.websocket_manager.get_connection_status().values() if up),
+        }
+
+    async def _stats_loop(self):
+        while not self.shutdown_event.is_set():
+            try:
+                await asyncio.sleep(config.STATS_LOG_INTERVAL_SECONDS)
+                await self._log_stats()
+            except asyncio.CancelledError:
+                break
+
     async def _memory_check_loop(self):
         while not self.shutdown_event.is_set():
             try:
-                memory_stats = self.memory_monitor.check_memory()
-                
-                if memory_stats['status'] == 'critical':
-                    self.memory_monitor.force_gc()
-                    self.entropy_processor.clear_buffer()
-                
+                await self.memory_monitor.govern()
                 await asyncio.sleep(config.MEMORY_CHECK_INTERVAL_SECONDS)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error("Err in mem check loop", extra={"error": str(e)}, exc_info=True)
 
-    async def start(self):
-        logger.info("Starting EntropyGen")
-        logger.info("Monitoring sockets", extra={"count": len(config.WEBSOCKET_ENDPOINTS)})
-        
+    async def _snapshot_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self.shutdown_event.is_set():
+            try:
+                await asyncio.sleep(config.DEDUPLICATION_SNAPSHOT_INTERVAL_SECONDS)
+                await loop.run_in_executor(None, self.dedup_buffer.checkpoint)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Err checkpointing dedup snapshot", extra={"error": str(e)}, exc_info=True)
+
+    async def start_pipeline(self):
+        # Everything downstream of the sockets; replay.py feeds _handle_messages directly
         loop = asyncio.get_running_loop()
         for sig in (signal.SIGTERM, signal.SIGINT):
             loop.add_signal_handler(sig, lambda: asyncio.create_task(self.stop()))
         
+        if config.SINK_START_CONCURRENT:
+            self.sink_start_task = asyncio.create_task(self._start_sink())
+        else:
+            await self.sink.start()
+            self.sink_ready = True
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.entropy_server:
+            await self.entropy_server.start()
+        if self.record_encoder.output_format == "packed":
+            self.output_flush_task = asyncio.create_task(self._output_flush_loop())
+        if self.entropy_processor.policy.max_age_seconds:
+            self.batch_deadline_task = asyncio.create_task(self._batch_deadline_loop())
+        
+        await self.profiler.start()
+        self.stats_task = asyncio.create_task(self._stats_loop())
         self.memory_check_task = asyncio.create_task(self._memory_check_loop())
+        if config.DEDUPLICATION_SNAPSHOT_PATH:
+            self.snapshot_task = asyncio.create_task(self._snapshot_loop())
+        self.memory_monitor.tune_gc()
+
+    async def start(self):
+        logger.info("Starting EntropyGen", extra={"event_loop": loop_name()})
+        logger.info("Monitoring sockets", extra={"count": len(config.WEBSOCKET_ENDPOINTS)})
         
+        await self.start_pipeline()
         await self.websocket_manager.start()
         
         await self.shutdown_event.wait()
 
     async def stop(self):
+        # Signal handlers and the caller of start() may both ask; shut down once
+        if self.stop_task is None:
+            self.stop_task = asyncio.ensure_future(self._shutdown())
+        await asyncio.shield(self.stop_task)
+
+    async def _shutdown(self):
         logger.info("Shutting down EntropyGen")
         self.shutdown_event.set()
         
-        if self.memory_check_task and not self.memory_check_task.done():
-            self.memory_check_task.cancel()
-            try:
-                await self.memory_check_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.stats_task, self.memory_check_task, self.snapshot_task, self.output_flush_task,
+                     self.batch_deadline_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         
         await self.websocket_manager.stop()
+        if self.entropy_server:
+            await self.entropy_server.close()
+        await self.profiler.close()
+        
+        try:
+            collected = self.entropy_processor.collect_due(flush=True)
+            if collected:
+                await self._hash_batches([collected])
+        except Exception as e:
+            logger.error("Err flushing partial batch", extra={"error": str(e)}, exc_info=True)
+        self.hashing_engine.close()
         
-        self.kafka_producer.flush(timeout=5.0)
-        self.kafka_producer.close()
+        if self.sink_start_task and not self.sink_start_task.done():
+            # Lets a sink that is still connecting come up and take the held records
+            try:
+                await asyncio.wait_for(self.sink_start_task, config.SINK_START_SHUTDOWN_SECONDS)
+            except asyncio.TimeoutError:
+                logger.error("Sink still starting at shutdown", extra={"seconds": config.SINK_START_SHUTDOWN_SECONDS})
+        await self._emit(*self.record_encoder.flush())
+        if not self.sink_ready and self.sink_backlog_records:
+            logger.error("Sink never started, held records lost", extra={"records": self.sink_backlog_records})
+        await self.sink.close()
         
         await self._log_stats()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        
+        self.dedup_buffer.close()
         
         logger.info("EntropyGen shutdown")
 
 async def main():
+    if config.WORKER_PROCESSES > 1:
+        from supervisor import Supervisor
+        await Supervisor(config.WORKER_PROCESSES).run()
+        return
+    
     system = EntropySystem()
     try:
         await system.start()
@@ -174,7 +619,8 @@ async def main():
         await system.stop()
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        asyncio.run(main())
+        run(main())
     except KeyboardInterrupt:
         logger.info("Shutdown complete")
@@ -2,39 +2,244 @@
 import psutil
 import logging
 import gc
+import os
+import time
+from typing import Callable, Dict, List, Optional
+from metrics import registry
 import config
 
 logger = logging.getLogger(__name__)
 
+NORMAL = 0
+WARNING = 1
+CRITICAL = 2
+_STATUS = {NORMAL: "normal", WARNING: "warning", CRITICAL: "critical"}
+_UNLIMITED = 1 << 60
+
+GC_PAUSE_SECONDS = registry.histogram(
+    "entropygen_gc_pause_seconds", "Cyclic garbage collector pauses", ("generation",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if value == "max":
+        return _UNLIMITED
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _read_stat(path: str, key: str) -> int:
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(" ")
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _cgroup_dirs() -> List[str]:
+    # The process's own cgroup directory if it is visible, else the namespace root
+    v2_path = v1_path = None
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                _, controllers, path = line.rstrip("\n").split(":", 2)
+                if controllers == "":
+                    v2_path = path
+                elif "memory" in controllers.split(","):
+                    v1_path = path
+    except OSError:
+        return []
+
+    candidates = []
+    if v1_path is not None:
+        candidates += [f"/sys/fs/cgroup/memory{v1_path}", "/sys/fs/cgroup/memory"]
+    if v2_path is not None:
+        candidates += [f"/sys/fs/cgroup{v2_path}", "/sys/fs/cgroup"]
+    return [path for path in candidates if os.path.isdir(path)]
+
+
+class CgroupMemory:
+    # Limit and working set (usage minus reclaimable file cache, as the OOM killer and
+    # kubelet see it) from cgroup v2 or v1. Falls back to host RAM and process RSS.
+    def __init__(self):
+        self.source = "host"
+        self.limit = psutil.virtual_memory().total
+        self._usage_path = self._stat_path = self._inactive_key = None
+
+        for directory in _cgroup_dirs():
+            if os.path.exists(os.path.join(directory, "memory.max")):
+                # Both "max" (or unreadable) is the normal no-limit case
+                limit = min(filter(None, (_read_int(os.path.join(directory, "memory.max")),
+                                          _read_int(os.path.join(directory, "memory.high")))), default=None)
+                usage_path, inactive_key, source = "memory.current", "inactive_file", "cgroup_v2"
+            elif os.path.exists(os.path.join(directory, "memory.limit_in_bytes")):
+                limit = _read_int(os.path.join(directory, "memory.limit_in_bytes"))
+                usage_path, inactive_key, source = "memory.usage_in_bytes", "total_inactive_file", "cgroup_v1"
+            else:
+                continue
+            if limit and limit < min(self.limit, _UNLIMITED):
+                self.limit = limit
+                self.source = source
+                self._usage_path = os.path.join(directory, usage_path)
+                self._stat_path = os.path.join(directory, "memory.stat")
+                self._inactive_key = inactive_key
+                break
+
+        if config.MEMORY_LIMIT_BYTES:
+            self.limit = config.MEMORY_LIMIT_BYTES
+            self.source = "config"
+
+    def usage(self, rss: int) -> int:
+        if self._usage_path is None:
+            return rss
+        usage = _read_int(self._usage_path)
+        if usage is None:
+            return rss
+        return max(0, usage - _read_stat(self._stat_path, self._inactive_key))
+
+
+class ReliefStep:
+    __slots__ = ("name", "level", "apply", "restore", "applied_at")
+
+    def __init__(self, name: str, level: int, apply: Callable, restore: Optional[Callable]):
+        self.name = name
+        self.level = level
+        self.apply = apply
+        self.restore = restore
+        self.applied_at: Optional[float] = None
+
+
 class MemoryMonitor:
+    # Governs memory against the container limit rather than host RAM. Components
+    # register their footprint and relief steps; while usage is above a threshold
+    # the next step for that level is applied once per check, and steps are undone
+    # newest first after usage has stayed below the warning threshold for a while.
     def __init__(self):
         self.process = psutil.Process()
         self.threshold_percent = config.MEMORY_THRESHOLD_PERCENT
         self.critical_percent = config.MEMORY_CRITICAL_PERCENT
+        self.memory = CgroupMemory()
+        self.components: Dict[str, Callable[[], int]] = {}
+        self.steps: List[ReliefStep] = []
+        self.level = NORMAL
+        self.calm_since: Optional[float] = None
+        self.relief_count = 0
+        self._gc_started: Optional[float] = None
+        self._gc_callback_installed = False
+
+        logger.info("Memory limit detected", extra={
+            "source": self.memory.source, "limit_mb": round(self.memory.limit / (1024 * 1024), 1),
+        })
+
+    def track(self, name: str, nbytes: Callable[[], int]):
+        self.components[name] = nbytes
+
+    def add_relief(self, name: str, level: int, apply: Callable, restore: Optional[Callable] = None):
+        # Steps run in registration order; apply/restore may be coroutine functions
+        self.steps.append(ReliefStep(name, level, apply, restore))
+
+    def tune_gc(self):
+        # Call once startup allocations are done: frozen objects are never scanned again
+        if config.GC_FREEZE_AFTER_STARTUP:
+            gc.collect()
+            gc.freeze()
+        if config.GC_THRESHOLDS:
+            gc.set_threshold(*config.GC_THRESHOLDS)
+        if not self._gc_callback_installed:
+            gc.callbacks.append(self._on_gc)
+            self._gc_callback_installed = True
+        logger.info("GC tuned", extra={"frozen": gc.get_freeze_count(), "thresholds": gc.get_threshold()})
+
+    def _on_gc(self, phase: str, info: dict):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            GC_PAUSE_SECONDS.labels(info["generation"]).observe(time.perf_counter() - self._gc_started)
+            self._gc_started = None
 
     def check_memory(self) -> dict:
         memory_info = self.process.memory_info()
-        memory_percent = self.process.memory_percent()
-        
+        usage = self.memory.usage(memory_info.rss)
+        memory_percent = usage / self.memory.limit * 100
+
+        if memory_percent >= self.critical_percent:
+            level = CRITICAL
+        elif memory_percent >= self.threshold_percent:
+            level = WARNING
+        else:
+            level = NORMAL
+
         stats = {
             "rss_mb": memory_info.rss / (1024 * 1024),
             "vms_mb": memory_info.vms / (1024 * 1024),
+            "usage_mb": usage / (1024 * 1024),
+            "limit_mb": self.memory.limit / (1024 * 1024),
+            "limit_source": self.memory.source,
             "percent": memory_percent,
-            "status": "normal"
+            "status": _STATUS[level],
         }
-        
-        if memory_percent >= self.critical_percent:
-            stats["status"] = "critical"
-            logger.critical("Mem use critical", extra={"percent": f"{memory_percent:.2f}"})
-            gc.collect()
-        elif memory_percent >= self.threshold_percent:
-            stats["status"] = "warning"
-            logger.warning("Mem use high", extra={"percent": f"{memory_percent:.2f}"})
-            gc.collect()
-        
+        for name, nbytes in self.components.items():
+            try:
+                stats[f"{name}_mb"] = nbytes() / (1024 * 1024)
+            except Exception as e:
+                logger.debug("Err sizing component", extra={"component": name, "error": str(e)})
         return stats
 
-    def force_gc(self):
-        collected = gc.collect()
-        logger.info("Forced garbage collection", extra={"collected_objects": collected})
-        return collected
+    async def govern(self) -> dict:
+        stats = self.check_memory()
+        level = {"normal": NORMAL, "warning": WARNING, "critical": CRITICAL}[stats["status"]]
+        if level != self.level:
+            log = logger.critical if level == CRITICAL else logger.warning if level == WARNING else logger.info
+            log("Mem level changed", extra={"from": _STATUS[self.level], **stats})
+            self.level = level
+
+        now = time.monotonic()
+        if level > NORMAL:
+            self.calm_since = None
+            step = next((step for step in self.steps if step.applied_at is None and step.level <= level), None)
+            if step is not None:
+                await self._run(step, step.apply, logging.WARNING, "Applying memory relief", stats)
+                step.applied_at = now
+                self.relief_count += 1
+            return stats
+
+        if self.calm_since is None:
+            self.calm_since = now
+        elif now - self.calm_since >= config.MEMORY_RECOVERY_SECONDS:
+            applied = [step for step in self.steps if step.applied_at is not None]
+            if applied:
+                step = max(applied, key=lambda step: step.applied_at)
+                if step.restore is not None:
+                    await self._run(step, step.restore, logging.INFO, "Lifting memory relief", stats)
+                step.applied_at = None
+                self.calm_since = now
+        return stats
+
+    async def _run(self, step: ReliefStep, action: Callable, level: int, message: str, stats: dict):
+        logger.log(level, message, extra={"step": step.name, "percent": f"{stats['percent']:.1f}"})
+        try:
+            result = action()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception as e:
+            logger.error("Err in memory relief step", extra={"step": step.name, "error": str(e)}, exc_info=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "memory_level": _STATUS[self.level],
+            "memory_limit_source": self.memory.source,
+            "relief_applied": [step.name for step in self.steps if step.applied_at is not None],
+            "relief_count": self.relief_count,
+        }
@@ -0,0 +1,350 @@
+# profiler.py
+# Runtime instrumentation that can be switched on in a live process, so a slow
+# worker can be inspected without a restart losing its dedup state:
+#   SIGUSR1 toggles stack sampling, SIGUSR2 takes a tracemalloc snapshot (the
+#   first one starts tracing). PROFILE_CONTROL_SOCKET accepts the same as text
+#   commands. Results are written to PROFILE_DIRECTORY.
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, List, Optional
+from metrics import STAGE_SECONDS, registry
+import config
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = registry.histogram(
+    "entropygen_loop_lag_seconds", "How late the event loop ran a timer callback",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}"
+
+
+def _stack(frame) -> List[str]:
+    # Outermost call first
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _component(filename: str) -> str:
+    # Repo modules by name, installed packages by top-level package, the rest is the standard library
+    if filename.startswith(_ROOT + os.sep) and os.sep not in filename[len(_ROOT) + 1:]:
+        return os.path.splitext(os.path.basename(filename))[0]
+    parts = filename.split(os.sep)
+    if "site-packages" in parts:
+        index = parts.index("site-packages") + 1
+        return os.path.splitext(parts[index])[0] if index < len(parts) else "site-packages"
+    return "stdlib" if filename.startswith(sys.prefix) or filename.startswith(sys.base_prefix) else "other"
+
+
+class StackSampler:
+    # Samples every thread's stack at PROFILE_SAMPLE_HZ from a daemon thread and keeps
+    # collapsed stacks ("thread;module:function;..." -> samples), the input format of
+    # flamegraph tools. Cost is one sys._current_frames() walk per tick. The sampler
+    # needs the GIL to run, so short bursts between loop wakeups are under-counted;
+    # anything that holds the loop for longer than the switch interval shows up.
+    def __init__(self, hz: float):
+        self.interval = 1.0 / hz
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+
+    def start(self):
+        self.samples.clear()
+        self.sample_count = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return time.time() - self.started_at
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self):
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if any(ident not in names for ident in frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                self.samples[";".join([names.get(ident, str(ident))] + _stack(frame))] += 1
+            self.sample_count += 1
+
+
+class LoopLagMonitor:
+    # A timer on the loop records a heartbeat every LOOP_LAG_CHECK_SECONDS and how late it
+    # fired. A watchdog thread notices when the heartbeat stalls past
+    # LOOP_LAG_THRESHOLD_SECONDS and grabs the loop thread's stack while it is still blocked,
+    # which names the offending callback.
+    def __init__(self):
+        self.interval = config.LOOP_LAG_CHECK_SECONDS
+        self.threshold = config.LOOP_LAG_THRESHOLD_SECONDS
+        self.events: deque = deque(maxlen=config.LOOP_LAG_MAX_EVENTS)
+        self.max_lag = 0.0
+        self._heartbeat = time.perf_counter()
+        self._loop_thread = threading.get_ident()
+        self._reported_heartbeat = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _tick(self):
+        while True:
+            self._heartbeat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - self._heartbeat - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                event = self.events[-1] if self.events and self._reported_heartbeat == self._heartbeat else None
+                if event is not None:
+                    event["lag_seconds"] = round(lag, 4)
+                logger.warning("Event loop blocked", extra={
+                    "lag_seconds": round(lag, 4), "callback": event["stack"][-1] if event and event["stack"] else None,
+                })
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            if heartbeat == self._reported_heartbeat:
+                continue
+            blocked = time.perf_counter() - heartbeat - self.interval
+            if blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            self._reported_heartbeat = heartbeat
+            self.events.append({
+                "at": time.time(),
+                "lag_seconds": round(blocked, 4),
+                "stack": _stack(frame) if frame is not None else [],
+            })
+
+    def get_stats(self) -> dict:
+        return {"loop_lag_max_seconds": round(self.max_lag, 4), "loop_blocked_events": len(self.events)}
+
+
+class Profiler:
+    def __init__(self, directory: str = None, control_path: Optional[str] = None):
+        self.directory = directory or config.PROFILE_DIRECTORY
+        self.control_path = control_path if control_path is not None else config.PROFILE_CONTROL_SOCKET
+        self.sampler = StackSampler(config.PROFILE_SAMPLE_HZ)
+        self.lag = LoopLagMonitor() if config.LOOP_LAG_CHECK_SECONDS else None
+        self._stages: Dict[str, tuple] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._busy = asyncio.Lock()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(self.command("sample toggle")))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.create_task(self.command("trace snapshot")))
+        if self.lag:
+            self.lag.start()
+        if self.control_path:
+            if os.path.exists(self.control_path):
+                os.unlink(self.control_path)
+            self._server = await asyncio.start_unix_server(self._handle, self.control_path)
+            logger.info("Profiler control socket listening", extra={"path": self.control_path})
+
+    async def close(self):
+        if self.sampler.running:
+            await self.command("sample stop")
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if self.lag:
+            await self.lag.stop()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.control_path):
+                os.unlink(self.control_path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                result = await self.command(line.decode("utf-8", "replace").strip())
+                writer.write(json.dumps(result).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def command(self, text: str) -> dict:
+        # "sample start|stop|toggle", "trace start|snapshot|stop", "lag", "status"
+        async with self._busy:
+            try:
+                return await self._command(text.split())
+            except Exception as e:
+                logger.error("Err running profiler command", extra={"command": text, "error": str(e)}, exc_info=True)
+                return {"error": str(e)}
+
+    async def _command(self, words: List[str]) -> dict:
+        loop = asyncio.get_running_loop()
+        what, action = (words + ["", ""])[:2]
+        if what == "sample":
+            if action == "toggle":
+                action = "stop" if self.sampler.running else "start"
+            if action == "start" and not self.sampler.running:
+                self._stages = self._stage_totals()
+                self.sampler.start()
+                logger.info("Stack sampling started", extra={"hz": config.PROFILE_SAMPLE_HZ})
+                return {"sampling": True}
+            if action == "stop" and self.sampler.running:
+                seconds = self.sampler.stop()
+                paths = await loop.run_in_executor(None, self._dump_samples, seconds, self._stage_totals())
+                logger.info("Stack sampling stopped", extra={"seconds": round(seconds, 1), "files": paths})
+                return {"sampling": False, "files": paths}
+            return {"sampling": self.sampler.running}
+        if what == "trace":
+            if action == "stop":
+                tracemalloc.stop()
+                self._snapshot = None
+                return {"tracing": False}
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+                logger.info("Allocation tracing started", extra={"frames": config.PROFILE_TRACEMALLOC_FRAMES})
+                return {"tracing": True}
+            if action == "snapshot":
+                path = await loop.run_in_executor(None, self._dump_snapshot)
+                logger.info("Allocation snapshot written", extra={"file": path})
+                return {"tracing": True, "file": path}
+            return {"tracing": True}
+        if what == "lag" and self.lag:
+            path = await loop.run_in_executor(None, self._write, "looplag", {
+                **self.lag.get_stats(), "events": list(self.lag.events),
+            })
+            return {"file": path}
+        if what == "status":
+            status = {"sampling": self.sampler.running, "tracing": tracemalloc.is_tracing()}
+            if self.lag:
+                status.update(self.lag.get_stats())
+            return status
+        return {"error": f"unknown command: {' '.join(words)}"}
+
+    @staticmethod
+    def _stage_totals() -> Dict[str, tuple]:
+        return {key[0]: (child.count, child.sum) for key, child in STAGE_SECONDS.items()}
+
+    def _write(self, kind: str, data, suffix: str = ".json") -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+        path = os.path.join(self.directory, f"{kind}-{stamp}-{os.getpid()}{suffix}")
+        with open(path, "w") as f:
+            if suffix == ".json":
+                json.dump(data, f, indent=2)
+            else:
+                f.write(data)
+        return path
+
+    def _dump_samples(self, seconds: float, stages_after: Dict[str, tuple]) -> List[str]:
+        samples = self.sampler.samples
+        inclusive: Counter = Counter()
+        leaf: Counter = Counter()
+        for stack, count in samples.items():
+            labels = stack.split(";")[1:]
+            for label in set(labels):
+                inclusive[label] += count
+            if labels:
+                leaf[labels[-1]] += count
+
+        # Stage timers over the sampling window, from the pipeline's own histograms
+        stages = {}
+        for stage, (count, total) in stages_after.items():
+            count_before, total_before = self._stages.get(stage, (0, 0.0))
+            calls = count - count_before
+            stages[stage] = {
+                "calls": calls,
+                "seconds": round(total - total_before, 6),
+                "mean_ms": round((total - total_before) / calls * 1000, 4) if calls else None,
+            }
+
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+        return [
+            self._write("stacks", collapsed, suffix=".txt"),
+            self._write("profile", {
+                "seconds": round(seconds, 3),
+                "hz": config.PROFILE_SAMPLE_HZ,
+                "ticks": self.sampler.sample_count,
+                "stages": stages,
+                "inclusive": inclusive.most_common(config.PROFILE_TOP_ENTRIES),
+                "self": leaf.most_common(config.PROFILE_TOP_ENTRIES),
+            }),
+        ]
+
+    def _dump_snapshot(self) -> str:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        components: Dict[str, list] = {}
+        for stat in snapshot.statistics("filename"):
+            totals = components.setdefault(_component(stat.traceback[0].filename), [0, 0])
+            totals[0] += stat.size
+            totals[1] += stat.count
+        data = {
+            "traced_bytes": tracemalloc.get_traced_memory()[0],
+            "components": {
+                name: {"bytes": size, "blocks": count}
+                for name, (size, count) in sorted(components.items(), key=lambda item: -item[1][0])
+            },
+            "top_lines": [str(stat) for stat in snapshot.statistics("lineno")[:config.PROFILE_TOP_ENTRIES]],
+        }
+        if self._snapshot is not None:
+            growth: Dict[str, int] = {}
+            for stat in snapshot.compare_to(self._snapshot, "filename"):
+                name = _component(stat.traceback[0].filename)
+                growth[name] = growth.get(name, 0) + stat.size_diff
+            data["growth_since_last"] = dict(sorted(growth.items(), key=lambda item: -abs(item[1])))
+            data["top_line_growth"] = [
+                str(stat) for stat in snapshot.compare_to(self._snapshot, "lineno")[:config.PROFILE_TOP_ENTRIES]
+            ]
+        self._snapshot = snapshot
+        return self._write("tracemalloc", data)
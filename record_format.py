@@ -0,0 +1,99 @@
+# record_format.py
+import logging
+import struct
+import time
+from typing import List, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 64
+PACK_VERSION = 1
+# version, reserved, digest count, pack timestamp (ns since epoch), source bitmask
+PACK_HEADER = struct.Struct('!BBHQQ')
+
+FORMAT_HEX = "hex"
+FORMAT_RAW = "raw"
+FORMAT_PACKED = "packed"
+
+
+def decode_packed(record: bytes) -> Tuple[int, int, List[bytes]]:
+    version, _, count, timestamp_ns, source_mask = PACK_HEADER.unpack_from(record, 0)
+    if version != PACK_VERSION:
+        raise ValueError(f"Unsupported packed record version: {version}")
+    body = memoryview(record)[PACK_HEADER.size:]
+    if len(body) != count * DIGEST_SIZE:
+        raise ValueError("Packed record length does not match digest count")
+    digests = [bytes(body[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]) for i in range(count)]
+    return timestamp_ns, source_mask, digests
+
+
+class RecordEncoder:
+    # Turns 64-byte batch digests into sink records: one hex string or raw digest
+    # per record, or up to digests_per_record digests behind a small header. Each
+    # record comes with the bitmask of endpoints that went into it.
+    def __init__(self, output_format: str = config.OUTPUT_FORMAT,
+                 record_bytes: int = config.OUTPUT_PACK_RECORD_BYTES):
+        if output_format not in (FORMAT_HEX, FORMAT_RAW, FORMAT_PACKED):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+        self.digests_per_record = max(1, min(0xFFFF, (record_bytes - PACK_HEADER.size) // DIGEST_SIZE))
+        self._pending: List[bytes] = []
+        self._pending_sources = 0
+        self.digest_count = 0
+        self.record_count = 0
+        self.bytes_count = 0
+
+        if output_format == FORMAT_PACKED and record_bytes > config.KAFKA_BATCH_SIZE:
+            logger.warning("Packed record larger than KAFKA_BATCH_SIZE, every record gets its own batch",
+                           extra={"record_bytes": record_bytes, "batch_size": config.KAFKA_BATCH_SIZE})
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _pack(self) -> Tuple[bytes, int]:
+        source_mask = self._pending_sources
+        header = PACK_HEADER.pack(PACK_VERSION, 0, len(self._pending), time.time_ns(), source_mask)
+        record = header + b''.join(self._pending)
+        self._pending = []
+        self._pending_sources = 0
+        return record, source_mask
+
+    def _count(self, records: List[bytes], sources: List[int]) -> Tuple[List[bytes], List[int]]:
+        self.record_count += len(records)
+        self.bytes_count += sum(len(record) for record in records)
+        return records, sources
+
+    def encode(self, digests: List[bytes], sources: List[int]) -> Tuple[List[bytes], List[int]]:
+        self.digest_count += len(digests)
+        if self.output_format == FORMAT_HEX:
+            return self._count([digest.hex().encode('ascii') for digest in digests], list(sources))
+        if self.output_format == FORMAT_RAW:
+            return self._count(list(digests), list(sources))
+
+        records, masks = [], []
+        for digest, source_mask in zip(digests, sources):
+            self._pending.append(digest)
+            self._pending_sources |= source_mask
+            if len(self._pending) >= self.digests_per_record:
+                record, mask = self._pack()
+                records.append(record)
+                masks.append(mask)
+        return self._count(records, masks)
+
+    def flush(self) -> Tuple[List[bytes], List[int]]:
+        if not self._pending:
+            return [], []
+        record, mask = self._pack()
+        return self._count([record], [mask])
+
+    def get_stats(self) -> dict:
+        return {
+            "format": self.output_format,
+            "digests": self.digest_count,
+            "records": self.record_count,
+            "bytes": self.bytes_count,
+            "pending_digests": len(self._pending),
+            "digests_per_record": self.digests_per_record if self.output_format == FORMAT_PACKED else 1,
+        }
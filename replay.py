@@ -0,0 +1,132 @@
+# replay.py
+# Feeds captured frame segments (see frame_capture.py) through EntropySystem
+# without connecting to the upstream feeds, either as fast as possible or at
+# the original receive pacing.
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import time
+from typing import Iterator, List, Optional, Tuple
+from frame_capture import read_capture
+from main import EntropySystem, setup_logging
+from runtime import run
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def capture_paths(sources: List[str]) -> List[str]:
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(glob.glob(os.path.join(source, f"{config.CAPTURE_PREFIX}*.seg"))))
+        else:
+            paths.extend(sorted(glob.glob(source)))
+    return paths
+
+
+def captured_frames(paths: List[str], since_ns: Optional[int], until_ns: Optional[int],
+                    endpoints: Optional[set]) -> Iterator[Tuple[int, str, bytes]]:
+    for path in paths:
+        for received_ns, endpoint, frame in read_capture(path):
+            if since_ns is not None and received_ns < since_ns:
+                continue
+            if until_ns is not None and received_ns >= until_ns:
+                continue
+            if endpoints and endpoint not in endpoints:
+                continue
+            yield received_ns, endpoint, frame
+
+
+async def replay(system, frames: Iterator[Tuple[int, str, bytes]], speed: float) -> dict:
+    # Consecutive frames from the same endpoint are handed over together, the way
+    # a consumer drains an endpoint queue; speed 0 means no pacing
+    first_ns = None
+    started = time.monotonic()
+    frame_count = 0
+    endpoint, pending = None, []
+    frame_filters = system.websocket_manager.frame_filters
+
+    for received_ns, frame_endpoint, frame in frames:
+        if system.shutdown_event.is_set():
+            break
+        if speed:
+            if first_ns is None:
+                first_ns = received_ns
+            delay = (received_ns - first_ns) / 1e9 / speed - (time.monotonic() - started)
+            if delay > 0:
+                if pending:
+                    await system._handle_messages(endpoint, pending)
+                    pending = []
+                await asyncio.sleep(delay)
+
+        if pending and (frame_endpoint != endpoint or len(pending) >= config.MESSAGE_PROCESSING_BATCH):
+            await system._handle_messages(endpoint, pending)
+            pending = []
+        endpoint = frame_endpoint
+        frame_count += 1
+        frame = frame_filters.apply(endpoint, frame)
+        if frame is not None:
+            pending.append(frame)
+
+    if pending and not system.shutdown_event.is_set():
+        await system._handle_messages(endpoint, pending)
+
+    elapsed = time.monotonic() - started
+    stats = {
+        "frames": frame_count,
+        "messages": system.message_count,
+        "seconds": round(elapsed, 3),
+        "frames_per_second": round(frame_count / elapsed, 1) if elapsed else 0,
+    }
+    logger.info("Replay finished", extra=stats)
+    return stats
+
+
+def parse_time_ns(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    return int(float(value) * 1e9)
+
+
+async def main(args):
+    if args.sink:
+        config.OUTPUT_SINK = args.sink
+    # Don't share (and lock) the live service's snapshot unless asked to
+    config.DEDUPLICATION_SNAPSHOT_PATH = args.dedup_snapshot
+
+    system = EntropySystem()
+    await system.start_pipeline()
+    try:
+        frames = captured_frames(
+            capture_paths(args.sources),
+            parse_time_ns(args.since),
+            parse_time_ns(args.until),
+            set(args.endpoint) if args.endpoint else None,
+        )
+        await replay(system, frames, args.speed or 0)
+    finally:
+        if not system.shutdown_event.is_set():
+            await system.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured raw frames through EntropySystem")
+    parser.add_argument("sources", nargs="+", help="Capture directories, segment files or globs")
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--fast", action="store_true", help="Replay as fast as the pipeline allows (default)")
+    pacing.add_argument("--speed", type=float, help="Replay at the captured pacing times this factor, e.g. 1 or 2.5")
+    parser.add_argument("--since", help="Only frames received at or after this unix time")
+    parser.add_argument("--until", help="Only frames received before this unix time")
+    parser.add_argument("--endpoint", action="append", help="Only frames from this endpoint URL, repeatable")
+    parser.add_argument("--sink", help="Override OUTPUT_SINK for this run")
+    parser.add_argument("--dedup-snapshot", help="Dedup snapshot path, by default replay keeps dedup in memory")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,27 @@
+# runtime.py
+import asyncio
+import logging
+from typing import Any, Coroutine
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def run(main: Coroutine) -> Any:
+    # asyncio.run on the EVENT_LOOP implementation; uvloop is optional
+    if config.EVENT_LOOP == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop not installed, using the asyncio event loop")
+        else:
+            if hasattr(uvloop, "run"):
+                return uvloop.run(main)
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    elif config.EVENT_LOOP != "asyncio":
+        raise ValueError(f"Unknown event loop: {config.EVENT_LOOP}")
+    return asyncio.run(main)
+
+
+def loop_name() -> str:
+    return type(asyncio.get_running_loop()).__module__.split(".")[0]
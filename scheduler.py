@@ -0,0 +1,193 @@
+# scheduler.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+from frame_queue import FrameQueue
+from metrics import registry
+import config
+
+logger = logging.getLogger(__name__)
+
+DRR = "drr"
+FIFO = "fifo"
+
+WAIT_SECONDS = registry.histogram(
+    "entropygen_scheduler_wait_seconds", "Queue wait of the oldest frame in each drained batch", ("endpoint",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+def _lookup(table: Dict[str, float], url: str, default):
+    # Keys are URL substrings, first match wins
+    return next((value for key, value in table.items() if key in url), default)
+
+
+class SourceState:
+    __slots__ = ("weight", "rate", "tokens", "refilled_at", "deficit",
+                 "admitted", "admitted_bytes", "shed_rate", "shed_overload", "shed_overload_bytes", "wait")
+
+    def __init__(self, url: str):
+        self.weight = _lookup(config.SCHEDULER_WEIGHTS, url, 1)
+        self.rate = _lookup(config.SCHEDULER_RATE_LIMITS, url, None)
+        self.tokens = self.rate or 0.0
+        self.refilled_at = time.monotonic()
+        self.deficit = 0
+        self.admitted = 0
+        self.admitted_bytes = 0
+        self.shed_rate = 0
+        self.shed_overload = 0
+        self.shed_overload_bytes = 0
+        self.wait = WAIT_SECONDS.labels(url)
+
+    def take_token(self) -> bool:
+        # Token bucket in frames/s, one second of burst
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class FairScheduler:
+    # Sits between the endpoint queues and the consumers. Admission applies per-endpoint
+    # rate caps and, past SCHEDULER_OVERLOAD_BYTES queued in total, sheds the oldest
+    # frames of whichever endpoint has the largest backlog per unit of weight. Consumers
+    # are served by deficit round-robin: each visit credits quantum * weight bytes, so a
+    # firehose gets its share of consumer time and a quiet feed is never stuck behind it.
+    def __init__(self, queues: Dict[str, FrameQueue], policy: str = None):
+        self.queues = queues
+        self.policy = policy or config.SCHEDULER_POLICY
+        if self.policy not in (DRR, FIFO):
+            raise ValueError(f"Unknown scheduler policy: {self.policy}")
+        self.quantum = config.SCHEDULER_QUANTUM_BYTES
+        self.max_frames = config.MESSAGE_PROCESSING_BATCH
+        self.overload_bytes = config.SCHEDULER_OVERLOAD_BYTES
+        self.sources: Dict[str, SourceState] = {}
+        self._active: deque = deque()
+        self._ready = asyncio.Event()
+        self.overload_count = 0
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def add(self, url: str):
+        self.sources[url] = SourceState(url)
+
+    def remove(self, url: str):
+        self.sources.pop(url, None)
+
+    def admit(self, url: str, nbytes: int) -> bool:
+        state = self.sources[url]
+        if state.rate and not state.take_token():
+            state.shed_rate += 1
+            return False
+        state.admitted += 1
+        state.admitted_bytes += nbytes
+        return True
+
+    def notify(self, url: str):
+        # Called after a frame was queued
+        queue = self.queues[url]
+        if not queue.scheduled:
+            queue.scheduled = True
+            self._active.append(url)
+            self._ready.set()
+        if self.overload_bytes:
+            total = sum(queue.bytes for queue in self.queues.values())
+            if total > self.overload_bytes:
+                # Shed down to 90% so a sustained overload is handled in steps, not per frame
+                self._shed(total - int(self.overload_bytes * 0.9))
+
+    def _shed(self, excess: int):
+        # Levels the heaviest backlogs per unit of weight down to a common line that frees
+        # excess bytes, so sheds spread across the heaviest sources. One sort per overload,
+        # then each queue over the line is shed once.
+        self.overload_count += 1
+        ranked = sorted(((queue.bytes / self.sources[url].weight, url)
+                         for url, queue in self.queues.items() if queue.bytes), reverse=True)
+        heaviest = 0
+        level = 0.0
+        total_bytes = total_weight = 0
+        for heaviest, (_, url) in enumerate(ranked, 1):
+            total_bytes += self.queues[url].bytes
+            total_weight += self.sources[url].weight
+            next_backlog = ranked[heaviest][0] if heaviest < len(ranked) else 0.0
+            level = (total_bytes - excess) / total_weight
+            if level >= next_backlog:
+                break
+        level = max(level, 0.0)
+        shed: Dict[str, int] = {}
+        for _, url in ranked[:heaviest]:
+            queue, state = self.queues[url], self.sources[url]
+            count, freed = queue.shed(max(1, queue.bytes - int(level * state.weight)))
+            state.shed_overload += count
+            state.shed_overload_bytes += freed
+            shed[url] = count
+        logger.warning("Overload, shedding frames", extra={"shed": shed})
+
+    async def next(self) -> Tuple[str, List[bytes]]:
+        while True:
+            while not self._active:
+                self._ready.clear()
+                await self._ready.wait()
+            url = self._active.popleft()
+            queue = self.queues.get(url)
+            state = self.sources.get(url)
+            if queue is None or state is None:
+                continue
+            if not len(queue):
+                queue.scheduled = False
+                state.deficit = 0
+                continue
+
+            wait = queue.head_age()
+            if self.policy == FIFO:
+                frames = queue.drain(self.max_frames)
+            else:
+                credit = self.quantum * state.weight
+                state.deficit += credit
+                frames = queue.drain(self.max_frames, state.deficit)
+                if not frames:
+                    # Head frame is larger than the deficit so far, try again next round
+                    self._active.append(url)
+                    continue
+                # Unused credit carries over, at most one visit's worth when the frame cap cut the drain short
+                state.deficit = min(state.deficit - sum(len(frame) for frame in frames), credit)
+            state.wait.observe(wait)
+            return url, frames
+
+    def done(self, url: str):
+        queue = self.queues.get(url)
+        if queue is None:
+            return
+        if len(queue):
+            self._active.append(url)
+            self._ready.set()
+        else:
+            queue.scheduled = False
+            if url in self.sources:
+                self.sources[url].deficit = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "scheduler_policy": self.policy,
+            "scheduler_active": len(self._active),
+            "scheduler_overloads": self.overload_count,
+            "sources": {
+                url: {
+                    "weight": state.weight,
+                    "rate_limit": state.rate,
+                    "admitted": state.admitted,
+                    "admitted_bytes": state.admitted_bytes,
+                    "shed_rate": state.shed_rate,
+                    "shed_overload": state.shed_overload,
+                    "shed_overload_bytes": state.shed_overload_bytes,
+                }
+                for url, state in self.sources.items()
+            },
+        }
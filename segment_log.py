@@ -0,0 +1,117 @@
+# segment_log.py
+import logging
+import os
+import struct
+import zlib
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'EGSEG\x00\x01\x00'
+SEGMENT_SUFFIX = '.seg'
+_RECORD_HEADER = struct.Struct('<II')
+
+
+def list_segments(directory: str, prefix: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(SEGMENT_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segment(path: str) -> Iterator[bytes]:
+    # Records are <length, crc32, payload>; a torn tail ends the segment early
+    with open(path, 'rb') as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            logger.warning("Skipping segment with bad magic", extra={"path": path})
+            return
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            length, crc = _RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning("Truncated record at segment tail", extra={"path": path})
+                return
+            yield payload
+
+
+class SegmentWriter:
+    # Append-only, length-prefixed records in size-rotated files named
+    # <prefix><sequence>.seg, written through a large userspace buffer.
+    def __init__(self, directory: str, prefix: str, max_bytes: int, buffer_size: int = 1024 * 1024):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.segment_count = 0
+        self.record_count = 0
+        self.bytes_written = 0
+        self.current_path: Optional[str] = None
+        self._file = None
+        self._segment_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = list_segments(directory, prefix)
+        self._sequence = self._sequence_of(existing[-1]) + 1 if existing else 0
+
+    def _sequence_of(self, path: str) -> int:
+        name = os.path.basename(path)
+        try:
+            return int(name[len(self.prefix):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            return 0
+
+    def _open_next(self):
+        self.current_path = os.path.join(self.directory, f"{self.prefix}{self._sequence:012d}{SEGMENT_SUFFIX}")
+        self._sequence += 1
+        self._file = open(self.current_path, 'wb', buffering=self.buffer_size)
+        self._file.write(SEGMENT_MAGIC)
+        self._segment_bytes = len(SEGMENT_MAGIC)
+        self.segment_count += 1
+        logger.debug("Opened segment", extra={"path": self.current_path})
+
+    def rotate(self) -> Optional[str]:
+        closed = self.current_path if self._file else None
+        if self._file:
+            self._file.close()
+            self._file = None
+        self.current_path = None
+        return closed
+
+    def append(self, payload: bytes) -> str:
+        if self._file is None:
+            self._open_next()
+        path = self.current_path
+        self._file.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        size = _RECORD_HEADER.size + len(payload)
+        self._segment_bytes += size
+        self.bytes_written += size
+        self.record_count += 1
+        if self._segment_bytes >= self.max_bytes:
+            self.rotate()
+        return path
+
+    def flush(self, fsync: bool = False):
+        if self._file:
+            self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self.flush(fsync=True)
+        self.rotate()
+
+    def get_stats(self) -> dict:
+        return {
+            "segments_opened": self.segment_count,
+            "records": self.record_count,
+            "bytes": self.bytes_written,
+            "current_segment": self.current_path,
+        }
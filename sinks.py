@@ -0,0 +1,247 @@
+# sinks.py
+import asyncio
+import logging
+import struct
+from collections import deque
+from typing import List, Optional
+from segment_log import SegmentWriter
+import config
+
+logger = logging.getLogger(__name__)
+
+_FRAME_LENGTH = struct.Struct('<I')
+
+
+class EntropySink:
+    name = "base"
+
+    def __init__(self):
+        self.send_count = 0
+        self.error_count = 0
+
+    async def start(self):
+        pass
+
+    async def send_many(self, records: List[bytes], sources: Optional[List[int]] = None) -> int:
+        # sources: endpoint bitmask per record, for sinks that route by it
+        raise NotImplementedError
+
+    async def flush(self, timeout: Optional[float] = None):
+        pass
+
+    async def close(self):
+        pass
+
+    def buffered_bytes(self) -> int:
+        # Record bytes held in memory by the sink, for the memory governor
+        return 0
+
+    def get_stats(self) -> dict:
+        return {
+            "sink": self.name,
+            "sent": self.send_count,
+            "errors": self.error_count,
+            "success_rate": (self.send_count / (self.send_count + self.error_count) * 100)
+                           if (self.send_count + self.error_count) > 0 else 0
+        }
+
+
+class KafkaSink(EntropySink):
+    name = "kafka"
+
+    def __init__(self):
+        super().__init__()
+        self.delivery = None
+
+    async def start(self):
+        # Built here, off the event loop: importing kafka-python and bootstrapping the
+        # producers takes long enough to hold up the socket connects
+        self.delivery = await asyncio.get_running_loop().run_in_executor(None, self._create_delivery)
+        self.delivery.start()
+
+    @staticmethod
+    def _create_delivery():
+        # Imported here so the other sinks run without kafka-python or a broker
+        from kafka_delivery import KafkaDelivery
+        return KafkaDelivery()
+
+    async def send_many(self, records: List[bytes], sources: Optional[List[int]] = None) -> int:
+        if sources is None:
+            for record in records:
+                self.delivery.submit(record)
+        else:
+            for record, source_mask in zip(records, sources):
+                self.delivery.submit(record, source_mask)
+        return len(records)
+
+    async def flush(self, timeout: Optional[float] = None):
+        if self.delivery:
+            await asyncio.get_running_loop().run_in_executor(None, self.delivery.flush, timeout)
+
+    async def close(self):
+        if self.delivery:
+            await asyncio.get_running_loop().run_in_executor(None, self.delivery.close)
+
+    def buffered_bytes(self) -> int:
+        return self.delivery.buffered_bytes() if self.delivery else 0
+
+    def get_stats(self) -> dict:
+        if not self.delivery:
+            return super().get_stats()
+        stats = self.delivery.get_stats()
+        stats["sink"] = self.name
+        return stats
+
+
+class SegmentFileSink(EntropySink):
+    name = "file"
+
+    def __init__(self):
+        super().__init__()
+        self.writer = SegmentWriter(
+            config.SINK_FILE_DIRECTORY,
+            config.SINK_FILE_PREFIX,
+            config.SINK_FILE_SEGMENT_MAX_BYTES,
+            buffer_size=config.SINK_FILE_BUFFER_BYTES,
+        )
+
+    async def send_many(self, records: List[bytes], sources: Optional[List[int]] = None) -> int:
+        accepted = 0
+        for record in records:
+            try:
+                self.writer.append(record)
+                accepted += 1
+            except OSError as e:
+                self.error_count += 1
+                logger.error("Err writing segment", extra={"error": str(e)})
+        self.send_count += accepted
+        return accepted
+
+    async def flush(self, timeout: Optional[float] = None):
+        self.writer.flush(fsync=True)
+
+    async def close(self):
+        self.writer.close()
+        logger.info("Segment sink closed", extra=self.writer.get_stats())
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update(self.writer.get_stats())
+        return stats
+
+
+class UnixSocketSink(EntropySink):
+    # Length-prefixed records over a UNIX stream socket. drain() pushes back on
+    # the caller when the reader falls behind; while disconnected, records are dropped.
+    name = "unix"
+
+    def __init__(self):
+        super().__init__()
+        self.path = config.SINK_UNIX_SOCKET_PATH
+        self.connect_count = 0
+        self.dropped_count = 0
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._next_connect = 0.0
+
+    async def _connect(self) -> bool:
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._next_connect:
+            return False
+        try:
+            _, self._writer = await asyncio.open_unix_connection(self.path)
+            self.connect_count += 1
+            logger.info("Connected UNIX socket sink", extra={"path": self.path})
+            return True
+        except OSError as e:
+            self._next_connect = loop.time() + config.RECONNECT_DELAY_SECONDS
+            logger.error("Err connecting UNIX socket sink", extra={"path": self.path, "error": str(e)})
+            return False
+
+    async def start(self):
+        await self._connect()
+
+    async def send_many(self, records: List[bytes], sources: Optional[List[int]] = None) -> int:
+        if self._writer is None and not await self._connect():
+            self.dropped_count += len(records)
+            self.error_count += len(records)
+            return 0
+        try:
+            for record in records:
+                self._writer.write(_FRAME_LENGTH.pack(len(record)))
+                self._writer.write(record)
+            await self._writer.drain()
+            self.send_count += len(records)
+            return len(records)
+        except (ConnectionError, OSError) as e:
+            logger.error("UNIX socket sink disconnected", extra={"path": self.path, "error": str(e)})
+            self._writer = None
+            self.dropped_count += len(records)
+            self.error_count += len(records)
+            return 0
+
+    async def flush(self, timeout: Optional[float] = None):
+        if self._writer is not None:
+            try:
+                await asyncio.wait_for(self._writer.drain(), timeout=timeout)
+            except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+                logger.error("Err flushing UNIX socket sink", extra={"error": str(e)})
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self._writer = None
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update({"connects": self.connect_count, "dropped": self.dropped_count})
+        return stats
+
+
+class MemorySink(EntropySink):
+    name = "memory"
+
+    def __init__(self, max_records: int = 0):
+        super().__init__()
+        self.records = deque(maxlen=max_records)
+        self.bytes_count = 0
+
+    async def send_many(self, records: List[bytes], sources: Optional[List[int]] = None) -> int:
+        if self.records.maxlen:
+            self.records.extend(records)
+        self.bytes_count += sum(len(record) for record in records)
+        self.send_count += len(records)
+        return len(records)
+
+    def buffered_bytes(self) -> int:
+        return sum(len(record) for record in self.records)
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update({"retained": len(self.records), "bytes": self.bytes_count})
+        return stats
+
+
+class NullSink(MemorySink):
+    name = "null"
+
+    def __init__(self):
+        super().__init__(0)
+
+
+def create_sink(kind: Optional[str] = None) -> EntropySink:
+    kind = kind or config.OUTPUT_SINK
+    if kind == "kafka":
+        return KafkaSink()
+    if kind == "file":
+        return SegmentFileSink()
+    if kind == "unix":
+        return UnixSocketSink()
+    if kind == "memory":
+        return MemorySink(config.SINK_MEMORY_MAX_RECORDS)
+    if kind == "null":
+        return NullSink()
+    raise ValueError(f"Unknown output sink: {kind}")
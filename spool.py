@@ -0,0 +1,104 @@
+# spool.py
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+from segment_log import SegmentWriter, list_segments, read_segment
+
+logger = logging.getLogger(__name__)
+
+_STAMP = struct.Struct('<d')
+
+
+class SegmentSpool:
+    # Thread-safe on-disk FIFO. Records are appended to the newest segment and
+    # consumed a whole segment at a time, oldest first, then the file is deleted.
+    def __init__(self, directory: str, prefix: str, segment_max_bytes: int):
+        self.directory = directory
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._writer = SegmentWriter(directory, prefix, segment_max_bytes)
+        # path -> [records, bytes, oldest record timestamp]
+        self._segments: Dict[str, list] = {}
+        self.appended_count = 0
+        self.removed_count = 0
+
+        for path in list_segments(directory, prefix):
+            records = 0
+            oldest = None
+            for payload in read_segment(path):
+                if oldest is None:
+                    oldest = _STAMP.unpack_from(payload)[0]
+                records += 1
+            if records:
+                self._segments[path] = [records, os.path.getsize(path), oldest]
+            else:
+                os.remove(path)
+
+        if self._segments:
+            logger.info("Recovered spool segments", extra={
+                "directory": directory,
+                "segments": len(self._segments),
+                "records": self.depth,
+            })
+
+    @property
+    def depth(self) -> int:
+        with self._lock:
+            return sum(meta[0] for meta in self._segments.values())
+
+    def append(self, payload: bytes):
+        now = time.time()
+        record = _STAMP.pack(now) + payload
+        with self._lock:
+            path = self._writer.append(record)
+            meta = self._segments.get(path)
+            if meta is None:
+                self._segments[path] = [1, len(record), now]
+            else:
+                meta[0] += 1
+                meta[1] += len(record)
+            self.appended_count += 1
+
+    def closed_segments(self) -> List[str]:
+        # Seals the active segment so everything spooled so far can be read back
+        with self._lock:
+            if self._writer.current_path in self._segments:
+                self._writer.rotate()
+            return sorted(self._segments)
+
+    def read(self, path: str) -> Iterator[Tuple[float, bytes]]:
+        for record in read_segment(path):
+            yield _STAMP.unpack_from(record)[0], record[_STAMP.size:]
+
+    def remove(self, path: str):
+        with self._lock:
+            meta = self._segments.pop(path, None)
+            if meta:
+                self.removed_count += meta[0]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def flush(self):
+        with self._lock:
+            self._writer.flush(fsync=True)
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            oldest = min((meta[2] for meta in self._segments.values()), default=None)
+            return {
+                "spool_depth": sum(meta[0] for meta in self._segments.values()),
+                "spool_bytes": sum(meta[1] for meta in self._segments.values()),
+                "spool_segments": len(self._segments),
+                "spool_appended": self.appended_count,
+                "spool_replayed": self.removed_count,
+                "replay_lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+            }
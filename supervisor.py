@@ -0,0 +1,442 @@
+# supervisor.py
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import List, Optional
+from deduplication_buffer import CompactDigestTable, DeduplicationBuffer
+from metrics import MetricsServer, registry
+from endpoints import endpoint_registry
+from runtime import run
+import config
+
+logger = logging.getLogger(__name__)
+
+_COUNTER_STATS = ("messages", "frames", "duplicates", "digests", "sink_sent", "sink_errors", "queue_dropped",
+                  "dedup_lock_timeouts")
+_GAUGE_STATS = ("queue_bytes", "connections_active")
+
+
+def _url(endpoint_config: str) -> str:
+    return endpoint_registry().get(endpoint_config).url
+
+
+def _worker_config(settings: dict, index: int) -> dict:
+    # Per-worker copies of anything that names a file, directory or port
+    settings = dict(settings)
+    settings["WORKER_PROCESSES"] = 1
+    settings["DEDUPLICATION_SNAPSHOT_PATH"] = None
+    settings["SINK_FILE_PREFIX"] = f"{settings['SINK_FILE_PREFIX']}w{index}-"
+    settings["CAPTURE_PREFIX"] = f"{settings['CAPTURE_PREFIX']}w{index}-"
+    settings["KAFKA_SPOOL_DIRECTORY"] = os.path.join(settings["KAFKA_SPOOL_DIRECTORY"], f"worker-{index}")
+    settings["METRICS_PORT"] = settings["METRICS_PORT"] + 1 + index if settings["METRICS_PORT"] else 0
+    settings["ENTROPY_SERVER_REUSE_PORT"] = True
+    if settings["ENTROPY_SERVER_UNIX_PATH"]:
+        settings["ENTROPY_SERVER_UNIX_PATH"] = f"{settings['ENTROPY_SERVER_UNIX_PATH']}.w{index}"
+    if settings["PROFILE_CONTROL_SOCKET"]:
+        settings["PROFILE_CONTROL_SOCKET"] = f"{settings['PROFILE_CONTROL_SOCKET']}.w{index}"
+    root, ext = os.path.splitext(settings["LOG_FILE"])
+    settings["LOG_FILE"] = f"{root}.w{index}{ext}"
+    if settings["HASHING_WORKERS"] is None:
+        settings["HASHING_WORKERS"] = max(1, (os.cpu_count() or 1) // settings["WORKER_COUNT"])
+    return settings
+
+
+def run_worker(index: int, settings: dict, conn, shared_name: str, dedup_lock):
+    # Entry point of a spawned worker process
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+    import main
+    main.setup_logging()
+    try:
+        run(_worker(index, conn, shared_name, dedup_lock))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker(index: int, conn, shared_name: str, dedup_lock):
+    from main import EntropySystem
+
+    loop = asyncio.get_running_loop()
+    dedup_buffer = DeduplicationBuffer(config.DEDUPLICATION_BUFFER_MAX_SIZE_GB, shared=shared_name, lock=dedup_lock)
+    system = EntropySystem(endpoints=[], dedup_buffer=dedup_buffer)
+    assignments: asyncio.Queue = asyncio.Queue()
+
+    def on_control():
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # Supervisor is gone, don't outlive it
+            loop.remove_reader(conn.fileno())
+            asyncio.create_task(system.stop())
+            return
+        if message[0] == "assign":
+            assignments.put_nowait(message[1])
+        elif message[0] == "stop":
+            asyncio.create_task(system.stop())
+
+    async def apply_assignments():
+        while True:
+            await system.websocket_manager.assign(await assignments.get())
+
+    async def heartbeat():
+        while True:
+            try:
+                conn.send(("heartbeat", os.getpid(), system.get_summary()))
+            except (BrokenPipeError, OSError):
+                return
+            await asyncio.sleep(config.WORKER_HEARTBEAT_SECONDS)
+
+    # The control pipe is read before start() so an assignment can't be missed
+    loop.add_reader(conn.fileno(), on_control)
+    tasks = [asyncio.create_task(apply_assignments()), asyncio.create_task(heartbeat())]
+    logger.info("Worker started", extra={"worker": index, "pid": os.getpid()})
+    try:
+        await system.start()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await system.stop()
+        logger.info("Worker stopped", extra={"worker": index})
+
+
+class WorkerHandle:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.endpoints: List[str] = []
+        self.started_at = 0.0
+        self.last_heartbeat = 0.0
+        self.ready = False
+        self.stats: dict = {}
+        self.restart_count = 0
+        self.consecutive_failures = 0
+        self.restart_at: Optional[float] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    # Runs N worker processes, each an EntropySystem owning a shard of the endpoints.
+    # Workers share one CompactDigestTable in shared memory, so a duplicate seen by any
+    # worker is a duplicate for all. Endpoints of a dead worker move to the survivors
+    # straight away and are rebalanced back once its replacement reports in.
+    def __init__(self, worker_count: int = config.WORKER_PROCESSES):
+        if config.DEDUPLICATION_BACKEND != "table":
+            raise ValueError("Worker processes share the table dedup backend only")
+        self.worker_count = worker_count
+        self.context = multiprocessing.get_context("spawn")
+        self.dedup_lock = self.context.Lock()
+        self.table = CompactDigestTable(
+            config.DEDUPLICATION_MAX_ENTRIES,
+            digest_bytes=config.DEDUPLICATION_DIGEST_BYTES,
+            max_bytes=int(config.DEDUPLICATION_BUFFER_MAX_SIZE_GB * 1024 * 1024 * 1024),
+            load_factor=config.DEDUPLICATION_TABLE_LOAD_FACTOR,
+            shared=True,
+        )
+        self.workers = [WorkerHandle(index) for index in range(worker_count)]
+        self.settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+        self.settings["WORKER_COUNT"] = worker_count
+        self.stopping = asyncio.Event()
+        self.metrics_server = MetricsServer() if config.METRICS_PORT else None
+        self.stats_snapshot = (time.monotonic(), 0, 0)
+        # Counters of worker processes that have exited, so totals survive restarts
+        self.retired_stats = dict.fromkeys(_COUNTER_STATS, 0)
+        self.dedup_repair: Optional[asyncio.Task] = None
+        self.dedup_repair_count = 0
+
+        for position, endpoint_config in enumerate(config.WEBSOCKET_ENDPOINTS):
+            self.workers[position % worker_count].endpoints.append(endpoint_config)
+
+        self._register_metrics()
+
+    def _register_metrics(self):
+        def per_worker(fn):
+            return lambda: {(str(worker.index),): fn(worker) for worker in self.workers}
+
+        registry.gauge("entropygen_worker_up", "1 while the worker process is alive",
+                       per_worker(lambda worker: int(worker.alive)), ("worker",))
+        registry.gauge("entropygen_worker_restarts_total", "Worker process restarts",
+                       per_worker(lambda worker: worker.restart_count), ("worker",), metric_type="counter")
+        registry.gauge("entropygen_worker_endpoints", "Endpoints assigned to the worker",
+                       per_worker(lambda worker: len(worker.endpoints)), ("worker",))
+        registry.gauge("entropygen_worker_heartbeat_age_seconds", "Seconds since the last worker heartbeat",
+                       per_worker(lambda worker: time.monotonic() - worker.last_heartbeat if worker.ready else None),
+                       ("worker",))
+        for stat in ("messages", "frames", "duplicates", "digests", "sink_sent", "queue_dropped"):
+            registry.gauge(f"entropygen_worker_{stat}_total", f"Worker {stat.replace('_', ' ')} count from heartbeats",
+                           per_worker(lambda worker, stat=stat: worker.stats.get(stat)), ("worker",),
+                           metric_type="counter")
+        registry.gauge("entropygen_dedup_entries", "Fingerprints held by the shared dedup table",
+                       lambda: self.table.count)
+
+    def _spawn(self, worker: WorkerHandle):
+        parent_conn, child_conn = self.context.Pipe()
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.index, _worker_config(self.settings, worker.index), child_conn,
+                  self.table.shared_name, self.dedup_lock),
+            name=f"entropygen-worker-{worker.index}",
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.started_at = worker.last_heartbeat = time.monotonic()
+        worker.ready = False
+        worker.restart_at = None
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_message, worker)
+        self._send(worker, ("assign", worker.endpoints))
+        logger.info("Spawned worker", extra={
+            "worker": worker.index, "pid": worker.process.pid, "endpoints": len(worker.endpoints),
+        })
+
+    def _send(self, worker: WorkerHandle, message):
+        try:
+            worker.conn.send(message)
+        except (BrokenPipeError, OSError) as e:
+            logger.error("Err messaging worker", extra={"worker": worker.index, "error": str(e)})
+
+    def _on_message(self, worker: WorkerHandle):
+        try:
+            kind, pid, stats = worker.conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+            return
+        if kind != "heartbeat":
+            return
+        now = time.monotonic()
+        worker.last_heartbeat = now
+        worker.stats = stats
+        if not worker.ready:
+            worker.ready = True
+            logger.info("Worker ready", extra={"worker": worker.index, "pid": pid})
+            self._rebalance()
+        if worker.consecutive_failures and now - worker.started_at > config.WORKER_HEARTBEAT_TIMEOUT_SECONDS:
+            worker.consecutive_failures = 0
+
+    def _on_exit(self, worker: WorkerHandle):
+        exitcode = worker.process.exitcode
+        pid = worker.process.pid
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        worker.process = None
+        worker.ready = False
+        for name in _COUNTER_STATS:
+            self.retired_stats[name] += worker.stats.get(name, 0)
+        worker.stats = {}
+
+        orphans, worker.endpoints = worker.endpoints, []
+        if self.stopping.is_set():
+            return
+        if self.dedup_repair is None or self.dedup_repair.done():
+            self.dedup_repair = asyncio.create_task(self._repair_dedup_lock(pid))
+
+        worker.consecutive_failures += 1
+        backoff = min(config.WORKER_RESTART_BACKOFF_MAX_SECONDS,
+                      config.WORKER_RESTART_BACKOFF_SECONDS * 2 ** (worker.consecutive_failures - 1))
+        worker.restart_at = time.monotonic() + backoff
+        logger.error("Worker exited", extra={
+            "worker": worker.index, "exitcode": exitcode, "restart_in": backoff, "orphaned_endpoints": len(orphans),
+        })
+
+        survivors = [other for other in self.workers if other.alive]
+        if not survivors:
+            # Nobody to take them over, the replacement gets them back
+            worker.endpoints = orphans
+            return
+        for endpoint_config in orphans:
+            target = min(survivors, key=lambda other: len(other.endpoints))
+            target.endpoints.append(endpoint_config)
+        for target in survivors:
+            self._send(target, ("assign", target.endpoints))
+
+    async def _repair_dedup_lock(self, pid: int):
+        # A worker killed inside a dedup add (heartbeat kill, OOM killer) leaves the shared
+        # lock held and its table update half done. Workers write their pid to holder
+        # right after acquiring and clear it right before releasing, so holder == pid
+        # proves the dead worker held it: the supervisor rebuilds the index from the ring
+        # and releases the lock on its behalf. A lock it can't attribute is never
+        # released; if it stays stuck, every worker is restarted on a fresh lock instead.
+        loop = asyncio.get_running_loop()
+        if self.table.holder == pid:
+            logger.error("Worker died holding the shared dedup lock, repairing the table", extra={
+                "pid": pid, "entries": self.table.count,
+            })
+            await self._rebuild_dedup_index()
+            self.table.holder = 0
+            self.dedup_lock.release()
+            return
+
+        # Free, briefly held by a live worker, or lost in the instant between acquire
+        # and recording the holder
+        acquire = functools.partial(self.dedup_lock.acquire, timeout=config.DEDUPLICATION_LOCK_TIMEOUT_SECONDS * 5)
+        if await loop.run_in_executor(None, acquire):
+            self.dedup_lock.release()
+            return
+        if self.table.holder in {worker.process.pid for worker in self.workers if worker.alive}:
+            # A live holder that stays stuck misses heartbeats and comes back through here
+            return
+        await self._reset_dedup_lock(pid)
+
+    async def _reset_dedup_lock(self, pid: int):
+        logger.error("Shared dedup lock stuck without a live holder, restarting all workers on a new lock", extra={
+            "pid": pid, "holder": self.table.holder,
+        })
+        # Workers spawned from here on wait on the new lock until the table is consistent
+        self.dedup_lock = self.context.Lock()
+        self.dedup_lock.acquire()
+        running = [worker for worker in self.workers if worker.alive]
+        for worker in running:
+            self._send(worker, ("stop", None))
+        deadline = time.monotonic() + config.WORKER_SHUTDOWN_TIMEOUT_SECONDS
+        for worker in running:
+            process = worker.process
+            await asyncio.get_running_loop().run_in_executor(
+                None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join(5)
+        # No process is left on the old lock, so the table is ours until the release
+        await self._rebuild_dedup_index()
+        self.table.holder = 0
+        self.dedup_lock.release()
+
+    async def _rebuild_dedup_index(self):
+        started = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(None, self.table.rebuild_index)
+        self.dedup_repair_count += 1
+        logger.info("Shared dedup table repaired", extra={
+            "entries": self.table.count, "seconds": round(time.monotonic() - started, 2),
+        })
+
+    def _rebalance(self):
+        # Moves endpoints from the busiest ready worker to the idlest until they differ
+        # by at most one, so as few connections as possible are torn down
+        ready = [worker for worker in self.workers if worker.alive and worker.ready]
+        if len(ready) < 2:
+            return
+        changed = set()
+        while True:
+            busiest = max(ready, key=lambda worker: len(worker.endpoints))
+            idlest = min(ready, key=lambda worker: len(worker.endpoints))
+            if len(busiest.endpoints) - len(idlest.endpoints) <= 1:
+                break
+            idlest.endpoints.append(busiest.endpoints.pop())
+            changed.update((busiest.index, idlest.index))
+        for worker in ready:
+            if worker.index in changed:
+                self._send(worker, ("assign", worker.endpoints))
+        if changed:
+            logger.info("Rebalanced endpoints", extra={
+                "assignments": {worker.index: [_url(e) for e in worker.endpoints] for worker in ready},
+            })
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                self._on_exit(worker)
+            elif worker.process is not None and now - worker.last_heartbeat > config.WORKER_HEARTBEAT_TIMEOUT_SECONDS:
+                logger.error("Worker missed heartbeats, killing", extra={
+                    "worker": worker.index, "silent_seconds": round(now - worker.last_heartbeat, 1),
+                })
+                worker.process.kill()
+            elif worker.process is None and worker.restart_at is not None and now >= worker.restart_at:
+                worker.restart_count += 1
+                self._spawn(worker)
+
+    def get_stats(self) -> dict:
+        totals = {
+            name: self.retired_stats.get(name, 0) + sum(worker.stats.get(name, 0) for worker in self.workers)
+            for name in _COUNTER_STATS + _GAUGE_STATS
+        }
+        totals.update({
+            "workers": self.worker_count,
+            "workers_alive": sum(1 for worker in self.workers if worker.alive),
+            "worker_restarts": sum(worker.restart_count for worker in self.workers),
+            "dedup_entries": self.table.count,
+            "dedup_fill_percent": self.table.count / self.table.max_entries * 100,
+            "dedup_repairs": self.dedup_repair_count,
+        })
+        return totals
+
+    def _log_stats(self):
+        stats = self.get_stats()
+        now = time.monotonic()
+        logged_at, messages_then, frames_then = self.stats_snapshot
+        elapsed = max(now - logged_at, 1e-9)
+        self.stats_snapshot = (now, stats["messages"], stats["frames"])
+        stats["messages_per_second"] = f"{(stats['messages'] - messages_then) / elapsed:.1f}"
+        stats["frames_per_second"] = f"{(stats['frames'] - frames_then) / elapsed:.1f}"
+        stats["dedup_fill_percent"] = f"{stats['dedup_fill_percent']:.1f}"
+        logger.info("STATS", extra=stats)
+
+    def _forward_signal(self, sig: int):
+        # Profiler toggles are per process, so they go to every live worker
+        for worker in self.workers:
+            if worker.alive:
+                os.kill(worker.process.pid, sig)
+        logger.info("Forwarded signal to workers", extra={"signal": signal.Signals(sig).name})
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+        for sig in (signal.SIGUSR1, signal.SIGUSR2):
+            loop.add_signal_handler(sig, self._forward_signal, sig)
+
+        logger.info("Starting supervisor", extra={
+            "workers": self.worker_count, "endpoints": len(config.WEBSOCKET_ENDPOINTS),
+            "shared_dedup": self.table.shared_name, "dedup_mb": round(self.table.nbytes / (1024 * 1024), 1),
+        })
+        if self.metrics_server:
+            await self.metrics_server.start()
+        for worker in self.workers:
+            self._spawn(worker)
+
+        next_stats = time.monotonic() + config.STATS_LOG_INTERVAL_SECONDS
+        try:
+            while not self.stopping.is_set():
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+                self._check_workers()
+                if time.monotonic() >= next_stats:
+                    next_stats += config.STATS_LOG_INTERVAL_SECONDS
+                    self._log_stats()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        self.stopping.set()
+        logger.info("Stopping workers")
+        running = [worker for worker in self.workers if worker.process is not None]
+        for worker in running:
+            self._send(worker, ("stop", None))
+
+        deadline = time.monotonic() + config.WORKER_SHUTDOWN_TIMEOUT_SECONDS
+        for worker in running:
+            await asyncio.get_running_loop().run_in_executor(
+                None, worker.process.join, max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.error("Worker did not stop in time, terminating", extra={"worker": worker.index})
+                worker.process.terminate()
+                worker.process.join(5)
+            self._on_exit(worker)
+
+        if self.dedup_repair is not None:
+            await self.dedup_repair
+        self._log_stats()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        self.table.close()
+        logger.info("Supervisor stopped")
@@ -0,0 +1,95 @@
+# tests/test_batch_policy.py
+# BatchPolicy triggers, alone and through EntropyProcessor's buffer.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from batch_policy import BYTES, DEADLINE, FLUSH, MAX_MESSAGES, SIZE, BatchPolicy
+from entropy_processor import EntropyProcessor
+
+
+def test_deadline_is_off_by_default():
+    assert config.MESSAGE_BATCH_MAX_AGE_SECONDS in (None, 0)
+    policy = BatchPolicy(batch_size=10)
+    assert policy.max_age_seconds is None
+    assert policy.on_timer(5, 3600.0) is None
+
+
+def test_zero_max_age_disables_the_deadline():
+    assert BatchPolicy(batch_size=10, max_age_seconds=0).max_age_seconds is None
+
+
+def test_size_trigger():
+    policy = BatchPolicy(batch_size=3, max_age_seconds=None, min_sources=1)
+    assert policy.on_message(2, 100, 1) is None
+    assert policy.on_message(3, 100, 1) == SIZE
+
+
+def test_bytes_trigger():
+    policy = BatchPolicy(batch_size=100, max_age_seconds=None, max_bytes=1000, min_sources=1)
+    assert policy.on_message(2, 999, 1) is None
+    assert policy.on_message(2, 1000, 1) == BYTES
+
+
+def test_size_and_bytes_wait_for_min_sources():
+    policy = BatchPolicy(batch_size=3, max_age_seconds=None, max_bytes=1000, min_sources=2, max_messages=10)
+    assert policy.on_message(5, 5000, 1) is None
+    assert policy.on_message(5, 5000, 2) == SIZE
+
+
+def test_max_messages_ignores_min_sources():
+    policy = BatchPolicy(batch_size=3, max_age_seconds=None, min_sources=2, max_messages=8)
+    assert policy.on_message(7, 0, 1) is None
+    assert policy.on_message(8, 0, 1) == MAX_MESSAGES
+
+
+def test_max_messages_is_at_least_batch_size():
+    assert BatchPolicy(batch_size=50, max_messages=10).max_messages == 50
+
+
+def test_deadline_trigger():
+    policy = BatchPolicy(batch_size=10, max_age_seconds=2.0, deadline_min_messages=3)
+    assert policy.on_timer(3, 1.9) is None
+    assert policy.on_timer(2, 5.0) is None
+    assert policy.on_timer(3, 2.0) == DEADLINE
+
+
+def test_processor_emits_on_size_with_source_mask():
+    processor = EntropyProcessor(BatchPolicy(batch_size=3, max_age_seconds=None, min_sources=1))
+    assert processor.collect(b"a", 0) is None
+    assert processor.collect("b", 2) is None
+    batch, mask = processor.collect(b"c", 65)
+    assert batch == [b"a", b"b", b"c"]
+    assert mask == 0b111
+    assert processor.get_buffer_size() == 0
+    assert processor.get_stats()["batch_triggers"] == {SIZE: 1}
+
+
+def test_processor_deadline():
+    processor = EntropyProcessor(BatchPolicy(batch_size=10, max_age_seconds=0.05, deadline_min_messages=1))
+    assert processor.next_deadline() is None
+    processor.collect(b"a", 1)
+    assert processor.collect_due() is None
+    assert processor.next_deadline() <= time.monotonic() + 0.05
+    time.sleep(0.06)
+    assert processor.collect_due() == ([b"a"], 0b10)
+    assert processor.get_stats()["batch_triggers"] == {DEADLINE: 1}
+
+
+def test_processor_without_deadline_never_comes_due():
+    processor = EntropyProcessor(BatchPolicy(batch_size=10, max_age_seconds=None))
+    processor.collect(b"a", 0)
+    assert processor.next_deadline() is None
+    assert processor.collect_due() is None
+
+
+def test_shutdown_flush_takes_a_partial_batch():
+    processor = EntropyProcessor(BatchPolicy(batch_size=10, max_age_seconds=None))
+    assert processor.collect_due(flush=True) is None
+    processor.collect(b"a", 0)
+    processor.collect(b"b", 0)
+    assert processor.collect_due(flush=True) == ([b"a", b"b"], 0b1)
+    assert processor.get_stats()["batch_triggers"] == {FLUSH: 1}
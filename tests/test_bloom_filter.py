@@ -0,0 +1,120 @@
+# tests/test_bloom_filter.py
+# RotatingBloomFilter: generation rotation by count and age, carry-over and retirement.
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bloom_filter
+from bloom_filter import RotatingBloomFilter
+
+
+def digest(i):
+    return hashlib.sha256(b"message-%d" % i).digest()
+
+
+def make_filter(generations=3, entries=100, **kwargs):
+    return RotatingBloomFilter(generations, entries, 1e-6, **kwargs)
+
+
+def test_add_and_contains():
+    bloom = make_filter()
+    assert bloom.add(digest(1))
+    assert not bloom.add(digest(1))
+    assert bloom.contains(digest(1))
+    assert not bloom.contains(digest(2))
+    assert bloom.count == 1
+
+
+def test_rotates_when_the_newest_generation_is_full():
+    bloom = make_filter(entries=100)
+    for i in range(100):
+        bloom.add(digest(i))
+    assert bloom.rotation_count == 0
+    bloom.add(digest(100))
+    assert bloom.rotation_count == 1
+    assert bloom.get_stats()["generations"] == 2
+    assert all(bloom.contains(digest(i)) for i in range(101))
+
+
+def test_oldest_generation_is_retired():
+    bloom = make_filter(generations=3, entries=100)
+    for i in range(300):
+        bloom.add(digest(i))
+    assert bloom.eviction_count == 0
+    bloom.add(digest(300))
+    assert bloom.rotation_count == 3
+    assert bloom.eviction_count == 100
+    assert bloom.count == 201
+    assert bloom.get_stats()["generations"] == 3
+    assert not any(bloom.contains(digest(i)) for i in range(100))
+    assert all(bloom.contains(digest(i)) for i in range(100, 301))
+
+
+def test_reseen_entries_are_carried_forward():
+    bloom = make_filter(generations=2, entries=100)
+    for i in range(100):
+        bloom.add(digest(i))
+    # digest(0) lives in the old generation; seeing it again copies it forward
+    assert not bloom.add(digest(0))
+    for i in range(100, 199):
+        bloom.add(digest(i))
+    bloom.add(digest(199))
+    assert not bloom.contains(digest(1))
+    assert bloom.contains(digest(0))
+
+
+def test_rotates_by_age(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(bloom_filter.time, "monotonic", lambda: now[0])
+    bloom = make_filter(entries=1000, generation_seconds=60)
+    bloom.add(digest(1))
+    now[0] += 59
+    bloom.add(digest(2))
+    assert bloom.rotation_count == 0
+    now[0] += 1
+    bloom.add(digest(3))
+    assert bloom.rotation_count == 1
+
+
+def test_set_generations_retires_the_oldest():
+    bloom = make_filter(generations=4, entries=100)
+    for i in range(350):
+        bloom.add(digest(i))
+    bloom.set_generations(2)
+    assert bloom.get_stats()["generations"] == 2
+    assert bloom.count == 150
+    assert bloom.eviction_count == 200
+    assert bloom.nbytes == 2 * bloom.generation_bytes
+    assert not bloom.contains(digest(0))
+    assert bloom.contains(digest(349))
+    bloom.set_generations(4)
+    for i in range(350, 650):
+        bloom.add(digest(i))
+    assert bloom.get_stats()["generations"] == 4
+
+
+def test_memory_budget_caps_generation_size():
+    bloom = RotatingBloomFilter(4, 10 ** 9, 1e-3, max_bytes=1024 * 1024)
+    assert bloom.nbytes <= 1024 * 1024
+    assert bloom.generation_entries < 10 ** 9
+
+
+def test_measured_false_positive_rate_stays_near_target():
+    bloom = RotatingBloomFilter(2, 5000, 0.01, fp_sample_rate=1)
+    for i in range(10000):
+        bloom.add(digest(i))
+    stats = bloom.get_stats()
+    assert stats["fp_samples"] == 10000
+    assert stats["measured_fp_rate"] < 0.02
+
+
+@pytest.mark.parametrize("kwargs", [{"generations": 0}, {"false_positive_rate": 1.0}])
+def test_rejects_bad_settings(kwargs):
+    settings = {"generations": 2, "generation_entries": 10, "false_positive_rate": 0.01}
+    settings.update(kwargs)
+    with pytest.raises(ValueError):
+        RotatingBloomFilter(**settings)
@@ -0,0 +1,189 @@
+# tests/test_compact_digest_table.py
+# CompactDigestTable: membership, FIFO eviction, backward-shift deletion and snapshots.
+import os
+import random
+import struct
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deduplication_buffer import CompactDigestTable
+
+
+def key(k0, k1=None):
+    return struct.pack('<Q', k0) if k1 is None else struct.pack('<QQ', k0, k1)
+
+
+def colliding(table, home, n):
+    # n keys whose probe chains all start at slot home
+    return [key(home + table.capacity * i) for i in range(1, n + 1)]
+
+
+def test_add_and_contains():
+    table = CompactDigestTable(100)
+    assert table.add(key(42))
+    assert not table.add(key(42))
+    assert table.contains(key(42))
+    assert not table.contains(key(43))
+    assert table.count == 1
+    table.close()
+
+
+def test_zero_word_is_still_a_key():
+    table = CompactDigestTable(100)
+    assert table.add(bytes(8))
+    assert table.contains(bytes(8))
+    assert not table.add(bytes(8))
+    table.close()
+
+
+def test_sixteen_byte_digests_compare_both_words():
+    table = CompactDigestTable(100, digest_bytes=16)
+    assert table.add(key(7, 1))
+    assert table.add(key(7, 2))
+    assert table.contains(key(7, 1)) and table.contains(key(7, 2))
+    assert not table.contains(key(7, 3))
+    table.close()
+
+
+def test_evicts_oldest_first():
+    table = CompactDigestTable(4)
+    for k in range(1, 5):
+        table.add(key(k))
+    table.add(key(5))
+    assert table.count == 4
+    assert table.eviction_count == 1
+    assert not table.contains(key(1))
+    assert all(table.contains(key(k)) for k in range(2, 6))
+    # A re-added key counts as new
+    assert table.add(key(1))
+    assert not table.contains(key(2))
+    table.close()
+
+
+@pytest.mark.parametrize("digest_bytes", [8, 16])
+def test_backward_shift_keeps_probe_chains(digest_bytes):
+    table = CompactDigestTable(6, digest_bytes=digest_bytes, load_factor=0.9)
+    keys = colliding(table, 2, 6)
+    if digest_bytes == 16:
+        keys = [k + struct.pack('<Q', i) for i, k in enumerate(keys)]
+    for k in keys:
+        table.add(k)
+    # Evicting the head of the chain shifts every later key back one slot
+    table.add(key(10 ** 6) + (bytes(8) if digest_bytes == 16 else b""))
+    assert not table.contains(keys[0])
+    assert all(table.contains(k) for k in keys[1:])
+    table.close()
+
+
+def test_backward_shift_across_the_end_of_the_table():
+    table = CompactDigestTable(8, load_factor=0.9)
+    last = table.capacity - 1
+    wrapped = colliding(table, last, 4)
+    for k in wrapped:
+        table.add(k)
+    for k in range(4):
+        table.add(key(10 ** 6 + k))
+    assert table.add(key(2 * 10 ** 6))
+    assert not table.contains(wrapped[0])
+    assert all(table.contains(k) for k in wrapped[1:])
+    table.close()
+
+
+@pytest.mark.parametrize("digest_bytes", [8, 16])
+def test_matches_a_reference_fifo(digest_bytes):
+    rng = random.Random(1)
+    table = CompactDigestTable(64, digest_bytes=digest_bytes, load_factor=0.9)
+    reference = OrderedDict()
+    for _ in range(5000):
+        # A small key space forces collisions, repeats and long chains
+        digest = key(rng.randrange(1, 40) * table.capacity + rng.randrange(3)) + bytes(digest_bytes - 8)
+        added = table.add(digest)
+        assert added == (digest not in reference)
+        if added:
+            reference[digest] = None
+            if len(reference) > 64:
+                reference.popitem(last=False)
+    assert table.count == len(reference)
+    assert all(table.contains(digest) for digest in reference)
+    table.close()
+
+
+def test_rebuild_index_restores_membership():
+    table = CompactDigestTable(50)
+    for k in range(1, 80):
+        table.add(key(k * 7919))
+    expected = [k for k in range(1, 80) if table.contains(key(k * 7919))]
+    for slot in range(table.capacity):
+        table._table[slot] = 0
+    table.rebuild_index()
+    assert [k for k in range(1, 80) if table.contains(key(k * 7919))] == expected
+    assert len(expected) == 50
+    table.close()
+
+
+def test_max_bytes_caps_entries():
+    table = CompactDigestTable(10 ** 9, max_bytes=1024 * 1024)
+    assert table.nbytes <= 1024 * 1024
+    table.close()
+    with pytest.raises(ValueError):
+        CompactDigestTable(10, max_bytes=4096)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    table = CompactDigestTable(32, path=path)
+    for k in range(1, 40):
+        table.add(key(k))
+    table.close()
+
+    restored = CompactDigestTable(32, path=path)
+    assert restored.restored and not restored.repaired
+    assert restored.count == 32
+    assert not restored.contains(key(7))
+    assert restored.contains(key(8)) and restored.contains(key(39))
+    # The ring carries on where it left off
+    restored.add(key(100))
+    assert not restored.contains(key(8))
+    restored.close()
+
+
+def test_snapshot_with_other_geometry_starts_empty(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    table = CompactDigestTable(32, path=path)
+    table.add(key(1))
+    table.close()
+    other = CompactDigestTable(64, path=path)
+    assert not other.restored
+    assert other.count == 0
+    other.close()
+
+
+def test_snapshot_is_locked_while_open(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    table = CompactDigestTable(32, path=path)
+    with pytest.raises(RuntimeError):
+        CompactDigestTable(32, path=path)
+    table.close()
+
+
+def test_shared_table_is_seen_by_an_attached_copy():
+    owner = CompactDigestTable(32, shared=True)
+    attached = CompactDigestTable(32, shared=owner.shared_name)
+    owner.add(key(5))
+    assert attached.contains(key(5))
+    assert not attached.add(key(5))
+    attached.holder = 1234
+    assert owner.holder == 1234
+    attached.close()
+    owner.close()
+
+
+def test_shared_table_rejects_other_geometry():
+    owner = CompactDigestTable(32, shared=True)
+    with pytest.raises(RuntimeError):
+        CompactDigestTable(32, digest_bytes=16, shared=owner.shared_name)
+    owner.close()
@@ -0,0 +1,158 @@
+# tests/test_connection_scheduler.py
+# ConnectionScheduler: backoff with full jitter, demotion and failover targets.
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import connection_scheduler
+from connection_scheduler import ConnectionScheduler
+
+GROUP = ["wss://a.example", "wss://b.example", "wss://c.example"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(connection_scheduler, "_clock", clock)
+
+    async def sleep(seconds):
+        clock.now += seconds
+    monkeypatch.setattr(connection_scheduler.asyncio, "sleep", sleep)
+    return clock
+
+
+@pytest.fixture
+def scheduler(monkeypatch, clock):
+    monkeypatch.setattr(config, "RECONNECT_FAILOVER_GROUPS", [GROUP])
+    monkeypatch.setattr(config, "RECONNECT_DELAY_SECONDS", 5)
+    monkeypatch.setattr(config, "RECONNECT_MAX_DELAY_SECONDS", 60)
+    monkeypatch.setattr(config, "RECONNECT_STABLE_SECONDS", 30)
+    monkeypatch.setattr(config, "CONNECT_STAGGER_SECONDS", 0.5)
+    monkeypatch.setattr(config, "ENDPOINT_DEMOTE_FAILURES", 3)
+    monkeypatch.setattr(config, "ENDPOINT_DEMOTE_SECONDS", 600)
+    return ConnectionScheduler()
+
+
+def fail(scheduler, health, times=1):
+    for _ in range(times):
+        scheduler.on_disconnect(health, error=True)
+
+
+def test_backoff_doubles_up_to_the_cap(scheduler, monkeypatch):
+    monkeypatch.setattr(connection_scheduler.random, "uniform", lambda low, high: high)
+    health = scheduler.register("wss://solo.example")
+    assert scheduler.backoff(health) == 5
+    ceilings = []
+    for _ in range(6):
+        fail(scheduler, health)
+        ceilings.append(scheduler.backoff(health))
+    assert ceilings == [5, 10, 20, 40, 60, 60]
+
+
+def test_backoff_is_fully_jittered(scheduler):
+    health = scheduler.register("wss://solo.example")
+    fail(scheduler, health, 2)
+    delays = [scheduler.backoff(health) for _ in range(200)]
+    assert all(0 <= delay <= 10 for delay in delays)
+    assert min(delays) < 2 and max(delays) > 8
+
+
+def test_connect_attempts_are_staggered(scheduler, clock):
+    first, second = scheduler.register("wss://one.example"), scheduler.register("wss://two.example")
+
+    async def run():
+        await asyncio.gather(scheduler.wait_turn(first), scheduler.wait_turn(second))
+    started = clock.now
+    asyncio.run(run())
+    assert clock.now - started == pytest.approx(0.5)
+    assert first.attempts == second.attempts == 1
+
+
+def test_stable_connection_resets_failures(scheduler, clock):
+    health = scheduler.register("wss://solo.example")
+    fail(scheduler, health, 2)
+    scheduler.on_connect(health)
+    clock.now += 31
+    scheduler.on_disconnect(health)
+    assert health.failures == 0
+
+
+def test_short_connection_counts_as_a_failure(scheduler, clock):
+    health = scheduler.register("wss://solo.example")
+    scheduler.on_connect(health)
+    clock.now += 5
+    scheduler.on_disconnect(health)
+    assert health.failures == 1
+
+
+def test_demotion_waits_then_starts_afresh(scheduler, clock):
+    health = scheduler.register("wss://solo.example")
+    fail(scheduler, health, 3)
+    assert health.demoted_until == clock.now + 600
+    assert health.score(clock.now) == 0.0
+
+    demoted_at = clock.now
+    asyncio.run(scheduler.wait_turn(health))
+    assert clock.now >= demoted_at + 600
+    assert health.failures == 0
+    assert not health.get_stats(clock.now)["demoted"]
+
+    # One more failure after the demotion is not enough to demote again
+    fail(scheduler, health)
+    assert health.demoted_until == 0.0
+    fail(scheduler, health, 2)
+    assert health.demoted_until == clock.now + 600
+
+
+def test_failover_moves_through_the_group(scheduler):
+    health = scheduler.register(GROUP[0])
+    assert scheduler.target(health) == GROUP[0]
+    fail(scheduler, health)
+    assert scheduler.target(health) == GROUP[1]
+    fail(scheduler, health)
+    assert scheduler.target(health) == GROUP[2]
+
+
+def test_failover_skips_servers_already_connected(scheduler):
+    health = scheduler.register(GROUP[0])
+    other = scheduler.register(GROUP[1])
+    scheduler.on_connect(other, GROUP[1])
+    fail(scheduler, health)
+    assert scheduler.target(health) == GROUP[2]
+
+    # A member that failed over to another server frees its own
+    moved = scheduler.register(GROUP[2])
+    fail(scheduler, moved)
+    scheduler.on_connect(moved, GROUP[0])
+    fail(scheduler, health, 2)
+    assert scheduler.target(health) == GROUP[2]
+
+
+def test_failover_falls_back_to_its_own_url(scheduler):
+    health = scheduler.register(GROUP[0])
+    for url in GROUP:
+        other = scheduler.register(url + "/mirror")
+        scheduler.on_connect(other, url)
+    fail(scheduler, health)
+    assert scheduler.target(health) == GROUP[0]
+
+
+def test_disconnect_clears_the_connected_target(scheduler):
+    health = scheduler.register(GROUP[1])
+    scheduler.on_connect(health, GROUP[2])
+    assert health.get_stats(1000.0)["connected_to"] == GROUP[2]
+    scheduler.on_disconnect(health)
+    assert health.connected_to is None
@@ -0,0 +1,74 @@
+# tests/test_endpoints.py
+# EndpointRegistry: parsing, numbering, and entries added after construction.
+import base64
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import endpoints
+from endpoints import SEPARATOR, EndpointRegistry, endpoint_registry, parse_endpoint
+
+INIT = '{"op":"subscribe"}'
+CONFIGS = [
+    "wss://one.example/stream",
+    "wss://two.example/feed" + SEPARATOR + base64.b64encode(INIT.encode()).decode(),
+]
+
+
+def test_parse_endpoint_decodes_init_message():
+    endpoint = parse_endpoint(CONFIGS[1], 7)
+    assert endpoint.url == "wss://two.example/feed"
+    assert endpoint.index == 7
+    assert endpoint.init_message == INIT
+    assert endpoint.config == CONFIGS[1]
+
+
+def test_parse_endpoint_bad_init_message():
+    endpoint = parse_endpoint("wss://three.example" + SEPARATOR + "not base64!", 0)
+    assert endpoint.url == "wss://three.example"
+    assert endpoint.init_message is None
+
+
+def test_registry_numbers_entries_in_order():
+    registry = EndpointRegistry(CONFIGS)
+    assert [endpoint.index for endpoint in registry] == [0, 1]
+    assert registry.urls == ["wss://one.example/stream", "wss://two.example/feed"]
+    assert len(registry) == 2
+    assert registry.get(CONFIGS[1]) is registry.by_url["wss://two.example/feed"]
+
+
+def test_entries_parsed_on_first_use_show_up_by_url():
+    registry = EndpointRegistry(CONFIGS)
+    by_url = registry.by_url
+    extra = registry.get("wss://replay.example/capture")
+    assert extra.index == 2
+    assert by_url["wss://replay.example/capture"] is extra
+    assert registry.resolve(CONFIGS + ["wss://replay.example/capture"])[-1] is extra
+    assert len(registry) == 3
+
+
+def test_by_url_is_read_only():
+    registry = EndpointRegistry(CONFIGS)
+    with pytest.raises(TypeError):
+        registry.by_url["wss://other.example"] = None
+
+
+def test_websocket_options_match_url_substring(monkeypatch):
+    monkeypatch.setattr(config, "WEBSOCKET_OPTIONS", {"": {"max_size": 1, "ping_interval": 5}, "two.example": {"max_size": 2}})
+    registry = EndpointRegistry(CONFIGS)
+    assert dict(registry.get(CONFIGS[0]).options) == {"max_size": 1, "ping_interval": 5}
+    assert dict(registry.get(CONFIGS[1]).options) == {"max_size": 2, "ping_interval": 5}
+
+
+def test_endpoint_registry_rebuilt_when_config_changes(monkeypatch):
+    monkeypatch.setattr(endpoints, "_registry", None)
+    monkeypatch.setattr(config, "WEBSOCKET_ENDPOINTS", CONFIGS)
+    first = endpoint_registry()
+    assert endpoint_registry() is first
+    monkeypatch.setattr(config, "WEBSOCKET_ENDPOINTS", CONFIGS[:1])
+    assert endpoint_registry() is not first
+    assert endpoint_registry().urls == ["wss://one.example/stream"]
@@ -0,0 +1,139 @@
+# tests/test_entropy_pool.py
+# EntropyPool: ring wraparound, all-or-nothing fills and the empty-pool policies.
+import asyncio
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from entropy_pool import POLICY_BLOCK, POLICY_DRBG, POLICY_ERROR, EntropyPool, EntropyServer
+
+
+def digest(i):
+    return hashlib.sha512(b"digest-%d" % i).digest()
+
+
+def joined(chunks):
+    return b"".join(bytes(chunk) for chunk in chunks)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        EntropyPool(1024, "spin")
+
+
+def test_bytes_are_served_once_in_order():
+    pool = EntropyPool(256, POLICY_ERROR)
+    assert pool.fill(digest(0)) and pool.fill(digest(1))
+    assert joined(pool.take(100)) == (digest(0) + digest(1))[:100]
+    assert joined(pool.take(100)) == (digest(0) + digest(1))[100:]
+    assert pool.take(10) == []
+    assert pool.served_bytes == 128 and pool.size == 0
+
+
+def test_fill_and_take_wrap_around_the_ring():
+    pool = EntropyPool(160, POLICY_ERROR)
+    pool.fill(digest(0))
+    pool.fill(digest(1))
+    pool.take(100)
+    # The third digest straddles the end of the ring
+    assert pool.fill(digest(2))
+    chunks = pool.take(92)
+    assert len(chunks) == 2
+    assert joined(chunks) == (digest(1) + digest(2))[36:]
+
+
+def test_fill_is_all_or_nothing():
+    pool = EntropyPool(100, POLICY_ERROR)
+    assert pool.fill(digest(0))
+    assert not pool.fill(digest(1))
+    assert pool.size == 64
+    assert pool.overflow_bytes == 64
+
+
+def test_error_policy_refuses_short_requests():
+    pool = EntropyPool(256, POLICY_ERROR)
+    pool.fill(digest(0))
+    assert asyncio.run(pool.acquire(65)) is None
+    assert pool.empty_count == 1
+    assert pool.size == 64
+
+
+def test_block_policy_waits_for_a_fill(monkeypatch):
+    monkeypatch.setattr(config, "ENTROPY_POOL_BLOCK_TIMEOUT_SECONDS", 5)
+
+    async def run():
+        pool = EntropyPool(256, POLICY_BLOCK)
+        waiting = asyncio.ensure_future(pool.acquire(96))
+        await asyncio.sleep(0)
+        pool.fill(digest(0))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        pool.fill(digest(1))
+        return joined(await waiting)
+    assert asyncio.run(run()) == (digest(0) + digest(1))[:96]
+
+
+def test_block_policy_times_out(monkeypatch):
+    monkeypatch.setattr(config, "ENTROPY_POOL_BLOCK_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        return await EntropyPool(256, POLICY_BLOCK).acquire(32)
+    assert asyncio.run(run()) is None
+
+
+def test_drbg_policy_seeds_from_the_first_fill_and_covers_the_shortfall():
+    pool = EntropyPool(1024, POLICY_DRBG)
+    pool.fill(digest(0))
+    assert pool.drbg is not None
+    # 48 bytes went to instantiate the DRBG
+    assert pool.size == 16
+    chunks = asyncio.run(pool.acquire(100))
+    assert len(joined(chunks)) == 100
+    assert joined(chunks)[:16] == digest(0)[48:]
+    assert pool.drbg_bytes == 84
+
+
+def test_drbg_is_reseeded_once_drawn_on():
+    pool = EntropyPool(1024, POLICY_DRBG)
+    pool.fill(digest(0))
+    pool.fill(digest(1))
+    assert pool.size == 16 + 64
+    asyncio.run(pool.acquire(200))
+    pool.fill(digest(2))
+    assert pool.size == 32
+
+
+def test_drbg_output_is_capped_per_seed(monkeypatch):
+    monkeypatch.setattr(config, "ENTROPY_POOL_DRBG_MAX_BYTES_PER_SEED", 1000)
+    pool = EntropyPool(1024, POLICY_DRBG)
+    pool.fill(digest(0))
+    assert asyncio.run(pool.acquire(600)) is not None
+    assert asyncio.run(pool.acquire(600)) is None
+    pool.fill(digest(1))
+    assert asyncio.run(pool.acquire(600)) is not None
+
+
+def test_drbg_policy_without_a_seed_refuses():
+    assert asyncio.run(EntropyPool(1024, POLICY_DRBG).acquire(10)) is None
+
+
+def test_server_responses(monkeypatch):
+    monkeypatch.setattr(config, "ENTROPY_SERVER_MAX_REQUEST_BYTES", 4096)
+    pool = EntropyPool(1024, POLICY_ERROR)
+    pool.fill(digest(0))
+    server = EntropyServer(pool, port=0, unix_path="")
+
+    async def respond(request):
+        status, chunks, _ = await server._respond(request)
+        return status.split(" ", 1)[0], joined(chunks)
+    assert asyncio.run(respond(b"GET /bytes?n=32 HTTP/1.1")) == ("200", digest(0)[:32])
+    assert asyncio.run(respond(b"GET /bytes?n=64 HTTP/1.1"))[0] == "503"
+    assert asyncio.run(respond(b"GET /bytes?n=0 HTTP/1.1"))[0] == "400"
+    assert asyncio.run(respond(b"GET /bytes?n=x HTTP/1.1"))[0] == "400"
+    assert asyncio.run(respond(b"GET /other HTTP/1.1"))[0] == "404"
+    assert asyncio.run(respond(b"POST /bytes HTTP/1.1"))[0] == "405"
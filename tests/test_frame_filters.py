@@ -0,0 +1,105 @@
+# tests/test_frame_filters.py
+# FrameFilters: per-endpoint rule binding, drop and strip actions, and the shipped rules.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from frame_filters import DROP, STRIP, FrameFilters, FrameRule
+
+RULES = [
+    {"name": "test_heartbeat", "endpoints": ["feed.example"], "prefix": b'{"type":"heartbeat"'},
+    {"name": "test_ack", "endpoints": ["feed.example", "other.example"], "pattern": rb'"op":"(?:ack|pong)"', "window": 32},
+    {"name": "test_envelope", "endpoints": ["feed.example"], "action": STRIP, "strip": rb'"ts":\d+,'},
+]
+
+
+@pytest.fixture
+def filters():
+    return FrameFilters(RULES)
+
+
+def test_unfiltered_endpoints_get_no_filter(filters):
+    assert filters.for_endpoint("wss://quiet.example/ws") is None
+    assert filters.apply("wss://quiet.example/ws", b'{"type":"heartbeat"}') == b'{"type":"heartbeat"}'
+
+
+def test_rules_bind_per_endpoint(filters):
+    feed = filters.for_endpoint("wss://feed.example/ws")
+    other = filters.for_endpoint("wss://other.example/ws")
+    assert feed is filters.for_endpoint("wss://feed.example/ws")
+    assert feed(b'{"type":"heartbeat","n":1}') is None
+    assert other(b'{"type":"heartbeat","n":1}') == b'{"type":"heartbeat","n":1}'
+    assert other(b'{"op":"pong"}') is None
+
+
+def test_pattern_only_searches_the_window(filters):
+    other = filters.for_endpoint("wss://other.example/ws")
+    late = b'{"data":"' + b"x" * 40 + b'","op":"ack"}'
+    assert other(late) == late
+
+
+def test_strip_normalizes_and_keeps_the_frame(filters):
+    feed = filters.for_endpoint("wss://feed.example/ws")
+    assert feed(b'{"ts":123,"price":1}') == b'{"price":1}'
+    assert feed(b'{"ts":456,"price":1}') == b'{"price":1}'
+    assert feed(b'{"price":2}') == b'{"price":2}'
+
+
+def test_counts_per_rule(filters):
+    feed = filters.for_endpoint("wss://feed.example/ws")
+    feed(b'{"type":"heartbeat"}')
+    feed(b'{"op":"ack"}')
+    feed(b'{"ts":1,"price":1}')
+    stats = filters.get_stats()
+    assert stats["filtered_frames"] == 2
+    assert stats["normalized_frames"] == 1
+    assert stats["filtered_bytes"] == len(b'{"type":"heartbeat"}') + len(b'{"op":"ack"}') + len(b'"ts":1,')
+
+
+def test_rule_without_endpoints_applies_everywhere():
+    filters = FrameFilters([{"name": "any_pong", "prefix": b"pong"}])
+    assert filters.apply("wss://anything.example", b"pong") is None
+
+
+def test_disabled_filters_load_no_rules(monkeypatch):
+    monkeypatch.setattr(config, "FRAME_FILTERS_ENABLED", False)
+    assert FrameFilters(RULES).for_endpoint("wss://feed.example/ws") is None
+
+
+@pytest.mark.parametrize("spec", [
+    {"name": "bad_action", "action": "rewrite", "prefix": b"x"},
+    {"name": "strip_without_pattern", "action": STRIP},
+    {"name": "drop_without_match", "action": DROP},
+])
+def test_rejects_bad_rules(spec):
+    with pytest.raises(ValueError):
+        FrameRule(**spec)
+
+
+@pytest.mark.parametrize("url, frame", [
+    ("wss://advanced-trade-ws.coinbase.com", b'{"channel":"heartbeats","client_id":""}'),
+    ("wss://advanced-trade-ws.coinbase.com", b'{"channel":"subscriptions","events":[]}'),
+    ("wss://ws.kraken.com/v2", b'{"channel":"heartbeat"}'),
+    ("wss://ws.kraken.com/v2", b'{"method":"subscribe","success":true}'),
+    ("wss://ws.okx.com:8443/ws/v5/public", b"pong"),
+    ("wss://ws.okx.com:8443/ws/v5/public", b'{"event":"subscribe","arg":{}}'),
+    ("wss://stream.bybit.com/v5/public/spot", b'{"success":true,"ret_msg":"","op":"subscribe"}'),
+    ("wss://ws.blockchain.info/inv", b'{"op":"pong"}'),
+    ("wss://certstream.calidog.io", b'{"message_type": "heartbeat", "timestamp": 1}'),
+])
+def test_shipped_rules_drop_protocol_chatter(url, frame):
+    assert FrameFilters().apply(url, frame) is None
+
+
+@pytest.mark.parametrize("url, frame", [
+    ("wss://advanced-trade-ws.coinbase.com", b'{"channel":"market_trades","events":[]}'),
+    ("wss://ws.kraken.com/v2", b'{"channel":"trade","data":[]}'),
+    ("wss://ws.okx.com:8443/ws/v5/public", b'{"arg":{"channel":"trades"},"data":[]}'),
+    ("wss://stream.bybit.com/v5/public/spot", b'{"topic":"publicTrade.BTCUSDT","data":[]}'),
+])
+def test_shipped_rules_keep_payloads(url, frame):
+    assert FrameFilters().apply(url, frame) == frame
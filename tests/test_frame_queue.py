@@ -0,0 +1,96 @@
+# tests/test_frame_queue.py
+# FrameQueue: byte bounds and the three full-queue policies.
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_queue import BLOCK, DROP_NEWEST, DROP_OLDEST, FrameQueue
+
+
+def put_all(queue, frames):
+    async def put():
+        return [await queue.put(frame) for frame in frames]
+    return asyncio.run(put())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FrameQueue(100, "drop_random")
+
+
+def test_drop_oldest_keeps_the_newest_frames_within_bounds():
+    queue = FrameQueue(100, DROP_OLDEST)
+    dropped = put_all(queue, [b"a" * 40, b"b" * 40, b"c" * 40])
+    assert dropped == [0, 0, 1]
+    assert queue.bytes == 80
+    assert queue.drain(10) == [b"b" * 40, b"c" * 40]
+    assert queue.dropped_count == 1 and queue.dropped_bytes == 40
+
+
+def test_drop_oldest_evicts_as_many_as_needed():
+    queue = FrameQueue(100, DROP_OLDEST)
+    dropped = put_all(queue, [b"a" * 30, b"b" * 30, b"c" * 30, b"d" * 90])
+    assert dropped == [0, 0, 0, 3]
+    assert queue.drain(10) == [b"d" * 90]
+
+
+def test_drop_newest_rejects_the_incoming_frame():
+    queue = FrameQueue(100, DROP_NEWEST)
+    dropped = put_all(queue, [b"a" * 60, b"b" * 60, b"c" * 40])
+    assert dropped == [0, 1, 0]
+    assert queue.drain(10) == [b"a" * 60, b"c" * 40]
+    assert queue.enqueued_count == 2
+
+
+def test_oversized_frame_is_admitted_into_an_empty_queue():
+    for policy in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+        queue = FrameQueue(100, policy)
+        put_all(queue, [b"x" * 500])
+        assert queue.bytes == 500 == queue.peak_bytes
+
+
+def test_block_waits_for_space():
+    async def run():
+        queue = FrameQueue(100, BLOCK)
+        await queue.put(b"a" * 80)
+        blocked = asyncio.ensure_future(queue.put(b"b" * 40))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        assert queue.blocked_count == 1
+        assert queue.drain(1) == [b"a" * 80]
+        assert await blocked == 0
+        return queue
+    queue = asyncio.run(run())
+    assert queue.bytes == 40
+    assert queue.dropped_count == 0
+
+
+def test_drain_respects_item_and_byte_limits():
+    queue = FrameQueue(1000)
+    put_all(queue, [b"x" * 30] * 10)
+    assert len(queue.drain(3)) == 3
+    assert queue.drain(10, max_bytes=70) == [b"x" * 30] * 2
+    assert queue.drain(10, max_bytes=20) == []
+    assert len(queue) == 5 and queue.bytes == 150
+
+
+def test_shed_drops_the_oldest_until_enough_is_freed():
+    queue = FrameQueue(1000)
+    put_all(queue, [b"a" * 30, b"b" * 30, b"c" * 30])
+    assert queue.shed(31) == (2, 60)
+    assert queue.drain(10) == [b"c" * 30]
+
+
+def test_head_age_and_stats():
+    queue = FrameQueue(1000)
+    assert queue.head_age() == 0.0
+    put_all(queue, [b"a" * 10, b"b" * 20])
+    assert queue.head_age() >= 0.0
+    stats = queue.get_stats()
+    assert stats["depth"] == 2 and stats["bytes"] == 30 and stats["enqueued"] == 2
+    queue.clear()
+    assert len(queue) == 0 and queue.bytes == 0
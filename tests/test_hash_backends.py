@@ -0,0 +1,115 @@
+# tests/test_hash_backends.py
+# Golden vectors for every hash backend, outside the startup self-test. The
+# expected outputs are pinned here rather than read from hash_backends, so a change
+# to a construction can't pass by updating KNOWN_ANSWERS alongside it.
+import hashlib
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hash_backends
+from entropy_processor import encode_peppers
+from hash_backends import BACKENDS, KNOWN_ANSWERS, Shake256Backend, create_backend, self_test, split_units
+
+BATCH = [b"alpha", b"beta", b"gamma"]
+PEPPERS = [b"pepper-one", b"pepper-two", b"pepper-three"]
+TIMESTAMP = b"20260102030405678901"
+
+VECTORS = {
+    "pepper_rounds": "c39831c52692a06abdd31dcd136b859d7bf98abb04a0690bcd1c2a9a999993359daf0272b82a3fe6ca9e4c424b3ec214f5c9dbe46dd6781239fd1ce6e4463979",
+    "blake2b_keyed": "01473470be73ce8eaeb0dffb82fe08c22e5247c03098b36b30925b69e8586f323a0475151636c2e4e3c759cb829690f5c6c3b3b913737678aef6274abc99314b",
+    "sha3_512": "fa4d0f5e0b8865060ffebf6ec989c0a179f2c6347743dce9aa394dbf96d908f867da60566b757cc835ec85706daad66c498e311c0b1f93e46657faa9e22660c0",
+    "shake256": "5c047acef16c895eb659728afd807833567d9af618e118806f6690f7cf9ebd1cebb0b91a4317cff158da200521156e9bcfe0850841bd007b64bbc1fb99cf3fe68f7d5fa0ea44ee719ccf21adfffae1244335c20e591573139ecd63cb17ed943fd62df6b667e10ec299f3219e87fa5f228ef3852486915028f49077285a98c6cf",
+}
+
+
+def legacy_process_batch(batch, pepper_rounds, timestamp):
+    # EntropyProcessor._process_batch as it was before hash backends existed
+    combined_data = b''.join(batch)
+    rng = random.Random(int(hashlib.sha256(combined_data).hexdigest()[:16], 16))
+    pepper_order = list(range(len(pepper_rounds)))
+    rng.shuffle(pepper_order)
+    current_hash = hashlib.sha512(combined_data).digest()
+    for round_idx in pepper_order:
+        current_hash = hashlib.sha512(current_hash + pepper_rounds[round_idx].encode('utf-8')).digest()
+    return hashlib.sha512(current_hash + timestamp).digest()
+
+
+def make_backend(name):
+    if name == "shake256":
+        return Shake256Backend(PEPPERS, output_bytes=128)
+    return create_backend(PEPPERS, name)
+
+
+def test_every_backend_has_a_vector():
+    assert set(VECTORS) == set(BACKENDS) == set(KNOWN_ANSWERS)
+
+
+@pytest.mark.parametrize("name", sorted(VECTORS))
+def test_known_answer(name):
+    assert make_backend(name).hash(BATCH, TIMESTAMP).hex() == VECTORS[name]
+
+
+@pytest.mark.parametrize("name", sorted(VECTORS))
+def test_startup_vectors_match(name):
+    assert KNOWN_ANSWERS[name] == VECTORS[name]
+
+
+@pytest.mark.parametrize("batch", [
+    BATCH,
+    [b"x"],
+    [b"", b"empty member"],
+    [bytes(range(256)) * 4, b"\xff" * 1000, b"{\"op\":\"pong\"}"],
+])
+def test_pepper_rounds_matches_legacy(batch):
+    peppers = ["pepper-one", "pepper-two", "pepper-three", "pepper-four"]
+    backend = create_backend(encode_peppers(peppers), "pepper_rounds")
+    assert backend.hash(batch, TIMESTAMP) == legacy_process_batch(batch, peppers, TIMESTAMP)
+
+
+@pytest.mark.parametrize("name", sorted(VECTORS))
+def test_output_depends_on_every_input(name):
+    backend = make_backend(name)
+    reference = backend.hash(BATCH, TIMESTAMP)
+    assert backend.hash(BATCH, b"20260102030405678902") != reference
+    assert backend.hash(BATCH[:-1], TIMESTAMP) != reference
+    assert BACKENDS[name](PEPPERS[:-1]).hash(BATCH, TIMESTAMP)[:64] != reference[:64]
+
+
+@pytest.mark.parametrize("name", ["blake2b_keyed", "sha3_512", "shake256"])
+def test_member_boundaries_count(name):
+    backend = make_backend(name)
+    assert backend.hash([b"ab", b"c"], TIMESTAMP) != backend.hash([b"a", b"bc"], TIMESTAMP)
+
+
+def test_shake256_longer_output_extends_shorter():
+    short = Shake256Backend(PEPPERS, output_bytes=64).hash(BATCH, TIMESTAMP)
+    long = Shake256Backend(PEPPERS, output_bytes=256).hash(BATCH, TIMESTAMP)
+    assert len(long) == 256 and long[:64] == short
+    units, sources = split_units([long], [0b101])
+    assert units == [long[offset:offset + 64] for offset in range(0, 256, 64)]
+    assert sources == [0b101] * 4
+
+
+def test_shake256_rejects_partial_units():
+    with pytest.raises(ValueError):
+        Shake256Backend(PEPPERS, output_bytes=100)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend(PEPPERS, "md5")
+
+
+def test_self_test_passes():
+    self_test()
+
+
+def test_self_test_catches_a_changed_construction(monkeypatch):
+    monkeypatch.setitem(hash_backends.KNOWN_ANSWERS, "sha3_512", "00" * 64)
+    with pytest.raises(RuntimeError):
+        self_test(["sha3_512"])
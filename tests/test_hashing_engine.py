@@ -0,0 +1,60 @@
+# tests/test_hashing_engine.py
+# HashingEngine coalescing: results in order, and a bounded number of job tasks.
+import asyncio
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from hashing_engine import HashingEngine
+
+ITEMS = [b"frame-%d" % i for i in range(5000)]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(config, "HASHING_EXECUTOR", "thread")
+    monkeypatch.setattr(config, "HASHING_WORKERS", 4)
+    monkeypatch.setattr(config, "HASHING_JOB_MAX_ITEMS", 10)
+    monkeypatch.setattr(config, "HASHING_MAX_INFLIGHT_JOBS", 3)
+    engine = HashingEngine(config.PEPPER_ROUNDS)
+    yield engine
+    engine.close()
+
+
+def test_fingerprints_resolve_in_order(engine):
+    digests = asyncio.run(engine.fingerprint_many(ITEMS))
+    assert digests == [hashlib.sha256(item).digest() for item in ITEMS]
+    assert engine.get_stats()["jobs"] == 500
+    assert engine.inflight_jobs == 0
+
+
+def test_job_tasks_are_bounded(engine):
+    async def run():
+        gathered = asyncio.ensure_future(engine.fingerprint_many(ITEMS))
+        peak_tasks = peak_jobs = 0
+        while not gathered.done():
+            await asyncio.sleep(0)
+            peak_jobs = max(peak_jobs, engine.inflight_jobs)
+            peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+        return await gathered, peak_jobs, peak_tasks
+
+    digests, peak_jobs, peak_tasks = asyncio.run(run())
+    assert len(digests) == len(ITEMS)
+    assert peak_jobs <= 3
+    # run() and the gather plus at most three jobs
+    assert peak_tasks <= 5
+
+
+def test_batches_and_fingerprints_share_jobs(engine):
+    async def run():
+        return await asyncio.gather(engine.hash_batch([b"a", b"b"]), engine.fingerprint(b"c"))
+
+    digest, fingerprint = asyncio.run(run())
+    assert len(digest) == engine.backend.output_bytes
+    assert fingerprint == hashlib.sha256(b"c").digest()
+    assert engine.get_stats()["jobs"] == 1
@@ -0,0 +1,78 @@
+# tests/test_record_format.py
+# RecordEncoder output formats and the packed record round trip.
+import hashlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from record_format import (DIGEST_SIZE, FORMAT_HEX, FORMAT_PACKED, FORMAT_RAW, PACK_HEADER, PACK_VERSION,
+                           RecordEncoder, decode_packed)
+
+DIGESTS = [hashlib.sha512(b"batch-%d" % i).digest() for i in range(10)]
+SOURCES = [1 << (i % 4) for i in range(10)]
+
+
+def packed_encoder(per_record):
+    return RecordEncoder(FORMAT_PACKED, PACK_HEADER.size + per_record * DIGEST_SIZE)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        RecordEncoder("base64")
+
+
+def test_hex_round_trip():
+    records, sources = RecordEncoder(FORMAT_HEX).encode(DIGESTS, SOURCES)
+    assert [bytes.fromhex(record.decode('ascii')) for record in records] == DIGESTS
+    assert sources == SOURCES
+
+
+def test_raw_passes_digests_through():
+    encoder = RecordEncoder(FORMAT_RAW)
+    records, sources = encoder.encode(DIGESTS, SOURCES)
+    assert records == DIGESTS and sources == SOURCES
+    assert encoder.get_stats()["bytes"] == 10 * DIGEST_SIZE
+
+
+def test_packed_round_trip():
+    encoder = packed_encoder(4)
+    before = time.time_ns()
+    records, masks = encoder.encode(DIGESTS, SOURCES)
+    assert len(records) == 2 and encoder.pending == 2
+    tail, tail_masks = encoder.flush()
+    assert encoder.pending == 0 and encoder.flush() == ([], [])
+
+    decoded = [decode_packed(record) for record in records + tail]
+    assert [digest for _, _, digests in decoded for digest in digests] == DIGESTS
+    assert [mask for _, mask, _ in decoded] == masks + tail_masks == [0b1111, 0b1111, 0b11]
+    assert all(before <= timestamp_ns <= time.time_ns() for timestamp_ns, _, _ in decoded)
+    assert all(len(record) == PACK_HEADER.size + 4 * DIGEST_SIZE for record in records)
+
+
+def test_packed_holds_digests_across_calls():
+    encoder = packed_encoder(3)
+    assert encoder.encode(DIGESTS[:2], SOURCES[:2]) == ([], [])
+    records, masks = encoder.encode(DIGESTS[2:4], SOURCES[2:4])
+    assert len(records) == 1 and masks == [0b111]
+    assert decode_packed(records[0])[2] == DIGESTS[:3]
+
+
+def test_digests_per_record_is_clamped():
+    assert RecordEncoder(FORMAT_PACKED, 10).digests_per_record == 1
+    assert RecordEncoder(FORMAT_PACKED, 10 ** 9).digests_per_record == 0xFFFF
+
+
+def test_decode_rejects_other_versions():
+    record = PACK_HEADER.pack(PACK_VERSION + 1, 0, 1, 0, 0) + DIGESTS[0]
+    with pytest.raises(ValueError):
+        decode_packed(record)
+
+
+def test_decode_rejects_truncated_records():
+    record = PACK_HEADER.pack(PACK_VERSION, 0, 2, 0, 0) + DIGESTS[0]
+    with pytest.raises(ValueError):
+        decode_packed(record)
@@ -0,0 +1,143 @@
+# tests/test_scheduler.py
+# FairScheduler: deficit round-robin shares, rate caps and overload shedding.
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from frame_queue import FrameQueue
+from scheduler import DRR, FIFO, FairScheduler
+
+FRAME = b"x" * 1000
+
+
+@pytest.fixture(autouse=True)
+def scheduler_config(monkeypatch):
+    monkeypatch.setattr(config, "SCHEDULER_WEIGHTS", {"heavy": 3})
+    monkeypatch.setattr(config, "SCHEDULER_RATE_LIMITS", {})
+    monkeypatch.setattr(config, "SCHEDULER_QUANTUM_BYTES", 10_000)
+    monkeypatch.setattr(config, "SCHEDULER_OVERLOAD_BYTES", None)
+    monkeypatch.setattr(config, "MESSAGE_PROCESSING_BATCH", 1000)
+
+
+def make_scheduler(urls, policy=DRR, overload_bytes=None):
+    queues = {url: FrameQueue(10 ** 9) for url in urls}
+    scheduler = FairScheduler(queues, policy)
+    scheduler.overload_bytes = overload_bytes
+    for url in urls:
+        scheduler.add(url)
+    return scheduler
+
+
+def fill(scheduler, url, count, frame=FRAME):
+    async def put():
+        for _ in range(count):
+            await scheduler.queues[url].put(frame)
+            scheduler.notify(url)
+    asyncio.run(put())
+
+
+def serve(scheduler, visits):
+    async def take():
+        served = []
+        for _ in range(visits):
+            url, frames = await scheduler.next()
+            served.append((url, sum(len(frame) for frame in frames)))
+            scheduler.done(url)
+        return served
+    return asyncio.run(take())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FairScheduler({}, "lifo")
+
+
+def test_drr_shares_bytes_by_weight():
+    scheduler = make_scheduler(["wss://heavy", "wss://light"])
+    fill(scheduler, "wss://heavy", 500)
+    fill(scheduler, "wss://light", 500)
+    served = {"wss://heavy": 0, "wss://light": 0}
+    for url, nbytes in serve(scheduler, 20):
+        served[url] += nbytes
+    assert served["wss://heavy"] == 3 * served["wss://light"]
+
+
+def test_quiet_feed_is_not_stuck_behind_a_firehose():
+    scheduler = make_scheduler(["wss://firehose", "wss://quiet"])
+    fill(scheduler, "wss://firehose", 900)
+    fill(scheduler, "wss://quiet", 1)
+    assert [url for url, _ in serve(scheduler, 2)] == ["wss://firehose", "wss://quiet"]
+
+
+def test_large_head_frame_waits_for_deficit():
+    scheduler = make_scheduler(["wss://big"])
+    fill(scheduler, "wss://big", 1, b"x" * 25_000)
+    assert serve(scheduler, 1) == [("wss://big", 25_000)]
+    assert scheduler.sources["wss://big"].deficit == 0
+
+
+def test_fifo_drains_up_to_the_frame_cap():
+    scheduler = make_scheduler(["wss://a"], policy=FIFO)
+    scheduler.max_frames = 7
+    fill(scheduler, "wss://a", 20)
+    assert serve(scheduler, 2) == [("wss://a", 7000), ("wss://a", 7000)]
+
+
+def test_rate_limit_sheds_on_admission(monkeypatch):
+    monkeypatch.setattr(config, "SCHEDULER_RATE_LIMITS", {"capped": 5})
+    scheduler = make_scheduler(["wss://capped", "wss://free"])
+    assert sum(scheduler.admit("wss://capped", 10) for _ in range(20)) == 5
+    assert all(scheduler.admit("wss://free", 10) for _ in range(20))
+    assert scheduler.sources["wss://capped"].shed_rate == 15
+
+
+def test_overload_sheds_the_heaviest_backlog_per_weight():
+    scheduler = make_scheduler(["wss://heavy", "wss://a", "wss://b"])
+    fill(scheduler, "wss://heavy", 300)
+    fill(scheduler, "wss://a", 200)
+    fill(scheduler, "wss://b", 20)
+    scheduler._shed(50_000)
+    queues, sources = scheduler.queues, scheduler.sources
+    # Per unit of weight, heavy (100k) and b (20k) sit below a (200k)
+    assert sources["wss://heavy"].shed_overload == 0
+    assert sources["wss://b"].shed_overload == 0
+    assert sources["wss://a"].shed_overload_bytes == 50_000
+    assert queues["wss://a"].bytes == 150_000
+    assert scheduler.overload_count == 1
+
+
+def test_overload_levels_several_sources_in_one_pass():
+    scheduler = make_scheduler(["wss://heavy", "wss://a", "wss://b"])
+    fill(scheduler, "wss://heavy", 300)
+    fill(scheduler, "wss://a", 200)
+    fill(scheduler, "wss://b", 20)
+    scheduler._shed(200_000)
+    queues = scheduler.queues
+    # 520k queued, 200k shed leaves heavy and a at the same backlog per unit of weight
+    assert queues["wss://b"].bytes == 20_000
+    assert queues["wss://heavy"].bytes // 3 == pytest.approx(queues["wss://a"].bytes, abs=1000)
+    freed = sum(state.shed_overload_bytes for state in scheduler.sources.values())
+    assert 200_000 <= freed < 202_000
+
+
+def test_overload_larger_than_the_backlog_empties_every_queue():
+    scheduler = make_scheduler(["wss://a", "wss://b"])
+    fill(scheduler, "wss://a", 10)
+    fill(scheduler, "wss://b", 5)
+    scheduler._shed(10 ** 6)
+    assert all(queue.bytes == 0 for queue in scheduler.queues.values())
+
+
+def test_notify_sheds_down_to_ninety_percent():
+    scheduler = make_scheduler(["wss://a", "wss://b"], overload_bytes=100_000)
+    fill(scheduler, "wss://a", 80)
+    fill(scheduler, "wss://b", 21)
+    total = sum(queue.bytes for queue in scheduler.queues.values())
+    assert total <= 100_000
+    assert scheduler.overload_count == 1
+    assert scheduler.sources["wss://a"].shed_overload > 0
@@ -0,0 +1,85 @@
+# tests/test_segment_log.py
+# SegmentWriter and read_segment: round trips, rotation and torn tails.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segment_log import SegmentWriter, list_segments, read_segment
+
+PAYLOADS = [b"record-%d" % i * (i + 1) for i in range(50)]
+
+
+def write_all(directory, payloads, max_bytes=10 ** 6):
+    writer = SegmentWriter(str(directory), "spool-", max_bytes)
+    for payload in payloads:
+        writer.append(payload)
+    writer.close()
+    return writer
+
+
+def read_all(directory):
+    return [payload for path in list_segments(str(directory), "spool-") for payload in read_segment(path)]
+
+
+def test_round_trip(tmp_path):
+    writer = write_all(tmp_path, PAYLOADS + [b""])
+    assert read_all(tmp_path) == PAYLOADS + [b""]
+    assert writer.get_stats()["records"] == 51
+
+
+def test_rotates_by_size(tmp_path):
+    writer = write_all(tmp_path, PAYLOADS, max_bytes=500)
+    segments = list_segments(str(tmp_path), "spool-")
+    assert len(segments) == writer.segment_count > 1
+    assert read_all(tmp_path) == PAYLOADS
+    # A segment closes at the first record that takes it to max_bytes
+    assert all(os.path.getsize(path) < 500 + 8 + len(PAYLOADS[-1]) for path in segments)
+
+
+def test_append_returns_the_segment_written(tmp_path):
+    writer = SegmentWriter(str(tmp_path), "spool-", 10 ** 6)
+    path = writer.append(b"one")
+    assert path == writer.current_path
+    assert writer.rotate() == path
+    assert writer.append(b"two") != path
+    writer.close()
+    assert [list(read_segment(p)) for p in list_segments(str(tmp_path), "spool-")] == [[b"one"], [b"two"]]
+
+
+def test_new_writer_continues_the_sequence(tmp_path):
+    write_all(tmp_path, [b"first"])
+    write_all(tmp_path, [b"second"])
+    assert read_all(tmp_path) == [b"first", b"second"]
+
+
+def test_other_prefixes_are_ignored(tmp_path):
+    write_all(tmp_path, [b"mine"])
+    other = SegmentWriter(str(tmp_path), "other-", 10 ** 6)
+    other.append(b"theirs")
+    other.close()
+    assert read_all(tmp_path) == [b"mine"]
+    assert list_segments(str(tmp_path / "missing"), "spool-") == []
+
+
+def test_torn_tail_ends_the_segment(tmp_path):
+    write_all(tmp_path, [b"whole", b"torn record"])
+    path, = list_segments(str(tmp_path), "spool-")
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    assert list(read_segment(path)) == [b"whole"]
+
+
+def test_corrupt_record_ends_the_segment(tmp_path):
+    write_all(tmp_path, [b"whole", b"flipped", b"after"])
+    path, = list_segments(str(tmp_path), "spool-")
+    data = bytearray(open(path, 'rb').read())
+    data[data.index(b"flipped")] ^= 0xFF
+    open(path, 'wb').write(bytes(data))
+    assert list(read_segment(path)) == [b"whole"]
+
+
+def test_bad_magic_is_skipped(tmp_path):
+    path = tmp_path / "spool-000000000000.seg"
+    path.write_bytes(b"NOTASEG!" + b"\x00" * 16)
+    assert list(read_segment(str(path))) == []
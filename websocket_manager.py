@@ -1,34 +1,80 @@
 # websocket_manager.py
 import asyncio
 import logging
-import base64
-from typing import Dict, Optional, Callable
+import inspect
+import socket
+import time
+from typing import Dict, List, Optional, Callable
 import websockets
-from websockets.exceptions import WebSocketException
+from websockets.exceptions import ConnectionClosedOK, WebSocketException
+from endpoints import Endpoint, endpoint_registry
+from frame_queue import FrameQueue
+from frame_filters import FrameFilters
+from scheduler import FairScheduler
+from connection_scheduler import ConnectionScheduler
+from metrics import STAGE_SECONDS, registry
 import config
 
 logger = logging.getLogger(__name__)
 
+FRAMES_RECEIVED = registry.counter("entropygen_frames_received_total", "Frames read from the socket", ("endpoint",))
+BYTES_RECEIVED = registry.counter("entropygen_bytes_received_total", "Frame payload bytes read from the socket", ("endpoint",))
+
+def _is_open(conn) -> bool:
+    if conn is None:
+        return False
+    # Legacy protocol objects expose .closed, the asyncio client in websockets>=13 only .state
+    closed = getattr(conn, 'closed', None)
+    if closed is not None:
+        return not closed
+    return conn.state.name == 'OPEN'
+
+def _set_recv_buffer(conn, nbytes: int):
+    sock = conn.transport.get_extra_info('socket') if getattr(conn, 'transport', None) else None
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, nbytes)
+
 class WebSocketManager:
-    def __init__(self, message_callback: Callable):
-        self.endpoints = config.WEBSOCKET_ENDPOINTS
+    def __init__(self, message_callback: Callable, endpoints: Optional[List[str]] = None):
+        self.registry = endpoint_registry()
+        self.endpoints = list(config.WEBSOCKET_ENDPOINTS if endpoints is None else endpoints)
         self.connections: Dict[str, Optional[websockets.WebSocketClientProtocol]] = {}
         self.tasks: Dict[str, Optional[asyncio.Task]] = {}
         self.message_callback = message_callback
         self.running = False
-        self.message_queues: Dict[str, asyncio.Queue] = {}
+        self.message_queues: Dict[str, FrameQueue] = {}
+        self.consumer_tasks: List[asyncio.Task] = []
+        self.scheduler = FairScheduler(self.message_queues)
+        self.connection_scheduler = ConnectionScheduler()
+        self.health_task: Optional[asyncio.Task] = None
+        self.busy_consumers = 0
+        self.consumed_batches = 0
+        self.consumed_frames = 0
+        self.capture = None
+        self.frame_filters = FrameFilters()
+        self.queue_max_bytes = config.MESSAGE_QUEUE_MAX_BYTES
+        self.paused: Dict[str, str] = {}
 
     async def start(self):
         self.running = True
+        if config.CAPTURE_DIRECTORY:
+            from frame_capture import FrameCapture
+            # Ids index the full endpoint list so captures from different workers agree
+            self.capture = FrameCapture(self.registry.urls)
+            self.capture.start()
         for endpoint_config in self.endpoints:
-            url, *_ = endpoint_config.split(';===;', 1)
-            self.message_queues[url] = asyncio.Queue(maxsize=config.MESSAGE_QUEUE_MAX_SIZE)
-            self.tasks[url] = asyncio.create_task(self._maintain_connection(endpoint_config))
-        logger.info("Started socket connections", extra={"count": len(self.endpoints)})
+            self._start_endpoint(endpoint_config)
+        for _ in range(config.MESSAGE_CONSUMER_TASKS):
+            self.consumer_tasks.append(asyncio.create_task(self._consume()))
+        self.health_task = asyncio.create_task(self._health_loop())
+        logger.info("Started socket connections", extra={
+            "count": len(self.endpoints),
+            "consumers": len(self.consumer_tasks),
+        })
 
     async def stop(self):
         self.running = False
-        for endpoint, task in self.tasks.items():
+        for task in list(self.tasks.values()) + self.consumer_tasks + [self.health_task]:
             if task and not task.done():
                 task.cancel()
                 try:
@@ -37,46 +83,132 @@ class WebSocketManager:
                     pass
         
         for endpoint, conn in self.connections.items():
-            if conn and not conn.closed:
+            if _is_open(conn):
                 await conn.close()
         
         for queue in self.message_queues.values():
-            while not queue.empty():
-                try:
-                    queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    break
+            queue.clear()
+        
+        if self.capture:
+            await asyncio.get_running_loop().run_in_executor(None, self.capture.close)
         
         logger.info("Stopped all socket connections")
 
-    async def _maintain_connection(self, endpoint_config: str):
+    def _start_endpoint(self, endpoint_config: str):
+        endpoint = self.registry.get(endpoint_config)
+        self.message_queues[endpoint.url] = FrameQueue(self.queue_max_bytes, config.MESSAGE_QUEUE_DROP_POLICY)
+        self.scheduler.add(endpoint.url)
+        self.tasks[endpoint.url] = asyncio.create_task(self._maintain_connection(endpoint))
+
+    async def _stop_endpoint(self, url: str):
+        task = self.tasks.pop(url, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        conn = self.connections.pop(url, None)
+        if _is_open(conn):
+            await conn.close()
+        queue = self.message_queues.pop(url, None)
+        if queue:
+            queue.clear()
+        self.scheduler.remove(url)
+        self.connection_scheduler.remove(url)
+
+    async def assign(self, endpoints: List[str]):
+        # Converges on the given endpoint list, leaving endpoints that stay untouched
+        wanted = {endpoint.url: endpoint.config for endpoint in self.registry.resolve(endpoints)}
+        current = {endpoint.url for endpoint in self.registry.resolve(self.endpoints)}
+        for url in current - wanted.keys():
+            self.paused.pop(url, None)
+            await self._stop_endpoint(url)
+        self.endpoints = list(endpoints)
+        if self.running:
+            for url in wanted.keys() - current:
+                self._start_endpoint(wanted[url])
+        logger.info("Endpoints assigned", extra={
+            "count": len(self.endpoints),
+            "added": len(wanted.keys() - current),
+            "removed": len(current - wanted.keys()),
+        })
+
+    def set_queue_max_bytes(self, max_bytes: int):
+        # Applies to live queues too; drop_oldest trims on the next put, block waits for drains
+        self.queue_max_bytes = max_bytes
+        for queue in self.message_queues.values():
+            queue.max_bytes = max_bytes
+        logger.info("Queue bound changed", extra={"max_bytes": max_bytes})
+
+    async def pause_endpoints(self, urls: List[str]) -> List[str]:
+        # Disconnects the endpoints but keeps them assigned, so resume_endpoints can reconnect them
+        paused = []
+        for endpoint_config in self.endpoints:
+            url = self.registry.get(endpoint_config).url
+            if url in urls and url not in self.paused:
+                self.paused[url] = endpoint_config
+                await self._stop_endpoint(url)
+                paused.append(url)
+        if paused:
+            logger.warning("Endpoints paused", extra={"endpoints": paused})
+        return paused
+
+    async def resume_endpoints(self):
+        paused, self.paused = self.paused, {}
+        if self.running:
+            for endpoint_config in paused.values():
+                self._start_endpoint(endpoint_config)
+        if paused:
+            logger.info("Endpoints resumed", extra={"endpoints": list(paused)})
+
+    async def _consume(self):
+        # One consumer owns an endpoint's queue at a time, so per-endpoint order holds
+        while True:
+            url, frames = await self.scheduler.next()
+            self.busy_consumers += 1
+            try:
+                if frames:
+                    await self.message_callback(url, frames)
+                    self.consumed_batches += 1
+                    self.consumed_frames += len(frames)
+            except Exception as e:
+                logger.error("Err processing messages", extra={"endpoint": url, "error": str(e)}, exc_info=True)
+            finally:
+                self.busy_consumers -= 1
+                self.scheduler.done(url)
+
+    async def _maintain_connection(self, endpoint: Endpoint):
         attempt = 0
         
-        url, *init_msg_parts = endpoint_config.split(';===;', 1)
-        init_msg = None
-        if init_msg_parts:
-            try:
-                init_msg = base64.b64decode(init_msg_parts[0]).decode('utf-8')
-            except (base64.binascii.Error, UnicodeDecodeError) as e:
-                logger.error("Failed to decode init message", extra={"url": url, "error": str(e)})
+        url, init_msg = endpoint.url, endpoint.init_message
+        connect_options = {key: value for key, value in endpoint.options.items() if key != "recv_buffer_bytes"}
+        recv_buffer_bytes = endpoint.options.get("recv_buffer_bytes")
+
+        queue = self.message_queues[url]
+        frames_received = FRAMES_RECEIVED.labels(url)
+        bytes_received = BYTES_RECEIVED.labels(url)
+        receive_seconds = STAGE_SECONDS.labels("receive")
+        filter_frame = self.frame_filters.for_endpoint(url)
+
+        health = self.connection_scheduler.register(url)
 
         while self.running:
+            error = False
             try:
+                await self.connection_scheduler.wait_turn(health)
+                target = self.connection_scheduler.target(health)
                 attempt += 1
-                logger.info("Connecting to endpoint", extra={"url": url, "attempt": attempt})
+                logger.info("Connecting to endpoint", extra={"url": url, "target": target, "attempt": attempt})
                 
-                async with websockets.connect(
-                    url,
-                    ping_interval=20,
-                    ping_timeout=10,
-                    close_timeout=10,
-                    max_size=10 * 1024 * 1024,
-                    max_queue=32
-                ) as websocket:
+                async with websockets.connect(target, **connect_options) as websocket:
+                    if recv_buffer_bytes:
+                        _set_recv_buffer(websocket, recv_buffer_bytes)
                     self.connections[url] = websocket
+                    self.connection_scheduler.on_connect(health, target)
                     attempt = 0
                     
-                    if url in config.BLITZORTUNG_ENDPOINTS:
+                    if target in config.BLITZORTUNG_ENDPOINTS:
                         await websocket.send(config.BLITZORTUNG_INIT_MESSAGE)
                         logger.info("Sent Blitzortung init message", extra={"url": url})
 
@@ -84,54 +216,106 @@ class WebSocketManager:
                         await websocket.send(init_msg)
                         logger.info("Sent init message", extra={"url": url})
 
-                    logger.info("Connected to endpoint", extra={"url": url})
+                    logger.info("Connected to endpoint", extra={"url": url, "target": target})
                     
-                    async for message in websocket:
+                    async for frame in self._frames(websocket):
                         if not self.running:
                             break
                         
-                        try:
-                            if self.message_queues[url].full():
-                                logger.warning("MQ full, dropping message", extra={"endpoint": url})
-                                try:
-                                    self.message_queues[url].get_nowait()
-                                except asyncio.QueueEmpty:
-                                    pass
-                            
-                            await asyncio.wait_for(
-                                self.message_callback(url, message),
-                                timeout=5.0
-                            )
-                        except asyncio.TimeoutError:
-                            logger.error("Message processing timeout", extra={"endpoint": url})
-                        except Exception as e:
-                            logger.error("Err processing message", extra={"endpoint": url, "error": str(e)}, exc_info=True)
+                        received = time.perf_counter()
+                        health.on_frame(received)
+                        frames_received.inc()
+                        bytes_received.inc(len(frame))
+                        if self.capture:
+                            self.capture.record(url, frame)
+                        # Captures keep the raw frame so replay can re-tune the rules
+                        if filter_frame:
+                            frame = filter_frame(frame)
+                            if frame is None:
+                                receive_seconds.observe(time.perf_counter() - received)
+                                continue
+                        if not self.scheduler.admit(url, len(frame)):
+                            receive_seconds.observe(time.perf_counter() - received)
+                            continue
+                        dropped = await queue.put(frame)
+                        if dropped:
+                            logger.warning("MQ full, dropping message", extra={"endpoint": url, "dropped": dropped})
+                        self.scheduler.notify(url)
+                        receive_seconds.observe(time.perf_counter() - received)
                             
             except asyncio.CancelledError:
                 logger.info("Connection task cancelled", extra={"url": url})
                 break
-            except WebSocketException as e:
+            except (WebSocketException, OSError) as e:
                 logger.error("WebSocket error", extra={"url": url, "error": str(e)})
-                self.connections[url] = None
+                error = True
             except Exception as e:
                 logger.error("Unexpected error", extra={"url": url, "error": str(e)}, exc_info=True)
-                self.connections[url] = None
+                error = True
+            self.connections[url] = None
+            self.connection_scheduler.on_disconnect(health, error)
             
             if self.running:
                 if config.MAX_RECONNECT_ATTEMPTS and attempt >= config.MAX_RECONNECT_ATTEMPTS:
                     logger.error("Max reconnection attempts reached", extra={"url": url})
                     break
-                logger.info("Reconnecting", extra={"url": url, "delay": config.RECONNECT_DELAY_SECONDS})
-                await asyncio.sleep(config.RECONNECT_DELAY_SECONDS)
+                delay = self.connection_scheduler.backoff(health)
+                logger.info("Reconnecting", extra={"url": url, "delay": round(delay, 2), "failures": health.failures})
+                await asyncio.sleep(delay)
+
+    async def _health_loop(self):
+        # Connections that stay open but go quiet are closed, which counts against their health
+        while self.running:
+            try:
+                await asyncio.sleep(config.ENDPOINT_HEALTH_CHECK_SECONDS)
+                for url in self.connection_scheduler.silent():
+                    conn = self.connections.get(url)
+                    if _is_open(conn):
+                        logger.warning("Endpoint silent, reconnecting", extra={"url": url})
+                        await conn.close()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Err checking endpoint health", extra={"error": str(e)}, exc_info=True)
+
+    async def _frames(self, websocket):
+        # Newer websockets clients can skip UTF-8 decoding and hand text frames over as bytes
+        if config.WEBSOCKET_RAW_FRAMES and 'decode' in inspect.signature(websocket.recv).parameters:
+            while True:
+                try:
+                    yield await websocket.recv(decode=False)
+                except ConnectionClosedOK:
+                    return
+        else:
+            async for message in websocket:
+                yield message if isinstance(message, bytes) else message.encode('utf-8')
 
     def get_connection_status(self) -> Dict[str, bool]:
         return {
-            endpoint: conn is not None and not conn.closed
+            endpoint: _is_open(conn)
             for endpoint, conn in self.connections.items()
         }
 
     def get_queue_sizes(self) -> Dict[str, int]:
         return {
-            endpoint: queue.qsize()
+            endpoint: len(queue)
             for endpoint, queue in self.message_queues.items()
         }
+
+    def get_pipeline_stats(self) -> dict:
+        stats = {
+            "queues": {endpoint: queue.get_stats() for endpoint, queue in self.message_queues.items()},
+            "queued_bytes": sum(queue.bytes for queue in self.message_queues.values()),
+            "queue_max_bytes": self.queue_max_bytes,
+            "paused_endpoints": len(self.paused),
+            "ready_endpoints": self.scheduler.active_count,
+            "consumers": len(self.consumer_tasks),
+            "busy_consumers": self.busy_consumers,
+            "consumed_batches": self.consumed_batches,
+            "consumed_frames": self.consumed_frames,
+        }
+        stats.update(self.frame_filters.get_stats())
+        stats["endpoints"] = self.connection_scheduler.get_stats()
+        if self.capture:
+            stats.update(self.capture.get_stats())
+        return stats